@@ -10,6 +10,8 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import pandas as pd
 import requests
 import io
+import json
+import hashlib
 import tempfile
 import mimetypes
 from pathlib import Path
@@ -27,6 +29,9 @@ except Exception:
     Image = None
     PIL_AVAILABLE = False
 
+# Tries per single-image upload on timeout/connection errors (safe thanks to the Idempotency-Key)
+UPLOAD_ATTEMPTS = 2
+
 
 class BulkImageUploader:
     def __init__(self, root):
@@ -59,6 +64,11 @@ class BulkImageUploader:
         self.client_id_valid = False
         self.file_field_name = tk.StringVar(value="image")
         self.max_workers = tk.IntVar(value=5)
+        # Rows sent per request to /api/upload/batch/ (1 = one request per row)
+        self.batch_size = tk.IntVar(value=20)
+        self.batch_supported = True
+        # Upload limits and compression targets from the server's /api/config/
+        self.server_config = {}
         self.is_uploading = False
         self.is_paused = False
         self.success_count = 0
@@ -191,6 +201,18 @@ class BulkImageUploader:
         )
         workers_spinbox.pack(side=tk.LEFT)
         
+        ttk.Label(client_id_row, text="Batch:", font=("Segoe UI", 9)).pack(side=tk.LEFT, padx=(15, 5))
+        batch_spinbox = ttk.Spinbox(
+            client_id_row,
+            from_=1,
+            to=100,
+            textvariable=self.batch_size,
+            width=5,
+            state='readonly',
+            font=("Segoe UI", 9)
+        )
+        batch_spinbox.pack(side=tk.LEFT)
+        
         config_frame.columnconfigure(0, weight=1)
         
         # File Selection Section
@@ -608,7 +630,11 @@ class BulkImageUploader:
             output_df['image_path'] = ''
             
             total_rows = len(df)
+            self.server_config = self.fetch_server_config()
+            upload_config = self.server_config.get('upload', {})
             workers = self.max_workers.get()
+            if upload_config.get('preferred_concurrency'):
+                workers = max(1, min(workers, upload_config['preferred_concurrency']))
             self.log_message(f"Starting concurrent upload: {total_rows} rows, {workers} threads", "INFO")
             self.log_message("=" * 80, "DEBUG")
             
@@ -636,18 +662,25 @@ class BulkImageUploader:
                     'row_num': index + 2  # +2 because Excel row 1 is header
                 })
             
+            # Group rows so each request to the batch endpoint carries several images
+            batch_size = max(1, self.batch_size.get())
+            if upload_config.get('batch_max_files'):
+                batch_size = min(batch_size, upload_config['batch_max_files'])
+            batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+            self.batch_supported = True
+            
             # Process with ThreadPoolExecutor
             completed_count = 0
             self.executor = ThreadPoolExecutor(max_workers=workers)
             
-            # Submit all tasks
-            future_to_task = {
-                self.executor.submit(self.upload_task, task): task 
-                for task in tasks
+            # Submit all batches
+            future_to_batch = {
+                self.executor.submit(self.upload_batch_task, batch): batch
+                for batch in batches
             }
             
             # Process results as they complete
-            for future in as_completed(future_to_task):
+            for future in as_completed(future_to_batch):
                 if not self.is_uploading:
                     break
                 
@@ -655,20 +688,20 @@ class BulkImageUploader:
                 while self.is_paused and self.is_uploading:
                     time.sleep(0.1)
                 
-                task = future_to_task[future]
+                batch = future_to_batch[future]
                 try:
-                    result = future.result()
-                    index = task['index']
-                    
-                    # Update output DataFrame (only serial_number and image_path columns)
-                    if result['success']:
-                        output_df.at[index, 'image_path'] = result['url']
-                        self.success_count += 1
-                    else:
-                        output_df.at[index, 'image_path'] = 'FAILED'
-                        self.fail_count += 1
-                    
-                    completed_count += 1
+                    for task, result in zip(batch, future.result()):
+                        index = task['index']
+                        
+                        # Update output DataFrame (only serial_number and image_path columns)
+                        if result['success']:
+                            output_df.at[index, 'image_path'] = result['url']
+                            self.success_count += 1
+                        else:
+                            output_df.at[index, 'image_path'] = 'FAILED'
+                            self.fail_count += 1
+                        
+                        completed_count += 1
                     
                     # Update UI
                     self.root.after(0, self.update_progress, completed_count, total_rows)
@@ -705,6 +738,126 @@ class BulkImageUploader:
         finally:
             self.reset_upload_state()
     
+    def upload_batch_task(self, tasks):
+        """Upload a group of rows with one request to the batch endpoint (runs in thread pool)
+        
+        Falls back to one request per row for single-row batches or when the
+        server has no batch endpoint. Returns one result dict per task, in order.
+        """
+        if len(tasks) == 1 or not self.batch_supported:
+            return [self.upload_task(task) for task in tasks]
+        
+        results = [None] * len(tasks)
+        ready = []
+        for position, task in enumerate(tasks):
+            if os.path.exists(task['image_path']):
+                ready.append(position)
+            else:
+                self.log_message(f"Row {task['row_num']}: ✗ File not found - {task['image_path']}", "ERROR")
+                results[position] = {'success': False, 'error': 'file not found'}
+        
+        compressed_paths = {}
+        open_files = []
+        try:
+            files = []
+            metadata = []
+            for position in ready:
+                task = tasks[position]
+                image_path = task['image_path']
+                try:
+                    compressed_path = self.compress_image(image_path, **self.compression_kwargs())
+                except Exception as e:
+                    compressed_path = image_path
+                    self.log_message(f"Compression skipped due to error: {e}", "WARNING")
+                compressed_paths[position] = compressed_path
+                
+                image_file = open(compressed_path, 'rb')
+                open_files.append(image_file)
+                mimetype = mimetypes.guess_type(compressed_path)[0] or 'application/octet-stream'
+                files.append(('images', (os.path.basename(compressed_path), image_file, mimetype)))
+                metadata.append({'name': task['name'], 'description': task['description']})
+            
+            if not files:
+                return results
+            
+            headers = {'X-Client-Id': self.client_id.get().strip()}
+            api_key = self.api_key.get().strip()
+            if api_key:
+                headers['X-API-Key'] = api_key
+            # Re-running the same rows replays the server's stored response
+            headers['Idempotency-Key'] = self.idempotency_key([tasks[position] for position in ready])
+            if self.server_config and all(
+                compressed_paths[position] != tasks[position]['image_path'] for position in ready
+            ):
+                # Every file was encoded to the server's targets - don't encode them again
+                headers['X-Client-Encoded'] = 'true'
+            
+            batch_endpoint = self.api_endpoint.get().rstrip('/') + '/batch/'
+            first_row, last_row = tasks[0]['row_num'], tasks[-1]['row_num']
+            self.log_message(f"Rows {first_row}-{last_row}: Uploading {len(files)} images in one request...", "INFO")
+            response = requests.post(
+                batch_endpoint,
+                files=files,
+                data={'client_id': self.client_id.get(), 'metadata': json.dumps(metadata)},
+                headers=headers,
+                timeout=30 + 5 * len(files)
+            )
+            
+            if response.status_code == 404:
+                # Older server without /api/upload/batch/ - switch to per-row uploads
+                self.batch_supported = False
+                self.log_message("Batch endpoint not available, uploading one image per request", "WARNING")
+                for position in ready:
+                    results[position] = self.upload_task(tasks[position])
+                return results
+            
+            try:
+                body = response.json()
+            except Exception:
+                body = None
+            
+            if not isinstance(body, dict) or 'results' not in body:
+                err_text = response.text[:200]
+                if isinstance(body, dict) and 'error' in body:
+                    err_text = body.get('error')
+                for position in ready:
+                    self.log_message(f"Row {tasks[position]['row_num']}: ✗ Upload failed - HTTP {response.status_code}: {err_text}", "ERROR")
+                    results[position] = {'success': False, 'error': f'HTTP {response.status_code}: {err_text}'}
+                return results
+            
+            for item in body['results']:
+                position = ready[item['index']]
+                row_num = tasks[position]['row_num']
+                if item.get('success'):
+                    self.log_message(f"Row {row_num}: ✓ Upload successful - {item['url']}", "SUCCESS")
+                    results[position] = {'success': True, 'url': item['url']}
+                else:
+                    self.log_message(f"Row {row_num}: ✗ Upload failed - {item.get('error', 'unknown')}", "ERROR")
+                    results[position] = {'success': False, 'error': item.get('error', 'unknown')}
+            error = 'No result returned by server'
+        
+        except requests.exceptions.Timeout:
+            error = 'Request timeout'
+        except requests.exceptions.ConnectionError:
+            error = 'Connection error - check API endpoint'
+        except Exception as e:
+            error = str(e)
+        finally:
+            for image_file in open_files:
+                image_file.close()
+            for position, compressed_path in compressed_paths.items():
+                try:
+                    if compressed_path != tasks[position]['image_path'] and os.path.exists(compressed_path):
+                        os.remove(compressed_path)
+                except Exception:
+                    pass
+        
+        for position in ready:
+            if results[position] is None:
+                self.log_message(f"Row {tasks[position]['row_num']}: ✗ Upload failed - {error}", "ERROR")
+                results[position] = {'success': False, 'error': error}
+        return results
+    
     def upload_task(self, task):
         """Process single upload task (runs in thread pool)"""
         try:
@@ -734,12 +887,63 @@ class BulkImageUploader:
             self.log_message(f"Row {row_num}: ✗ Exception - {str(e)}", "ERROR")
             return {'success': False, 'error': str(e)}
     
+    def fetch_server_config(self):
+        """Read upload limits and compression targets from the server's /api/config/
+        
+        Returns the 'config' dict, or {} for an older server without the endpoint
+        (the built-in defaults are used then).
+        """
+        config_url = self.api_endpoint.get().rstrip('/').rsplit('/', 1)[0] + '/config/'
+        headers = {'X-Client-Id': self.client_id.get().strip()}
+        api_key = self.api_key.get().strip()
+        if api_key:
+            headers['X-API-Key'] = api_key
+        try:
+            response = requests.get(config_url, headers=headers, timeout=10)
+            if response.status_code == 200:
+                config = response.json().get('config') or {}
+                compression = config.get('compression', {})
+                self.log_message(
+                    f"Server targets: {compression.get('max_size_mb')}MB, "
+                    f"max dimension {compression.get('max_dimension') or 'none'}", "INFO"
+                )
+                return config
+            self.log_message(f"Server config not available (HTTP {response.status_code}), using defaults", "WARNING")
+        except Exception as e:
+            self.log_message(f"Could not read server config, using defaults: {e}", "WARNING")
+        return {}
+    
+    def compression_kwargs(self):
+        """compress_image() arguments matching the server's targets, so images are encoded only once"""
+        compression = self.server_config.get('compression', {})
+        return {
+            'max_size_mb': compression.get('max_size_mb') or 2,
+            'quality': compression.get('quality') or 85,
+            'min_quality': compression.get('min_quality') or 65,
+            'max_dimension': compression.get('max_dimension'),
+        }
+    
+    def idempotency_key(self, tasks):
+        """Idempotency-Key for uploading `tasks` (rows of the sheet)
+        
+        Derived from the client and each row's file and text, so a retry - or
+        re-running the same sheet - gets the server's stored response back
+        instead of creating duplicate images. A changed file gets a new key.
+        """
+        digest = hashlib.sha256(self.client_id.get().strip().encode('utf-8'))
+        for task in tasks:
+            path = os.path.abspath(task['image_path'])
+            stat = os.stat(path)
+            row = [path, stat.st_size, stat.st_mtime_ns, task['name'], task['description']]
+            digest.update(json.dumps(row, default=str).encode('utf-8'))
+        return digest.hexdigest()
+    
     def upload_image(self, image_path, name, description):
         """Upload image to Django API endpoint"""
         try:
             # Compress image before uploading (preserve dimensions; change encoding/quality)
             try:
-                compressed_path = self.compress_image(image_path, max_size_mb=2, quality=85, min_quality=65)
+                compressed_path = self.compress_image(image_path, **self.compression_kwargs())
             except Exception as e:
                 compressed_path = image_path
                 self.log_message(f"Compression skipped due to error: {e}", "WARNING")
@@ -768,16 +972,34 @@ class BulkImageUploader:
                 except Exception:
                     # Fail silently if api_key isn't available or configured
                     pass
+                # Lets the server refuse an unknown client before the image is sent
+                headers['X-Client-Id'] = self.client_id.get().strip()
+                # Makes the retry below (and re-running the sheet) safe: the server
+                # replays its stored response instead of storing the image again
+                headers['Idempotency-Key'] = self.idempotency_key(
+                    [{'image_path': image_path, 'name': name, 'description': description}]
+                )
+                if self.server_config and compressed_path != image_path:
+                    # Encoded to the server's targets above - don't encode it again
+                    headers['X-Client-Encoded'] = 'true'
 
                 # Avoid logging the header value; print presence instead
                 self.log_message(f"POST {self.api_endpoint.get()} file={os.path.basename(image_path)} (api_key_present={bool(headers.get('X-API-Key'))})", "DEBUG")
-                response = requests.post(
-                    self.api_endpoint.get(),
-                    files=files,
-                    data=data,
-                    headers=headers,
-                    timeout=30
-                )
+                for attempt in range(UPLOAD_ATTEMPTS):
+                    image_file.seek(0)
+                    try:
+                        response = requests.post(
+                            self.api_endpoint.get(),
+                            files=files,
+                            data=data,
+                            headers=headers,
+                            timeout=30
+                        )
+                        break
+                    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                        if attempt == UPLOAD_ATTEMPTS - 1:
+                            raise
+                        self.log_message(f"Retrying {os.path.basename(image_path)} after: {e}", "WARNING")
                 
                 # Check response
                 try:
@@ -814,12 +1036,14 @@ class BulkImageUploader:
             except Exception:
                 pass
 
-    def compress_image(self, image_path, max_size_mb=2, quality=85, min_quality=65):
+    def compress_image(self, image_path, max_size_mb=2, quality=85, min_quality=65, max_dimension=None):
         """Compress an image while preserving dimensions and original extension.
 
         - quality: initial quality for lossy formats (0-100)
         - max_size_mb: target maximum size in MB
         - min_quality: minimum acceptable quality
+        - max_dimension: downscale images whose longest edge is larger (the
+          server's limit), whatever their file size
 
         This implementation attempts to save compressed data in the original image
         format (so the extension stays the same). For PNGs it will try lossless
@@ -846,16 +1070,23 @@ class BulkImageUploader:
         except Exception:
             orig_size = None
 
-        # Skip compression if file is already less than 2MB
-        if orig_size is not None and orig_size < max_bytes:
-            self.log_message(f"Skipping compression: {os.path.basename(image_path)} is only {orig_size / (1024*1024):.2f}MB", "DEBUG")
-            return image_path
-
         try:
             img = Image.open(image_path)
         except Exception as e:
             self.log_message(f"Failed to open image for compression: {e}", "ERROR")
             return image_path
+        # Only the header has been read so far
+        resize = bool(max_dimension) and max(img.size) > max_dimension
+
+        # Skip compression if file is already under the target size
+        if orig_size is not None and orig_size < max_bytes and not resize:
+            img.close()
+            self.log_message(f"Skipping compression: {os.path.basename(image_path)} is only {orig_size / (1024*1024):.2f}MB", "DEBUG")
+            return image_path
+
+        if resize:
+            # Same high-quality downscale the server would otherwise do after a second decode
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
 
         orig_format = (img.format or '').upper()
         # Fallback mapping from extension
@@ -939,8 +1170,8 @@ class BulkImageUploader:
 
         img.close()
 
-        # If compression did not produce a smaller file, keep original
-        if best_bytes is None or (orig_size is not None and best_bytes >= orig_size):
+        # If compression did not produce a smaller file, keep original (unless it was downscaled)
+        if best_bytes is None or (orig_size is not None and best_bytes >= orig_size and not resize):
             self.log_message(f"Compression did not reduce size for {image_path}", "DEBUG")
             return image_path
 
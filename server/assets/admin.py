@@ -1,12 +1,12 @@
 from django.contrib import admin
-from .models import Image, PendingFileDeletion
+from .models import ClientRegistry, DirectUpload, IdempotencyRecord, Image, PendingFileDeletion, UploadSession
 
 
 @admin.register(Image)
 class ImageAdmin(admin.ModelAdmin):
     list_display = ('id', 'filename', 'client_id', 'name', 'size', 'uploaded_at')
     list_filter = ('client_id', 'uploaded_at')
-    search_fields = ('filename', 'original_filename', 'name', 'client_id', 'description')
+    search_fields = ('filename', 'original_filename', 'name', 'client_id', 'description', 'content_hash')
     readonly_fields = ('uploaded_at',)
 
 
@@ -23,3 +23,34 @@ class PendingFileDeletionAdmin(admin.ModelAdmin):
             return obj.last_error[:100] + ('...' if len(obj.last_error) > 100 else '')
         return '-'
     last_error_short.short_description = 'Last Error'
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'original_filename', 'client_id', 'offset', 'size', 'status', 'updated_at')
+    list_filter = ('status', 'updated_at')
+    search_fields = ('id', 'original_filename', 'client_id', 'storage_key')
+    readonly_fields = ('created_at', 'updated_at')
+
+
+@admin.register(DirectUpload)
+class DirectUploadAdmin(admin.ModelAdmin):
+    list_display = ('id', 'key', 'original_filename', 'client_id', 'status', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('key', 'original_filename', 'client_id')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(IdempotencyRecord)
+class IdempotencyRecordAdmin(admin.ModelAdmin):
+    list_display = ('id', 'key', 'scope', 'status_code', 'created_at')
+    list_filter = ('status_code', 'created_at')
+    search_fields = ('key', 'scope')
+    readonly_fields = ('created_at',)
+
+
+@admin.register(ClientRegistry)
+class ClientRegistryAdmin(admin.ModelAdmin):
+    list_display = ('client_id', 'synced_at')
+    search_fields = ('client_id',)
+    readonly_fields = ('synced_at',)
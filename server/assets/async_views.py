@@ -0,0 +1,78 @@
+"""
+Async (ASGI) versions of the hot endpoints: upload, list and stats.
+
+Served instead of their counterparts in views.py when IMAGE_ASYNC_VIEWS is
+enabled (run under an ASGI server such as uvicorn). List and stats query the
+database through the async ORM, so they hold no thread while waiting on it.
+
+upload_image gains nothing from the async path. Django's ASGI handler reads
+the whole request body into a spooled temp file before any view runs, so
+reject_early() can only answer after the upload has arrived. Client
+validation, multipart parsing, storage writes and the insert are blocking
+and run on a thread via sync_to_async, just as in the sync view. It is
+async only so all hot endpoints switch together.
+
+Responses are identical to the sync views.
+"""
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Sum
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from .models import Image
+from .utils.idempotency import idempotent
+from .views import (
+    client_stats_query, handle_upload, image_summary, list_page, list_query, list_response, reject_early,
+    stats_response, upload_max_request_bytes,
+)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotent
+async def upload_image(request):
+    """Async upload_image (see views.upload_image); the body has already been read."""
+    # reject_early may call the client validation API
+    early_response = await sync_to_async(reject_early)(request, upload_max_request_bytes())
+    if early_response is not None:
+        return early_response
+    return await sync_to_async(handle_upload)(request)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+async def list_images(request):
+    """Async list_images (see views.list_images)."""
+    try:
+        queryset, params = list_query(request)
+        total_count = await queryset.acount() if params['include_count'] else None
+        images = [image_summary(img) async for img in list_page(queryset, params)]
+        return list_response(images, total_count, params)
+
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Invalid parameter: {str(e)}'
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Failed to list images: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+async def get_stats(request):
+    """Async get_stats (see views.get_stats)."""
+    try:
+        totals = await Image.objects.aaggregate(total_images=Count('id'), total_size=Sum('size'))
+        by_client = [row async for row in client_stats_query()]
+        return stats_response(totals, by_client)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Failed to get stats: {str(e)}'
+        }, status=500)
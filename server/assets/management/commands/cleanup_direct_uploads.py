@@ -0,0 +1,58 @@
+"""
+Management command to remove direct uploads that were never completed.
+Run this periodically via cron or task scheduler.
+
+Usage:
+    python manage.py cleanup_direct_uploads
+    python manage.py cleanup_direct_uploads --max-age-hours 6
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from assets.models import DirectUpload
+from assets.views import queue_file_for_deletion
+
+
+class Command(BaseCommand):
+    help = 'Queue the objects of expired, never completed direct uploads for deletion'
+
+    def add_arguments(self, parser):
+        # Upload tokens are accepted for twice the URL expiry
+        token_hours = getattr(settings, 'IMAGE_DIRECT_UPLOAD_EXPIRY_SECONDS', 900) * 2 / 3600
+        parser.add_argument(
+            '--max-age-hours',
+            type=float,
+            default=token_hours,
+            help='Remove uploads issued longer ago than this (default: twice IMAGE_DIRECT_UPLOAD_EXPIRY_SECONDS)'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['max_age_hours'])
+        expired = DirectUpload.objects.filter(created_at__lt=cutoff)
+
+        queued_count = 0
+        removed_count = 0
+        failed_count = 0
+
+        for direct_upload in expired.iterator():
+            try:
+                if direct_upload.status != DirectUpload.STATUS_COMPLETE:
+                    # The client may have PUT the object without completing (or its complete died) - release it
+                    queue_file_for_deletion(direct_upload.key, direct_upload.client_id)
+                    queued_count += 1
+                    self.stdout.write(self.style.SUCCESS(f'✓ Queued: {direct_upload.key}'))
+                else:
+                    removed_count += 1
+                direct_upload.delete()
+            except Exception as e:
+                failed_count += 1
+                self.stdout.write(self.style.ERROR(f'✗ Failed: {direct_upload.key} - {str(e)[:100]}'))
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'Queued for deletion (never completed): {queued_count}'))
+        self.stdout.write(f'Removed (completed): {removed_count}')
+        self.stdout.write(self.style.WARNING(f'Failed: {failed_count}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
@@ -10,6 +10,8 @@ Usage:
 from django.core.management.base import BaseCommand
 from django.core.files.storage import default_storage
 from assets.models import PendingFileDeletion
+from assets.utils.resilient_storage import StorageUnavailable
+from assets.views import is_file_referenced
 
 
 class Command(BaseCommand):
@@ -44,10 +46,18 @@ class Command(BaseCommand):
         success_count = 0
         failed_count = 0
         skipped_count = 0
+        kept_count = 0
 
         for item in pending:
             total_processed += 1
 
+            # A deduplicated upload may have re-referenced the file since it was queued
+            if is_file_referenced(item.file_path, item.original_path):
+                item.delete()
+                kept_count += 1
+                self.stdout.write(f'↺ Kept (still referenced): {item.file_path}')
+                continue
+
             try:
                 # Try to delete the file
                 default_storage.delete(item.file_path)
@@ -56,6 +66,10 @@ class Command(BaseCommand):
                 success_count += 1
                 self.stdout.write(self.style.SUCCESS(f'✓ Deleted: {item.file_path}'))
 
+            except StorageUnavailable as e:
+                # Storage is failing fast - leave the rest queued without burning their attempts
+                self.stdout.write(self.style.ERROR(f'✗ Stopped: {e}'))
+                break
             except Exception as e:
                 # Failed - increment attempts and log error
                 item.attempts += 1
@@ -80,6 +94,7 @@ class Command(BaseCommand):
         self.stdout.write(self.style.SUCCESS(f'Deleted: {success_count}'))
         self.stdout.write(self.style.WARNING(f'Failed: {failed_count}'))
         self.stdout.write(self.style.ERROR(f'Skipped: {skipped_count}'))
+        self.stdout.write(f'Kept (still referenced): {kept_count}')
         self.stdout.write(f'Remaining in queue: {remaining}')
         self.stdout.write(self.style.SUCCESS('=' * 60))
 
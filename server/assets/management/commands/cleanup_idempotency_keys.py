@@ -0,0 +1,17 @@
+"""
+Management command to remove expired Idempotency-Key records.
+Run this periodically via cron or task scheduler.
+
+Usage:
+    python manage.py cleanup_idempotency_keys
+"""
+from django.core.management.base import BaseCommand
+from assets.utils.idempotency import prune_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete stored upload responses older than IMAGE_IDEMPOTENCY_TTL_HOURS'
+
+    def handle(self, *args, **options):
+        deleted = prune_expired()
+        self.stdout.write(self.style.SUCCESS(f'Removed {deleted} expired idempotency record(s)'))
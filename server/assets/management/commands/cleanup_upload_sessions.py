@@ -0,0 +1,59 @@
+"""
+Management command to remove abandoned resumable upload sessions.
+Run this periodically via cron or task scheduler.
+
+Usage:
+    python manage.py cleanup_upload_sessions
+    python manage.py cleanup_upload_sessions --max-age-hours 6
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from assets.models import UploadSession
+from assets.utils.upload_sessions import abort_session
+
+
+class Command(BaseCommand):
+    help = 'Abort upload sessions that have not received data for a while'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age-hours',
+            type=float,
+            default=getattr(settings, 'IMAGE_UPLOAD_SESSION_TTL_HOURS', 24),
+            help='Remove sessions idle for longer than this (default: IMAGE_UPLOAD_SESSION_TTL_HOURS)'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['max_age_hours'])
+        stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+
+        aborted_count = 0
+        removed_count = 0
+        failed_count = 0
+
+        for session in stale.iterator():
+            try:
+                if session.status != UploadSession.STATUS_COMPLETE:
+                    # Drop the spool file and the unfinished S3 multipart upload
+                    # (a 'completing' session here was left behind by a crashed worker)
+                    abort_session(session)
+                    aborted_count += 1
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✓ Aborted: {session.id} ({session.offset}/{session.size} bytes)'
+                    ))
+                else:
+                    removed_count += 1
+                session.delete()
+            except Exception as e:
+                failed_count += 1
+                self.stdout.write(self.style.ERROR(f'✗ Failed: {session.id} - {str(e)[:100]}'))
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(f'Aborted (incomplete): {aborted_count}'))
+        self.stdout.write(f'Removed (completed): {removed_count}')
+        self.stdout.write(self.style.WARNING(f'Failed: {failed_count}'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
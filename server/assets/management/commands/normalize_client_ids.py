@@ -0,0 +1,32 @@
+"""
+Management command to normalize (strip, upper-case) Image.client_id values
+written before client IDs were normalized on save. Migration 0020 runs the
+same backfill; use this for rows written by old code during a rolling deploy.
+
+Usage:
+    python manage.py normalize_client_ids
+    python manage.py normalize_client_ids --batch-size 5000
+"""
+from django.core.management.base import BaseCommand
+from assets.models import Image
+from assets.utils.client_id_backfill import normalize_client_ids
+
+
+class Command(BaseCommand):
+    help = 'Rewrite Image.client_id values in normalized form, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per UPDATE (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        def progress(last_id, updated):
+            self.stdout.write(f'  up to id {last_id}: {updated} row(s) normalized')
+
+        verbose = options['verbosity'] > 1
+        updated = normalize_client_ids(Image, options['batch_size'], progress if verbose else None)
+        self.stdout.write(self.style.SUCCESS(f'Normalized client_id of {updated} image(s)'))
@@ -0,0 +1,61 @@
+"""
+Management command to run deferred image compression.
+Run this periodically via cron or task scheduler, or keep it running with --loop.
+
+Usage:
+    python manage.py process_compression_queue
+    python manage.py process_compression_queue --batch-size 50
+    python manage.py process_compression_queue --loop --sleep 5
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from assets.models import Image
+from assets.utils.compression_jobs import process_compression_queue
+
+
+class Command(BaseCommand):
+    help = 'Compress images that were uploaded with deferred compression'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Number of images to process per batch (default: 10)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll for new work'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when the queue is empty (default: 5)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+
+        while True:
+            stats = process_compression_queue(batch_size)
+
+            if stats['processed']:
+                self.stdout.write(
+                    f"Processed: {stats['processed']} | "
+                    + self.style.SUCCESS(f"Compressed: {stats['compressed']}") + ' | '
+                    + f"Unchanged: {stats['unchanged']} | "
+                    + self.style.ERROR(f"Failed: {stats['failed']}")
+                )
+
+            if not options['loop']:
+                break
+            if stats['processed'] < batch_size:
+                time.sleep(options['sleep'])
+
+        remaining = Image.objects.filter(
+            compression_status__in=(Image.COMPRESSION_PENDING, Image.COMPRESSION_PROCESSING)
+        ).count()
+        self.stdout.write(f'Remaining in queue: {remaining}')
@@ -0,0 +1,40 @@
+"""
+Management command to mirror the valid client IDs from the activation API
+into the ClientRegistry table used for upload validation.
+Run this periodically via cron or task scheduler.
+
+Usage:
+    python manage.py sync_clients
+    python manage.py sync_clients --url http://localhost:9000/client-ids/
+"""
+from django.core.management.base import BaseCommand, CommandError
+from assets.models import ClientRegistry
+from assets.utils.client_validator import fetch_valid_client_ids, sync_client_registry
+
+
+class Command(BaseCommand):
+    help = 'Sync the ClientRegistry table with the remote client ID list'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Client ID API to read (default: IMAGE_CLIENT_ID_API_URL)'
+        )
+        parser.add_argument(
+            '--allow-empty',
+            action='store_true',
+            help='Apply an empty remote list (removes every registered client)'
+        )
+
+    def handle(self, *args, **options):
+        client_ids = fetch_valid_client_ids(options['url'])
+        if client_ids is None:
+            raise CommandError('Could not fetch client IDs; registry left unchanged')
+        if not client_ids and not options['allow_empty'] and ClientRegistry.objects.exists():
+            raise CommandError('Remote list is empty; pass --allow-empty to clear the registry')
+
+        added, removed = sync_client_registry(client_ids)
+        total = ClientRegistry.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f'Client registry synced: {added} added, {removed} removed, {total} registered'
+        ))
@@ -0,0 +1,26 @@
+# Generated by Django 5.0.14 on 2026-10-17 01:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0009_pendingfiledeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='content_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of the stored bytes (used for deduplication)', max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['content_hash'], name='idx_image_content_hash'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['image'], name='idx_image_path'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.14 on 2026-10-17 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0010_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='compression_error',
+            field=models.TextField(blank=True, help_text='Last deferred compression error if any', null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='compression_status',
+            field=models.CharField(choices=[('none', 'Not needed'), ('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='none', help_text='State of deferred server-side compression', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['compression_status', 'uploaded_at'], name='idx_image_compression_queue'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0011_image_compression_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, help_text='Resized copies as {size: storage name}'),
+        ),
+    ]
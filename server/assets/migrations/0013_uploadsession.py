@@ -0,0 +1,41 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:10
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0012_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('client_id', models.CharField(help_text='Client identifier for the image', max_length=100)),
+                ('original_filename', models.CharField(help_text='Original uploaded filename', max_length=255)),
+                ('content_type', models.CharField(help_text='Content type of the uploaded file', max_length=100)),
+                ('name', models.CharField(blank=True, help_text='Custom name for the image', max_length=255, null=True)),
+                ('description', models.TextField(blank=True, help_text='Description of the image', null=True)),
+                ('size', models.BigIntegerField(help_text='Total file size in bytes')),
+                ('offset', models.BigIntegerField(default=0, help_text='Bytes received so far')),
+                ('storage_key', models.CharField(help_text='Storage key the file is assembled under', max_length=500)),
+                ('s3_upload_id', models.CharField(blank=True, help_text='S3 multipart upload id', max_length=255, null=True)),
+                ('s3_parts', models.JSONField(blank=True, default=list, help_text='Uploaded multipart parts as [{PartNumber, ETag}]')),
+                ('status', models.CharField(choices=[('open', 'Open'), ('complete', 'Complete')], default='open', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('image', models.ForeignKey(blank=True, help_text='Image created on finalize', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='assets.image')),
+            ],
+            options={
+                'verbose_name': 'Upload Session',
+                'verbose_name_plural': 'Upload Sessions',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='idx_upload_session_stale')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0013_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='format',
+            field=models.CharField(blank=True, help_text='Image format of the stored file (JPEG, PNG, ...)', max_length=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, help_text='Height in px (EXIF orientation applied)', null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='placeholder',
+            field=models.TextField(blank=True, help_text='Tiny base64 WebP data URI shown while the image loads (LQIP)', null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, help_text='Width in px (EXIF orientation applied)', null=True),
+        ),
+    ]
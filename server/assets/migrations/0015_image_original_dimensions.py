@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0014_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='original_height',
+            field=models.PositiveIntegerField(blank=True, help_text='Height before downscaling to IMAGE_MAX_DIMENSION (null if not downscaled)', null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='original_width',
+            field=models.PositiveIntegerField(blank=True, help_text='Width before downscaling to IMAGE_MAX_DIMENSION (null if not downscaled)', null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0015_image_original_dimensions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyRecord',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Idempotency-Key header value', max_length=255)),
+                ('scope', models.CharField(blank=True, default='', help_text='X-Client-Id header the key was sent with', max_length=100)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, help_text='Stored response status (null while in flight)', null=True)),
+                ('response', models.JSONField(blank=True, help_text='Stored JSON response body', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Idempotency Record',
+                'verbose_name_plural': 'Idempotency Records',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='idx_idempotency_created')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencyrecord',
+            constraint=models.UniqueConstraint(fields=('scope', 'key'), name='uniq_idempotency_scope_key'),
+        ),
+    ]
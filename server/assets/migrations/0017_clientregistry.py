@@ -0,0 +1,26 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0016_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientRegistry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.CharField(help_text='Normalized client ID', max_length=100, unique=True)),
+                ('synced_at', models.DateTimeField(auto_now_add=True, help_text='When the sync first saw this ID')),
+            ],
+            options={
+                'verbose_name': 'Registered Client',
+                'verbose_name_plural': 'Registered Clients',
+                'ordering': ['client_id'],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0017_clientregistry'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='image',
+            name='idx_image_client_id',
+        ),
+        migrations.RemoveIndex(
+            model_name='image',
+            name='idx_image_uploaded_desc',
+        ),
+        migrations.RemoveIndex(
+            model_name='image',
+            name='idx_image_uploaded_asc',
+        ),
+        migrations.RemoveIndex(
+            model_name='image',
+            name='idx_image_size',
+        ),
+        migrations.RemoveIndex(
+            model_name='image',
+            name='idx_image_size_desc',
+        ),
+        migrations.RemoveIndex(
+            model_name='image',
+            name='idx_image_client_date',
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['client_id', 'id'], name='idx_image_client_id'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['-uploaded_at', '-id'], name='idx_image_uploaded_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['size', 'id'], name='idx_image_size'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['name', 'id'], name='idx_image_name'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['client_id', '-uploaded_at', '-id'], name='idx_image_client_date'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+INDEX_NAME = 'idx_image_search_trgm'
+# Frozen copy of UPPER(image_search.search_document()) - the search query must
+# compile to exactly this expression for the index to be used
+SEARCH_EXPRESSION = (
+    "UPPER((COALESCE(\"name\", '') || ' ' || COALESCE(\"description\", '') || ' ' || "
+    "COALESCE(\"filename\", '') || ' ' || COALESCE(\"original_filename\", '')))"
+)
+
+
+def add_search_index(apps, schema_editor):
+    # GIN/pg_trgm only exist on PostgreSQL (and pg_trgm only with contrib installed);
+    # without them search works unindexed
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    table = schema_editor.quote_name(apps.get_model('assets', 'Image')._meta.db_table)
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS "{INDEX_NAME}" ON {table} USING gin (({SEARCH_EXPRESSION}) gin_trgm_ops)'
+    )
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0018_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
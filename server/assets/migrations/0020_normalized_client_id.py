@@ -0,0 +1,40 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:50
+
+import assets.models
+from django.db import migrations
+from django.db.models import F
+from django.db.models.functions import Trim, Upper
+
+BATCH_SIZE = 1000
+
+
+def normalize_existing(apps, schema_editor):
+    # Frozen copy of assets.utils.client_id_backfill.normalize_client_ids: one
+    # UPDATE per id range, each committing on its own (the migration isn't atomic)
+    Image = apps.get_model('assets', 'Image')
+    normalized = Upper(Trim(F('client_id')))
+    last_id = 0
+    while True:
+        ids = list(Image.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            return
+        last_id = ids[-1]
+        Image.objects.filter(id__gte=ids[0], id__lte=last_id).exclude(client_id=normalized).update(client_id=normalized)
+
+
+class Migration(migrations.Migration):
+    # Each backfill batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('assets', '0019_image_search_trgm'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='image',
+            name='client_id',
+            field=assets.models.ClientIdField(help_text='Client identifier for the image (stored upper-case)', max_length=100),
+        ),
+        migrations.RunPython(normalize_existing, migrations.RunPython.noop),
+    ]
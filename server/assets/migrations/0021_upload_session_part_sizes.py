@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0020_normalized_client_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='s3_parts',
+            field=models.JSONField(blank=True, default=list, help_text='Uploaded multipart parts as [{PartNumber, ETag, Size}]'),
+        ),
+    ]
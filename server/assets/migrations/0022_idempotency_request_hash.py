@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0021_upload_session_part_sizes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencyrecord',
+            name='request_hash',
+            field=models.CharField(blank=True, default='', help_text="SHA-256 of the request's fields and files", max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='idempotencyrecord',
+            name='scope',
+            field=models.CharField(blank=True, default='', help_text='Normalized client_id the key was sent for', max_length=100),
+        ),
+    ]
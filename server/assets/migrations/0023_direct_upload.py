@@ -0,0 +1,32 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0022_idempotency_request_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectUpload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Storage key the client PUTs the file to', max_length=500, unique=True)),
+                ('client_id', models.CharField(help_text='Client identifier for the image', max_length=100)),
+                ('original_filename', models.CharField(help_text='Original uploaded filename', max_length=255)),
+                ('status', models.CharField(choices=[('open', 'Open'), ('complete', 'Complete')], default='open', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('image', models.ForeignKey(blank=True, help_text='Image created on complete', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='assets.image')),
+            ],
+            options={
+                'verbose_name': 'Direct Upload',
+                'verbose_name_plural': 'Direct Uploads',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='idx_direct_upload_created')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0023_direct_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pendingfiledeletion',
+            name='original_path',
+            field=models.CharField(blank=True, help_text='Stored file this derivative belongs to (derivatives only)', max_length=500, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0024_pending_deletion_original_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='compression_claimed_at',
+            field=models.DateTimeField(blank=True, help_text='When a compression worker claimed the image', null=True),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='compression_status',
+            field=models.CharField(choices=[('none', 'Not needed'), ('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='none', help_text='State of deferred server-side compression', max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assets', '0025_compression_claim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='directupload',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, help_text='When a complete request started ingesting the object', null=True),
+        ),
+        migrations.AlterField(
+            model_name='directupload',
+            name='status',
+            field=models.CharField(choices=[('open', 'Open'), ('completing', 'Completing'), ('complete', 'Complete')], default='open', max_length=20),
+        ),
+    ]
@@ -1,14 +1,48 @@
+import uuid
+
 from django.db import models
 
 
+def normalize_client_id(client_id):
+    """Canonical form of a client ID: stripped and upper-case."""
+    return str(client_id).strip().upper()
+
+
+class ClientIdField(models.CharField):
+    """
+    CharField that stores client IDs normalized on every write (save, create,
+    bulk_create), so client filters are plain equality lookups on its indexes.
+    """
+
+    def pre_save(self, model_instance, add):
+        value = getattr(model_instance, self.attname)
+        if value is not None:
+            value = normalize_client_id(value)
+            setattr(model_instance, self.attname, value)
+        return value
+
+
 class Image(models.Model):
     """
     Model to store uploaded image metadata.
     """
+    COMPRESSION_NONE = 'none'
+    COMPRESSION_PENDING = 'pending'
+    COMPRESSION_PROCESSING = 'processing'
+    COMPRESSION_DONE = 'done'
+    COMPRESSION_FAILED = 'failed'
+    COMPRESSION_STATUS_CHOICES = [
+        (COMPRESSION_NONE, 'Not needed'),
+        (COMPRESSION_PENDING, 'Pending'),
+        (COMPRESSION_PROCESSING, 'Processing'),
+        (COMPRESSION_DONE, 'Done'),
+        (COMPRESSION_FAILED, 'Failed'),
+    ]
+
     filename = models.CharField(max_length=255, unique=True, help_text="Unique filename stored in R2")
     image = models.ImageField(upload_to="images/", help_text="Uploaded image file")
     original_filename = models.CharField(max_length=255, help_text="Original uploaded filename")
-    client_id = models.CharField(max_length=100, help_text="Client identifier for the image")
+    client_id = ClientIdField(max_length=100, help_text="Client identifier for the image (stored upper-case)")
      
     # Optional fields
     name = models.CharField(max_length=255, blank=True, null=True, help_text="Custom name for the image")
@@ -16,6 +50,17 @@ class Image(models.Model):
     
     # Metadata
     size = models.IntegerField(help_text="File size in bytes")
+    content_hash = models.CharField(max_length=64, blank=True, null=True, help_text="SHA-256 of the stored bytes (used for deduplication)")
+    compression_status = models.CharField(max_length=20, choices=COMPRESSION_STATUS_CHOICES, default=COMPRESSION_NONE, help_text="State of deferred server-side compression")
+    compression_error = models.TextField(blank=True, null=True, help_text="Last deferred compression error if any")
+    compression_claimed_at = models.DateTimeField(blank=True, null=True, help_text="When a compression worker claimed the image")
+    derivatives = models.JSONField(default=dict, blank=True, help_text="Resized copies as {size: storage name}")
+    width = models.PositiveIntegerField(blank=True, null=True, help_text="Width in px (EXIF orientation applied)")
+    height = models.PositiveIntegerField(blank=True, null=True, help_text="Height in px (EXIF orientation applied)")
+    original_width = models.PositiveIntegerField(blank=True, null=True, help_text="Width before downscaling to IMAGE_MAX_DIMENSION (null if not downscaled)")
+    original_height = models.PositiveIntegerField(blank=True, null=True, help_text="Height before downscaling to IMAGE_MAX_DIMENSION (null if not downscaled)")
+    format = models.CharField(max_length=10, blank=True, null=True, help_text="Image format of the stored file (JPEG, PNG, ...)")
+    placeholder = models.TextField(blank=True, null=True, help_text="Tiny base64 WebP data URI shown while the image loads (LQIP)")
     uploaded_at = models.DateTimeField(auto_now_add=True, help_text="Upload timestamp")
     
     class Meta:
@@ -23,18 +68,25 @@ class Image(models.Model):
         verbose_name = "Image"
         verbose_name_plural = "Images"
         indexes = [
-            # Index for client_id filtering (most common filter)
-            models.Index(fields=['client_id'], name='idx_image_client_id'),
+            # Sort indexes end in id, the tie-break of list ordering, so keyset (cursor)
+            # pages are index range scans; each serves both directions (backward scan).
+            # Index for client_id filtering (most common filter) and sorting
+            models.Index(fields=['client_id', 'id'], name='idx_image_client_id'),
             # Index for date-based sorting and filtering
-            models.Index(fields=['-uploaded_at'], name='idx_image_uploaded_desc'),
-            models.Index(fields=['uploaded_at'], name='idx_image_uploaded_asc'),
+            models.Index(fields=['-uploaded_at', '-id'], name='idx_image_uploaded_desc'),
             # Index for size sorting
-            models.Index(fields=['size'], name='idx_image_size'),
-            models.Index(fields=['-size'], name='idx_image_size_desc'),
+            models.Index(fields=['size', 'id'], name='idx_image_size'),
+            # Index for name sorting
+            models.Index(fields=['name', 'id'], name='idx_image_name'),
             # Composite index for client + date (common query pattern)
-            models.Index(fields=['client_id', '-uploaded_at'], name='idx_image_client_date'),
+            models.Index(fields=['client_id', '-uploaded_at', '-id'], name='idx_image_client_date'),
             # Index for filename lookups
             models.Index(fields=['filename'], name='idx_image_filename'),
+            # Indexes for content deduplication and storage reference counting
+            models.Index(fields=['content_hash'], name='idx_image_content_hash'),
+            models.Index(fields=['image'], name='idx_image_path'),
+            # Index for polling the deferred compression queue
+            models.Index(fields=['compression_status', 'uploaded_at'], name='idx_image_compression_queue'),
         ]
     
     def __str__(self):
@@ -47,6 +99,7 @@ class PendingFileDeletion(models.Model):
     Allows instant metadata deletion while deferring slow file deletion operations.
     """
     file_path = models.CharField(max_length=500, help_text="Path to file in storage")
+    original_path = models.CharField(max_length=500, blank=True, null=True, help_text="Stored file this derivative belongs to (derivatives only)")
     client_id = models.CharField(max_length=100, blank=True, null=True, help_text="Client ID for logging")
     queued_at = models.DateTimeField(auto_now_add=True, help_text="When the file was queued for deletion")
     attempts = models.IntegerField(default=0, help_text="Number of deletion attempts")
@@ -63,3 +116,141 @@ class PendingFileDeletion(models.Model):
     
     def __str__(self):
         return f"Delete: {self.file_path} (queued {self.queued_at})"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable chunked upload in progress.
+    
+    Chunks are appended at `offset` until `size` bytes have arrived, then the
+    session is finalized into an Image. Bytes are spooled to local disk and,
+    on S3-compatible storage, forwarded as parts of a multipart upload.
+    A complete request marks the session 'completing' while it finalizes it.
+    """
+    STATUS_OPEN = 'open'
+    STATUS_COMPLETING = 'completing'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_COMPLETING, 'Completing'),
+        (STATUS_COMPLETE, 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    client_id = models.CharField(max_length=100, help_text="Client identifier for the image")
+    original_filename = models.CharField(max_length=255, help_text="Original uploaded filename")
+    content_type = models.CharField(max_length=100, help_text="Content type of the uploaded file")
+    name = models.CharField(max_length=255, blank=True, null=True, help_text="Custom name for the image")
+    description = models.TextField(blank=True, null=True, help_text="Description of the image")
+
+    size = models.BigIntegerField(help_text="Total file size in bytes")
+    offset = models.BigIntegerField(default=0, help_text="Bytes received so far")
+    storage_key = models.CharField(max_length=500, help_text="Storage key the file is assembled under")
+    s3_upload_id = models.CharField(max_length=255, blank=True, null=True, help_text="S3 multipart upload id")
+    s3_parts = models.JSONField(default=list, blank=True, help_text="Uploaded multipart parts as [{PartNumber, ETag, Size}]")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    claimed_at = models.DateTimeField(blank=True, null=True, help_text="When a complete request started finalizing the session")
+    image = models.ForeignKey(Image, on_delete=models.SET_NULL, blank=True, null=True, related_name='+', help_text="Image created on finalize")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Upload Session"
+        verbose_name_plural = "Upload Sessions"
+        indexes = [
+            # Index for finding abandoned sessions
+            models.Index(fields=['status', 'updated_at'], name='idx_upload_session_stale'),
+        ]
+
+    def __str__(self):
+        return f"Upload {self.original_filename} ({self.offset}/{self.size})"
+
+
+class DirectUpload(models.Model):
+    """
+    A presigned direct-to-storage upload handed out by /api/upload/init/.
+
+    The key is recorded when the URL is issued, so an object that was PUT but
+    never completed can be found and deleted once the token has expired.
+    A complete request marks the row 'completing' while it ingests the object.
+    """
+    STATUS_OPEN = 'open'
+    STATUS_COMPLETING = 'completing'
+    STATUS_COMPLETE = 'complete'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_COMPLETING, 'Completing'),
+        (STATUS_COMPLETE, 'Complete'),
+    ]
+
+    key = models.CharField(max_length=500, unique=True, help_text="Storage key the client PUTs the file to")
+    client_id = models.CharField(max_length=100, help_text="Client identifier for the image")
+    original_filename = models.CharField(max_length=255, help_text="Original uploaded filename")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    claimed_at = models.DateTimeField(blank=True, null=True, help_text="When a complete request started ingesting the object")
+    image = models.ForeignKey(Image, on_delete=models.SET_NULL, blank=True, null=True, related_name='+', help_text="Image created on complete")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Direct Upload"
+        verbose_name_plural = "Direct Uploads"
+        indexes = [
+            # Index for finding expired uploads
+            models.Index(fields=['created_at'], name='idx_direct_upload_created'),
+        ]
+
+    def __str__(self):
+        return f"Direct upload {self.key} ({self.status})"
+
+
+class IdempotencyRecord(models.Model):
+    """
+    Response of an upload sent with an Idempotency-Key header.
+    
+    A retry carrying the same key for the same client gets the stored response
+    replayed instead of creating another Image. The row is claimed before the
+    upload runs, so a concurrent duplicate sees it in flight (status_code null).
+    """
+    key = models.CharField(max_length=255, help_text="Idempotency-Key header value")
+    scope = models.CharField(max_length=100, blank=True, default='', help_text="Normalized client_id the key was sent for")
+    request_hash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of the request's fields and files")
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True, help_text="Stored response status (null while in flight)")
+    response = models.JSONField(blank=True, null=True, help_text="Stored JSON response body")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Idempotency Record"
+        verbose_name_plural = "Idempotency Records"
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='uniq_idempotency_scope_key'),
+        ]
+        indexes = [
+            # Index for expiring old records
+            models.Index(fields=['created_at'], name='idx_idempotency_created'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency {self.key} ({self.status_code or 'in flight'})"
+
+
+class ClientRegistry(models.Model):
+    """
+    Valid client ID, mirrored from the activation API by `manage.py sync_clients`.
+    
+    Stored normalized (stripped, upper-case) so validation is a lookup on the
+    unique index instead of a call to the remote API.
+    """
+    client_id = models.CharField(max_length=100, unique=True, help_text="Normalized client ID")
+    synced_at = models.DateTimeField(auto_now_add=True, help_text="When the sync first saw this ID")
+
+    class Meta:
+        ordering = ['client_id']
+        verbose_name = "Registered Client"
+        verbose_name_plural = "Registered Clients"
+
+    def __str__(self):
+        return self.client_id
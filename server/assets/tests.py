@@ -1,6 +1,20 @@
-from django.test import SimpleTestCase
-from django.core.files.uploadedfile import SimpleUploadedFile
+from asgiref.sync import sync_to_async
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.files.storage import Storage
+from django.core.files.uploadedfile import InMemoryUploadedFile, SimpleUploadedFile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock, skipUnless
+import hashlib
 import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 
 try:
     from PIL import Image
@@ -8,14 +22,24 @@ try:
 except Exception:
     PIL_AVAILABLE = False
 
+requires_pillow = skipUnless(PIL_AVAILABLE, "Pillow not available")
+
+try:
+    import boto3
+    from moto import mock_aws
+    MOTO_AVAILABLE = True
+except Exception:
+    MOTO_AVAILABLE = False
+
+from . import async_views
+from .models import ClientRegistry, IdempotencyRecord, Image as ImageModel, PendingFileDeletion
+from .utils import client_validator
 from .utils.compress_image import compress_image_file
 
 
+@requires_pillow
 class CompressImageTests(TestCase):
     def test_compress_large_image(self):
-        if not PIL_AVAILABLE:
-            self.skipTest("Pillow not available")
-
         # Create a large JPEG in-memory (high quality) to ensure it's large
         img = Image.new('RGB', (4000, 3000), color='red')
         buf = io.BytesIO()
@@ -32,3 +56,1478 @@ class CompressImageTests(TestCase):
         # Ensure we preserved extension/format (was JPG)
         if compressed is not upload:
             self.assertTrue(str(compressed.name).lower().endswith('.jpg'))
+
+    def test_quality_search_hits_target_in_few_encodes(self):
+        # Smooth, photo-like content so the target is reachable between min and initial quality
+        base = Image.effect_noise((250, 200), 90).resize((2000, 1600), Image.BICUBIC)
+        img = Image.merge('RGB', (base, Image.linear_gradient('L').resize((2000, 1600)), base))
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=98)
+        upload = SimpleUploadedFile('photo.jpg', buf.getvalue(), content_type='image/jpeg')
+
+        target_mb = 0.45
+        compressed = compress_image_file(upload, max_size_mb=target_mb, initial_quality=80, min_quality=30)
+
+        info = compressed.compression_info
+        self.assertLessEqual(compressed.size, target_mb * 1024 * 1024)
+        self.assertTrue(30 <= info['quality'] <= 80)
+        self.assertLessEqual(info['full_encodes'], 3)
+
+    def test_search_stays_within_encode_budget_when_estimates_miss(self):
+        from .utils import compress_image
+
+        img = Image.effect_noise((800, 600), 100).convert('RGB')
+        full_encodes = []
+        encode = compress_image._encode
+
+        def misleading_encode(image, buffer, save_kwargs, quality):
+            # Trial encodes promise a steep curve, full encodes only fit at min_quality
+            size = encode(image, buffer, save_kwargs, quality)
+            if image is not img:
+                return 1 if quality == 30 else 10 ** 6
+            full_encodes.append(quality)
+            return size if quality == 30 else 10 ** 7
+
+        with mock.patch.object(compress_image, '_encode', side_effect=misleading_encode):
+            buffer, quality, stats = compress_image._search_quality(
+                img, {'format': 'JPEG'}, max_bytes=10 ** 6, initial_quality=80, min_quality=30
+            )
+        buffer.close()
+
+        self.assertEqual(len(full_encodes), compress_image.MAX_FULL_ENCODES)
+        self.assertEqual((full_encodes[-1], quality), (30, 30))
+        self.assertEqual(stats['full_encodes'], len(full_encodes))
+
+    def test_perceptual_mode_picks_lowest_quality_above_ssim_target(self):
+        base = Image.effect_noise((250, 200), 90).resize((1600, 1200), Image.BICUBIC)
+        img = Image.merge('RGB', (base, Image.linear_gradient('L').resize((1600, 1200)), base))
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=95)
+        # Well under the size limit - only the perceptual target triggers the re-encode
+        upload = SimpleUploadedFile('photo.jpg', buf.getvalue(), content_type='image/jpeg')
+
+        strict = compress_image_file(upload, max_size_mb=5, initial_quality=90, min_quality=30, ssim_target=0.98)
+        relaxed = compress_image_file(upload, max_size_mb=5, initial_quality=90, min_quality=30, ssim_target=0.9)
+
+        for compressed, target in ((strict, 0.98), (relaxed, 0.9)):
+            info = compressed.compression_info
+            self.assertGreaterEqual(info['ssim'], target)
+            self.assertLess(compressed.size, upload.size)
+        self.assertLess(relaxed.compression_info['quality'], strict.compression_info['quality'])
+        self.assertLess(relaxed.size, strict.size)
+        self.assertIs(compress_image_file(upload, max_size_mb=5), upload)
+
+    def test_compressed_output_is_the_encoder_buffer(self):
+        from .utils.compress_image import EncodeBuffer
+
+        img = Image.effect_noise((400, 400), 60).convert('RGB')
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=100)
+        upload = SimpleUploadedFile('noisy.jpg', buf.getvalue(), content_type='image/jpeg')
+
+        in_memory = compress_image_file(upload, max_size_mb=0.05)
+        spilled = compress_image_file(upload, max_size_mb=0.05, spool_max_bytes=1024)
+
+        for compressed in (in_memory, spilled):
+            self.assertIsInstance(compressed.file, EncodeBuffer)
+            self.assertEqual(len(compressed.read()), compressed.size)
+        self.assertFalse(in_memory.file._rolled)
+        self.assertTrue(spilled.file._rolled)
+
+
+API_HEADERS = {'HTTP_X_API_KEY': 'imcbs-secret-key-2025'}
+
+
+def make_jpeg(size=(64, 48), color='blue', name='photo.jpg'):
+    img = Image.new('RGB', size, color=color)
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=90)
+    return SimpleUploadedFile(name, buf.getvalue(), content_type='image/jpeg')
+
+
+def stub_client_validation(test):
+    """Accept every client ID in assets.views until `test` ends; returns the mock."""
+    patcher = mock.patch('assets.views.validate_client_id', return_value=(True, None))
+    test.addCleanup(patcher.stop)
+    return patcher.start()
+
+
+@requires_pillow
+class MediaRootTestCase(TestCase):
+    """
+    Runs each test against a throwaway MEDIA_ROOT with client validation stubbed (self.validate).
+
+    `settings_overrides` holds the settings a test class needs besides MEDIA_ROOT.
+    """
+    settings_overrides = {'IMAGE_DERIVATIVE_SIZES': ''}
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.use_settings(MEDIA_ROOT=self.media_root, **self.settings_overrides)
+        self.validate = stub_client_validation(self)
+
+    def use_settings(self, **settings):
+        """Override `settings` until the test ends."""
+        override = override_settings(**settings)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class StreamingUploadTests(MediaRootTestCase):
+    settings_overrides = {'IMAGE_STREAM_UPLOADS_TO_STORAGE': True}
+
+    def test_upload_is_written_straight_to_storage(self):
+        upload = make_jpeg()
+        response = self.client.post('/api/upload/', {'image': upload, 'client_id': 'C1'}, **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        image = ImageModel.objects.get(id=response.json()['id'])
+        self.assertEqual(image.image.name, f"images/{image.filename}")
+        self.assertEqual(os.path.getsize(os.path.join(self.media_root, image.image.name)), image.size)
+        self.assertFalse(PendingFileDeletion.objects.exists())
+
+    def test_rejected_upload_is_queued_for_deletion(self):
+        # Missing client_id is only noticed after the file was streamed
+        response = self.client.post('/api/upload/', {'image': make_jpeg()}, **API_HEADERS)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ImageModel.objects.exists())
+        queued = PendingFileDeletion.objects.get()
+        self.assertTrue(queued.file_path.startswith('images/'))
+
+
+class EarlyRejectionTests(MediaRootTestCase):
+    settings_overrides = {'IMAGE_STREAM_UPLOADS_TO_STORAGE': True}
+
+    def assertNothingStored(self):
+        self.assertFalse(ImageModel.objects.exists())
+        self.assertFalse(PendingFileDeletion.objects.exists())
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'images')) if os.path.isdir(
+            os.path.join(self.media_root, 'images')) else [])
+
+    def test_disallowed_extension_is_refused_with_415(self):
+        upload = SimpleUploadedFile('notes.txt', b'not an image', content_type='text/plain')
+        response = self.client.post('/api/upload/', {'image': upload, 'client_id': 'C1'}, **API_HEADERS)
+
+        self.assertEqual(response.status_code, 415)
+        self.assertNothingStored()
+
+    def test_non_image_content_is_refused_from_first_bytes(self):
+        upload = SimpleUploadedFile('photo.jpg', b'<html>' + b'x' * 200000, content_type='image/jpeg')
+        response = self.client.post('/api/upload/', {'image': upload, 'client_id': 'C1'}, **API_HEADERS)
+
+        self.assertEqual(response.status_code, 415)
+        self.assertNothingStored()
+
+    def test_oversized_content_length_is_refused_with_413(self):
+        with override_settings(IMAGE_UPLOAD_MAX_REQUEST_MB=0.0001):
+            response = self.client.post('/api/upload/', {'image': make_jpeg(), 'client_id': 'C1'}, **API_HEADERS)
+
+        self.assertEqual(response.status_code, 413)
+        self.validate.assert_not_called()
+        self.assertNothingStored()
+
+    def test_invalid_client_header_is_refused_with_403(self):
+        self.validate.return_value = (False, 'Invalid client_id')
+        response = self.client.post('/api/upload/', {'image': make_jpeg()}, HTTP_X_CLIENT_ID='BAD', **API_HEADERS)
+
+        self.assertEqual(response.status_code, 403)
+        self.validate.assert_called_once_with('BAD')
+        self.assertNothingStored()
+
+    def test_client_header_stands_in_for_form_field(self):
+        response = self.client.post('/api/upload/', {'image': make_jpeg()}, HTTP_X_CLIENT_ID='C1', **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['client_id'], 'C1')
+        self.validate.assert_called_once_with('C1')
+
+
+class DeduplicationTests(MediaRootTestCase):
+    settings_overrides = {}
+
+    def upload(self, client_id='C1'):
+        response = self.client.post('/api/upload/', {'image': make_jpeg(), 'client_id': client_id}, **API_HEADERS)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_identical_bytes_share_one_stored_object(self):
+        first = self.upload()
+        second = self.upload(client_id='C2')
+
+        self.assertFalse(first['deduplicated'])
+        self.assertTrue(second['deduplicated'])
+        self.assertEqual(first['url'], second['url'])
+        self.assertNotEqual(first['filename'], second['filename'])
+        self.assertEqual(ImageModel.objects.values('image').distinct().count(), 1)
+
+    def test_file_is_released_with_its_last_reference(self):
+        first = self.upload()
+        second = self.upload()
+        stored_path = ImageModel.objects.get(id=first['id']).image.name
+
+        self.client.delete(f"/api/delete/{first['id']}/", **API_HEADERS)
+        self.assertFalse(PendingFileDeletion.objects.filter(file_path=stored_path).exists())
+
+        self.client.post('/api/bulk-delete/', data={'image_ids': [second['id']]},
+                         content_type='application/json', **API_HEADERS)
+        self.assertTrue(PendingFileDeletion.objects.filter(file_path=stored_path).exists())
+
+    def test_cleanup_keeps_files_that_were_referenced_again(self):
+        first = self.upload()
+        stored_path = ImageModel.objects.get(id=first['id']).image.name
+        PendingFileDeletion.objects.create(file_path=stored_path, client_id='C1')
+
+        response = self.client.post('/api/cleanup/run/', **API_HEADERS)
+
+        self.assertEqual(response.json()['kept'], 1)
+        self.assertFalse(PendingFileDeletion.objects.exists())
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, stored_path)))
+
+
+class DerivativeTests(MediaRootTestCase):
+    settings_overrides = {'IMAGE_DERIVATIVE_SIZES': '200,800'}
+
+    def test_upload_stores_derivatives_next_to_original(self):
+        response = self.client.post('/api/upload/', {'image': make_jpeg(size=(1200, 900)), 'client_id': 'C1'},
+                                    **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        image = ImageModel.objects.get(id=response.json()['id'])
+        stem = os.path.splitext(image.image.name)[0]
+        self.assertEqual(image.derivatives, {'800': f"{stem}_800.webp", '200': f"{stem}_200.webp"})
+        with Image.open(os.path.join(self.media_root, image.derivatives['200'])) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('WEBP', (200, 150)))
+
+        listed = self.client.get('/api/list/', **API_HEADERS).json()['images'][0]
+        self.assertEqual(set(listed['derivatives']), {'200', '800'})
+        self.assertTrue(listed['derivatives']['200'].endswith('_200.webp'))
+
+    def test_delete_queues_derivatives(self):
+        response = self.client.post('/api/upload/', {'image': make_jpeg(), 'client_id': 'C1'}, **API_HEADERS)
+        image = ImageModel.objects.get(id=response.json()['id'])
+
+        self.client.delete(f"/api/delete/{image.id}/", **API_HEADERS)
+
+        queued = set(PendingFileDeletion.objects.values_list('file_path', flat=True))
+        self.assertEqual(queued, {image.image.name, *image.derivatives.values()})
+
+    def test_cleanup_keeps_derivatives_of_a_referenced_original(self):
+        response = self.client.post('/api/upload/', {'image': make_jpeg(), 'client_id': 'C1'}, **API_HEADERS)
+        image = ImageModel.objects.get(id=response.json()['id'])
+        # Queued by a delete that raced a deduplicated upload of the same bytes
+        for path in image.derivatives.values():
+            PendingFileDeletion.objects.create(file_path=path, original_path=image.image.name, client_id='C1')
+
+        response = self.client.post('/api/cleanup/run/', **API_HEADERS)
+
+        self.assertEqual(response.json()['kept'], len(image.derivatives))
+        for path in image.derivatives.values():
+            self.assertTrue(os.path.exists(os.path.join(self.media_root, path)))
+
+
+class MetadataTests(MediaRootTestCase):
+
+    def rotated_jpeg(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # stored landscape, displayed portrait
+        buf = io.BytesIO()
+        Image.new('RGB', (640, 480), color='orange').save(buf, format='JPEG', exif=exif.tobytes())
+        return SimpleUploadedFile('rotated.jpg', buf.getvalue(), content_type='image/jpeg')
+
+    def test_upload_records_dimensions_format_and_placeholder(self):
+        response = self.client.post('/api/upload/', {'image': self.rotated_jpeg(), 'client_id': 'C1'},
+                                    **API_HEADERS)
+
+        data = response.json()
+        self.assertEqual((data['width'], data['height'], data['format']), (480, 640, 'JPEG'))
+        self.assertTrue(data['placeholder'].startswith('data:image/webp;base64,'))
+        image = ImageModel.objects.get(id=data['id'])
+        self.assertEqual(data['content_hash'], image.content_hash)
+
+        listed = self.client.get('/api/list/', **API_HEADERS).json()['images'][0]
+        for field in ('width', 'height', 'format', 'content_hash', 'placeholder'):
+            self.assertEqual(listed[field], data[field])
+
+    def test_duplicate_upload_shares_metadata(self):
+        first = self.client.post('/api/upload/', {'image': self.rotated_jpeg(), 'client_id': 'C1'},
+                                 **API_HEADERS).json()
+        second = self.client.post('/api/upload/', {'image': self.rotated_jpeg(), 'client_id': 'C2'},
+                                  **API_HEADERS).json()
+
+        self.assertTrue(second['deduplicated'])
+        self.assertEqual(second['placeholder'], first['placeholder'])
+        self.assertEqual((second['width'], second['height']), (480, 640))
+
+    @override_settings(IMAGE_MAX_DIMENSION=0, IMAGE_CLIENT_MAX_DIMENSIONS={'c1': 300})
+    def test_client_max_dimension_downscales_small_files_too(self):
+        upload = make_jpeg(size=(1200, 900))
+        data = self.client.post('/api/upload/', {'image': upload, 'client_id': 'C1'}, **API_HEADERS).json()
+
+        self.assertTrue(data['compressed'])
+        self.assertEqual(data['compression_info']['resized_from'], [1200, 900])
+        self.assertEqual((data['width'], data['height']), (300, 225))
+        self.assertEqual((data['original_width'], data['original_height']), (1200, 900))
+        image = ImageModel.objects.get(id=data['id'])
+        with Image.open(os.path.join(self.media_root, image.image.name)) as stored:
+            self.assertEqual(stored.size, (300, 225))
+
+        # Other clients keep their dimensions
+        other = self.client.post('/api/upload/', {'image': make_jpeg(size=(1200, 900), color='red'),
+                                                  'client_id': 'C2'}, **API_HEADERS).json()
+        self.assertEqual((other['width'], other['original_width']), (1200, None))
+
+    @override_settings(IMAGE_OUTPUT_FORMAT='', IMAGE_CLIENT_OUTPUT_FORMATS={'c1': 'WEBP'})
+    def test_client_output_format_transcodes_png(self):
+        img = Image.linear_gradient('L').resize((320, 240)).convert('RGB')
+        buf = io.BytesIO()
+        img.save(buf, format='PNG')
+        upload = SimpleUploadedFile('scan.png', buf.getvalue(), content_type='image/png')
+        data = self.client.post('/api/upload/', {'image': upload, 'client_id': 'C1'}, **API_HEADERS).json()
+
+        self.assertTrue(data['compressed'])
+        self.assertEqual(data['format'], 'WEBP')
+        self.assertTrue(data['url'].endswith('.webp'))
+        image = ImageModel.objects.get(id=data['id'])
+        self.assertEqual(image.format, 'WEBP')
+        with Image.open(os.path.join(self.media_root, image.image.name)) as stored:
+            self.assertEqual((stored.format, stored.size), ('WEBP', (320, 240)))
+
+        # Other clients keep the source format
+        other = self.client.post('/api/upload/', {'image': make_jpeg(), 'client_id': 'C2'}, **API_HEADERS).json()
+        self.assertEqual(other['format'], 'JPEG')
+        self.assertFalse(other['compressed'])
+
+
+class IdempotencyTests(MediaRootTestCase):
+
+    def upload(self, key, **fields):
+        data = {'image': make_jpeg(), 'client_id': 'c1', **fields}
+        return self.client.post('/api/upload/', data, HTTP_IDEMPOTENCY_KEY=key, **API_HEADERS)
+
+    def test_retry_replays_stored_response(self):
+        first = self.upload('row-1')
+        self.assertEqual(first.status_code, 201)
+
+        retry = self.upload('row-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(ImageModel.objects.count(), 1)
+
+        other = self.upload('row-2')
+        self.assertNotEqual(other.json()['id'], first.json()['id'])
+
+    def test_replay_writes_nothing_to_storage(self):
+        images_dir = os.path.join(self.media_root, 'images')
+        with override_settings(IMAGE_STREAM_UPLOADS_TO_STORAGE=True):
+            self.assertEqual(self.upload('row-1').status_code, 201)
+            stored = sorted(os.listdir(images_dir))
+            queued = PendingFileDeletion.objects.count()
+
+            retry = self.upload('row-1')
+            self.assertEqual(retry['Idempotent-Replayed'], 'true')
+            batch = [make_jpeg(color='red', name='a.jpg')]
+            for _ in range(2):
+                response = self.client.post('/api/upload/batch/', {'images': batch, 'client_id': 'c1'},
+                                            HTTP_IDEMPOTENCY_KEY='batch-1', **API_HEADERS)
+                batch[0].seek(0)
+            self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+        self.assertEqual(len(os.listdir(images_dir)), len(stored) + 1)
+        self.assertTrue(set(stored) <= set(os.listdir(images_dir)))
+        self.assertEqual(PendingFileDeletion.objects.count(), queued)
+
+    def test_failed_request_releases_key(self):
+        response = self.upload('row-1', client_id='')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+        response = self.upload('row-1')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_partial_batch_is_not_stored(self):
+        files = [make_jpeg(), SimpleUploadedFile('notes.txt', b'not an image', content_type='text/plain')]
+        response = self.client.post('/api/upload/batch/', {'images': files, 'client_id': 'c1'},
+                                    HTTP_IDEMPOTENCY_KEY='rows-1-2', **API_HEADERS)
+        self.assertEqual(response.status_code, 207)
+        # The retry runs for real, so the failed file can still be fixed
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+    def test_key_is_scoped_by_client_and_bound_to_request(self):
+        first = self.upload('row-1')
+        self.assertEqual(IdempotencyRecord.objects.get().scope, 'C1')
+
+        # The same client, whether named in the form or in X-Client-Id, shares the key
+        retry = self.client.post('/api/upload/', {'image': make_jpeg()}, HTTP_IDEMPOTENCY_KEY='row-1',
+                                 HTTP_X_CLIENT_ID='c1', **API_HEADERS)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+
+        # Another client's key is its own
+        other = self.upload('row-1', client_id='c2')
+        self.assertEqual(other.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', other)
+
+        # The key reused for a different file
+        changed = self.client.post('/api/upload/', {'image': make_jpeg(color='red'), 'client_id': 'c1'},
+                                   HTTP_IDEMPOTENCY_KEY='row-1', **API_HEADERS)
+        self.assertEqual(changed.status_code, 422)
+        self.assertEqual(ImageModel.objects.count(), 2)
+
+    def test_request_in_flight_conflicts(self):
+        IdempotencyRecord.objects.create(key='row-1', scope='C1')
+        response = self.upload('row-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(ImageModel.objects.exists())
+
+
+class AsyncViewTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+
+    async def test_upload_list_and_stats_match_sync_views(self):
+        request = self.factory.post('/api/upload/', {'image': make_jpeg(), 'client_id': 'c1'},
+                                    headers={'Idempotency-Key': 'row-1'})
+        response = await async_views.upload_image(request)
+        self.assertEqual(response.status_code, 201)
+        uploaded = json.loads(response.content)
+
+        retry = self.factory.post('/api/upload/', {'image': make_jpeg(), 'client_id': 'c1'},
+                                  headers={'Idempotency-Key': 'row-1'})
+        response = await async_views.upload_image(retry)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(await ImageModel.objects.acount(), 1)
+
+        response = await async_views.list_images(self.factory.get('/api/list/', {'client_id': 'c1'}))
+        listed = json.loads(response.content)
+        self.assertEqual(listed['pagination']['total_count'], 1)
+        self.assertEqual(listed['images'][0]['id'], uploaded['id'])
+        sync_listed = await sync_to_async(self.client.get)('/api/list/', {'client_id': 'c1'}, **API_HEADERS)
+        self.assertEqual(listed, sync_listed.json())
+
+        response = await async_views.get_stats(self.factory.get('/api/stats/'))
+        sync_stats = await sync_to_async(self.client.get)('/api/stats/', **API_HEADERS)
+        self.assertEqual(json.loads(response.content), sync_stats.json())
+
+    async def test_invalid_list_parameter_is_400(self):
+        response = await async_views.list_images(self.factory.get('/api/list/', {'page': 'x'}))
+        self.assertEqual(response.status_code, 400)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        # Ties on every sort field and NULL names, to exercise the id tie-break
+        for i in range(7):
+            ImageModel.objects.create(
+                filename=f'img{i}.jpg', image=f'images/img{i}.jpg', original_filename=f'img{i}.jpg',
+                client_id='C1' if i % 2 else 'C2', name=None if i % 3 == 0 else f'n{i % 2}', size=100 * (i % 3),
+            )
+
+    def list(self, **params):
+        response = self.client.get('/api/list/', params, **API_HEADERS)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def walk(self, **params):
+        ids, cursor = [], None
+        while True:
+            page = self.list(pagination='cursor', page_size=2, **params, **({'cursor': cursor} if cursor else {}))
+            ids += [img['id'] for img in page['images']]
+            cursor = page['pagination']['next_cursor']
+            self.assertEqual(page['pagination']['has_next'], cursor is not None)
+            if cursor is None:
+                return ids
+
+    def test_cursor_pages_match_offset_order_for_every_sort(self):
+        for sort_by in ('-uploaded_at', 'uploaded_at', 'name', '-name', 'size', '-size', 'client_id', '-client_id'):
+            with self.subTest(sort_by=sort_by):
+                expected = [img['id'] for img in self.list(sort_by=sort_by, page_size=100)['images']]
+                self.assertEqual(len(expected), 7)
+                self.assertEqual(self.walk(sort_by=sort_by), expected)
+
+    def test_cursor_respects_filters(self):
+        expected = [img['id'] for img in self.list(client_id='C1', page_size=100)['images']]
+        self.assertEqual(self.walk(client_id='C1'), expected)
+
+    def test_count_is_optional(self):
+        pagination = self.list(pagination='cursor')['pagination']
+        self.assertNotIn('total_count', pagination)
+        pagination = self.list(pagination='cursor', include_count='true')['pagination']
+        self.assertEqual(pagination['total_count'], 7)
+
+    def test_bad_or_foreign_cursor_is_400(self):
+        cursor = self.list(pagination='cursor', page_size=2)['pagination']['next_cursor']
+        for params in ({'cursor': 'garbage'}, {'cursor': cursor, 'sort_by': 'size'}):
+            response = self.client.get('/api/list/', params, **API_HEADERS)
+            self.assertEqual(response.status_code, 400)
+
+
+class ClientIdNormalizationTests(TestCase):
+    def create(self, filename, client_id):
+        return ImageModel.objects.create(
+            filename=filename, image=f'images/{filename}', original_filename=filename, client_id=client_id, size=1,
+        )
+
+    def test_client_id_is_normalized_on_every_write(self):
+        image = self.create('a.jpg', ' client_a ')
+        self.assertEqual(image.client_id, 'CLIENT_A')
+        ImageModel.objects.bulk_create([
+            ImageModel(filename='b.jpg', image='images/b.jpg', original_filename='b.jpg', client_id='client_a', size=1)
+        ])
+        self.assertEqual(ImageModel.objects.filter(client_id='CLIENT_A').count(), 2)
+
+    def test_client_filters_match_any_case(self):
+        self.create('a.jpg', 'Client_A')
+        self.create('b.jpg', 'CLIENT_B')
+        response = self.client.get('/api/list/', {'client_id': 'client_a'}, **API_HEADERS)
+        self.assertEqual([img['filename'] for img in response.json()['images']], ['a.jpg'])
+
+        response = self.client.delete('/api/clients/client_a/delete-all/', **API_HEADERS)
+        self.assertEqual(response.json()['deleted_count'], 1)
+        self.assertEqual(list(ImageModel.objects.values_list('filename', flat=True)), ['b.jpg'])
+
+    def test_backfill_command_normalizes_old_rows_in_batches(self):
+        for i in range(5):
+            self.create(f'{i}.jpg', 'x')
+        # Rows written before normalization (update() bypasses it)
+        ImageModel.objects.filter(filename__in=['0.jpg', '3.jpg']).update(client_id=' client_a')
+        out = io.StringIO()
+        call_command('normalize_client_ids', batch_size=2, verbosity=2, stdout=out)
+        self.assertIn('Normalized client_id of 2 image(s)', out.getvalue())
+        self.assertEqual(out.getvalue().count('up to id'), 3)
+        self.assertEqual(ImageModel.objects.filter(client_id='CLIENT_A').count(), 2)
+
+    def test_migration_backfill_normalizes_old_rows(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        for i in range(3):
+            self.create(f'{i}.jpg', 'x')
+        ImageModel.objects.filter(filename__in=['0.jpg', '2.jpg']).update(client_id=' client_a')
+        migration = import_module('assets.migrations.0020_normalized_client_id')
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.normalize_existing(apps, None)
+        self.assertEqual(ImageModel.objects.filter(client_id='CLIENT_A').count(), 2)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        rows = [
+            ('beach.jpg', 'IMG_1.JPG', 'Sunset beach', None),
+            ('b.jpg', 'holiday.jpg', 'Sunset', 'Beach at dusk'),
+            ('c.jpg', 'sunset-2.jpg', None, None),
+            ('d.jpg', 'mountain.jpg', 'Mountain', 'Snow'),
+        ]
+        for filename, original, name, description in rows:
+            ImageModel.objects.create(
+                filename=filename, image=f'images/{filename}', original_filename=original,
+                client_id='C1', name=name, description=description, size=1,
+            )
+
+    def search(self, **params):
+        response = self.client.get('/api/list/', params, **API_HEADERS)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [img['filename'] for img in response.json()['images']]
+
+    def test_search_matches_any_field_case_insensitively(self):
+        for vendor_specific in (True, False):
+            with self.subTest(postgresql=vendor_specific), \
+                    mock.patch('assets.utils.image_search.is_postgresql', return_value=vendor_specific):
+                self.assertEqual(sorted(self.search(search='SUNSET')), ['b.jpg', 'beach.jpg', 'c.jpg'])
+                self.assertEqual(sorted(self.search(search='beach')), ['b.jpg', 'beach.jpg'])
+                self.assertEqual(self.search(search='snow'), ['d.jpg'])
+                self.assertEqual(self.search(search='IMG_1'), ['beach.jpg'])
+
+    def test_search_query_matches_migrated_index_expression(self):
+        from importlib import import_module
+        from .utils.image_search import filter_search, is_postgresql
+
+        if not is_postgresql():
+            self.skipTest("PostgreSQL only")
+        migration = import_module('assets.migrations.0019_image_search_trgm')
+        sql = str(filter_search(ImageModel.objects.all(), 'x').query).replace('"assets_image".', '')
+        document = migration.SEARCH_EXPRESSION[len('UPPER('):-1]
+        self.assertIn(f'UPPER({document}', sql)
+
+    def test_relevance_ranks_best_match_first(self):
+        self.assertEqual(self.search(search='sunset', sort_by='relevance')[0], 'b.jpg')
+
+    def test_relevance_rejects_cursor_pagination(self):
+        response = self.client.get('/api/list/', {'search': 'sunset', 'sort_by': 'relevance', 'pagination': 'cursor'},
+                                   **API_HEADERS)
+        self.assertEqual(response.status_code, 400)
+
+
+class UploadConfigTests(MediaRootTestCase):
+
+    @override_settings(IMAGE_MAX_UPLOAD_MB=1.5, IMAGE_MAX_DIMENSION=0, IMAGE_CLIENT_MAX_DIMENSIONS={'c1': 2048})
+    def test_config_publishes_client_targets(self):
+        response = self.client.get('/api/config/', HTTP_X_CLIENT_ID='C1', **API_HEADERS)
+        config = response.json()['config']
+
+        self.assertEqual(config['compression']['max_size_mb'], 1.5)
+        self.assertEqual(config['compression']['max_dimension'], 2048)
+        self.assertIn('.jpg', config['upload']['accepted_extensions'])
+        self.assertGreater(config['upload']['preferred_concurrency'], 0)
+        other = self.client.get('/api/config/?client_id=C2', **API_HEADERS).json()['config']
+        self.assertIsNone(other['compression']['max_dimension'])
+
+    @override_settings(IMAGE_COMPRESSION_SSIM_TARGET=0.9)
+    def test_client_encoded_compliant_upload_is_not_reencoded(self):
+        img = Image.effect_noise((400, 300), 60).convert('RGB')
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=95)
+        data = buf.getvalue()
+
+        encoded = self.client.post('/api/upload/', {
+            'image': SimpleUploadedFile('a.jpg', data, content_type='image/jpeg'), 'client_id': 'c1',
+        }, HTTP_X_CLIENT_ENCODED='true', **API_HEADERS).json()
+        self.assertFalse(encoded['compressed'])
+        self.assertEqual(encoded['size'], len(data))
+
+        # Without the header perceptual mode still re-encodes it
+        plain = self.client.post('/api/upload/', {
+            'image': SimpleUploadedFile('b.jpg', data, content_type='image/jpeg'), 'client_id': 'c1',
+        }, **API_HEADERS).json()
+        self.assertTrue(plain['compressed'])
+
+
+class BatchUploadTests(MediaRootTestCase):
+
+    def test_batch_reports_each_file_and_validates_client_once(self):
+        files = [
+            make_jpeg(color='red', name='a.jpg'),
+            make_jpeg(color='green', name='b.jpg'),
+            make_jpeg(color='red', name='a-again.jpg'),
+            SimpleUploadedFile('notes.txt', b'not an image', content_type='text/plain'),
+            SimpleUploadedFile('renamed.jpg', b'MZ\x90\x00 not an image either', content_type='image/jpeg'),
+        ]
+        metadata = json.dumps([{'name': 'A'}, {'name': 'B', 'description': 'second'}])
+
+        response = self.client.post('/api/upload/batch/', {'images': files, 'client_id': 'C1', 'metadata': metadata},
+                                    **API_HEADERS)
+
+        self.assertEqual(response.status_code, 207)
+        data = response.json()
+        self.assertEqual((data['created_count'], data['failed_count']), (3, 2))
+        self.validate.assert_called_once_with('C1')
+
+        results = data['results']
+        self.assertEqual([r['success'] for r in results], [True, True, True, False, False])
+        self.assertEqual((results[0]['name'], results[1]['description']), ('A', 'second'))
+        self.assertTrue(results[2]['deduplicated'])
+        self.assertEqual(results[0]['url'], results[2]['url'])
+        self.assertEqual((results[3]['status'], results[4]['status']), (415, 415))
+        self.assertIn('Invalid file type', results[3]['error'])
+        self.assertIn('not a supported image format', results[4]['error'])
+        self.assertEqual(ImageModel.objects.filter(client_id='C1').count(), 3)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'images'))), 2)
+
+    def test_batch_requires_files(self):
+        response = self.client.post('/api/upload/batch/', {'client_id': 'C1'}, **API_HEADERS)
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_files_are_spooled_to_disk(self):
+        from .utils import batch_upload
+
+        seen = []
+
+        def record(items, *args, **kwargs):
+            seen.extend(item.upload for item in items)
+            return original(items, *args, **kwargs)
+
+        original = batch_upload.ingest_batch
+        files = [make_jpeg(color='red', name='a.jpg'), make_jpeg(color='green', name='b.jpg')]
+        with mock.patch.object(batch_upload, 'ingest_batch', side_effect=record):
+            response = self.client.post('/api/upload/batch/', {'images': files, 'client_id': 'C1'}, **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(seen), 2)
+        self.assertFalse(any(isinstance(upload, InMemoryUploadedFile) for upload in seen))
+
+
+def put_chunk(client, url, data, offset):
+    return client.put(url, data=data, content_type='application/octet-stream',
+                      HTTP_UPLOAD_OFFSET=str(offset), **API_HEADERS)
+
+
+class ResumableUploadTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.spool_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_root, ignore_errors=True)
+        self.use_settings(IMAGE_UPLOAD_SESSION_DIR=self.spool_root)
+
+    def create_session(self, size, filename='photo.jpg'):
+        response = self.client.post('/api/upload/sessions/', data={'client_id': 'C1', 'filename': filename, 'size': size},
+                                    content_type='application/json', **API_HEADERS)
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_chunks_resume_from_reported_offset(self):
+        buf = io.BytesIO()
+        Image.effect_noise((100, 100), 50).convert('RGB').save(buf, format='JPEG')
+        payload = buf.getvalue()
+        session = self.create_session(len(payload))
+        url = session['upload_url']
+
+        self.assertEqual(put_chunk(self.client, url, payload[:1000], 0).json()['offset'], 1000)
+        # A chunk that starts past the received bytes is refused with the offset to resume from
+        response = put_chunk(self.client, url, payload[2000:], 2000)
+        self.assertEqual((response.status_code, response['Upload-Offset']), (409, '1000'))
+        # Resent overlap is skipped
+        response = put_chunk(self.client, url, payload[900:], 900)
+        self.assertEqual(response.json()['offset'], len(payload))
+
+        response = self.client.post(url + 'complete/', **API_HEADERS)
+        self.assertEqual(response.status_code, 201)
+        image = ImageModel.objects.get(id=response.json()['id'])
+        with open(os.path.join(self.media_root, image.image.name), 'rb') as fh:
+            self.assertEqual(fh.read(), payload)
+
+        # Completing again is idempotent
+        again = self.client.post(url + 'complete/', **API_HEADERS)
+        self.assertEqual((again.status_code, again.json()['id']), (200, image.id))
+
+    def test_complete_ingests_outside_the_claim_transaction(self):
+        from django.db import connection
+        from . import views
+        from .models import UploadSession
+
+        payload = make_jpeg().read()
+        session = self.create_session(len(payload))
+        url = session['upload_url']
+        put_chunk(self.client, url, payload, 0)
+        depth = len(connection.atomic_blocks)
+        seen = {}
+
+        def ingest(*args, **kwargs):
+            seen['depth'] = len(connection.atomic_blocks)
+            seen['status'] = UploadSession.objects.get(id=session['session_id']).status
+            seen['concurrent'] = self.client.post(url + 'complete/', **API_HEADERS).status_code
+            seen['chunk'] = put_chunk(self.client, url, payload, 0).status_code
+            return ingest_upload(*args, **kwargs)
+
+        ingest_upload = views.ingest_upload
+        with mock.patch.object(views, 'ingest_upload', side_effect=ingest):
+            response = self.client.post(url + 'complete/', **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(seen, {
+            'depth': depth, 'status': UploadSession.STATUS_COMPLETING, 'concurrent': 409, 'chunk': 409,
+        })
+        self.assertEqual(UploadSession.objects.get(id=session['session_id']).status, UploadSession.STATUS_COMPLETE)
+
+    def test_chunk_is_received_before_the_row_lock(self):
+        from django.db import connection
+        from .utils import upload_sessions
+
+        session = self.create_session(20)
+        url = session['upload_url']
+        depth = len(connection.atomic_blocks)
+        depths = []
+
+        def receive(*args):
+            depths.append(len(connection.atomic_blocks))
+            return receive_chunk(*args)
+
+        receive_chunk = upload_sessions.receive_chunk
+        with mock.patch.object(upload_sessions, 'receive_chunk', side_effect=receive):
+            self.assertEqual(put_chunk(self.client, url, b'a' * 10, 0).json()['offset'], 10)
+            # A chunk past the offset is refused without reading its body
+            self.assertEqual(put_chunk(self.client, url, b'b' * 5, 15).status_code, 409)
+
+        self.assertEqual(depths, [depth])
+
+    def test_bytes_received_before_a_drop_are_kept(self):
+        from django.http import UnreadablePostError
+        from .models import UploadSession
+        from .utils.upload_sessions import append_chunk
+
+        class DroppingStream(io.BytesIO):
+            def read(self, size=-1):
+                data = super().read(min(size, 100))
+                if not data:
+                    raise UnreadablePostError('connection reset')
+                return data
+
+        session = UploadSession.objects.get(id=self.create_session(1000)['session_id'])
+        append_chunk(session, DroppingStream(b'x' * 300), 1000, 0)
+
+        self.assertEqual(session.offset, 300)
+
+    def test_spool_is_reconciled_with_saved_offset(self):
+        session = self.create_session(20)
+        url = session['upload_url']
+        put_chunk(self.client, url, b'a' * 10, 0)
+        spool = os.path.join(self.spool_root, f"{session['session_id']}.part")
+
+        # A request died after writing to the spool but before its offset was saved
+        with open(spool, 'ab') as fh:
+            fh.write(b'junk')
+        response = put_chunk(self.client, url, b'b' * 10, 10)
+        self.assertEqual(response.json()['offset'], 20)
+        with open(spool, 'rb') as fh:
+            self.assertEqual(fh.read(), b'a' * 10 + b'b' * 10)
+
+        # The spool lost bytes: the offset moves back and the client is told to resend
+        with open(spool, 'r+b') as fh:
+            fh.truncate(15)
+        response = self.client.post(url + 'complete/', **API_HEADERS)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, 15))
+
+    def test_cleanup_command_removes_stale_sessions(self):
+        from django.core.management import call_command
+        from .models import UploadSession
+
+        session = self.create_session(1000)
+        put_chunk(self.client, session['upload_url'], b'x' * 10, 0)
+        spool = os.path.join(self.spool_root, f"{session['session_id']}.part")
+        self.assertTrue(os.path.exists(spool))
+
+        call_command('cleanup_upload_sessions', max_age_hours=-1, stdout=io.StringIO())
+
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(spool))
+
+
+S3_TEST_SETTINGS = {
+    'STORAGES': {
+        'default': {'BACKEND': 'assets.utils.resilient_storage.ResilientS3Storage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_STORAGE_BUCKET_NAME': 'tcb-test',
+    'AWS_S3_REGION_NAME': 'us-east-1',
+    'AWS_S3_SIGNATURE_VERSION': 's3v4',
+    'AWS_S3_CUSTOM_DOMAIN': None,
+}
+
+
+class S3StandInTestCase(TestCase):
+    """Runs against moto's in-process S3 stand-in instead of Cloudflare R2."""
+
+    def setUp(self):
+        if not MOTO_AVAILABLE:
+            self.skipTest("moto not available")
+        self.aws = mock_aws()
+        self.aws.start()
+        self.settings_override = override_settings(**S3_TEST_SETTINGS)
+        self.settings_override.enable()
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='tcb-test')
+        self.validate = stub_client_validation(self)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.aws.stop()
+
+
+class DirectUploadTests(S3StandInTestCase):
+    def init_upload(self, **extra):
+        body = {'client_id': 'C1', 'filename': 'site.jpg', **extra}
+        return self.client.post('/api/upload/init/', data=body, content_type='application/json', **API_HEADERS)
+
+    def test_init_returns_presigned_put_for_new_key(self):
+        response = self.init_upload(size=1234)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['key'].startswith('images/') and data['key'].endswith('.jpg'))
+        self.assertIn('X-Amz-Signature', data['upload_url'])
+        self.assertEqual(data['headers']['Content-Type'], 'image/jpeg')
+
+    def complete(self, data, **extra):
+        body = {'upload_token': data['upload_token'], **extra}
+        return self.client.post('/api/upload/complete/', data=body, content_type='application/json', **API_HEADERS)
+
+    @requires_pillow
+    def test_complete_ingests_stored_object(self):
+        data = self.init_upload().json()
+        payload = make_jpeg().read()
+        self.s3.put_object(Bucket='tcb-test', Key=data['key'], Body=payload, ContentType='image/jpeg')
+
+        with override_settings(IMAGE_DERIVATIVE_SIZES=''):
+            response = self.complete(data, name='Site photo')
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['width'], body['height'], body['format']), (64, 48, 'JPEG'))
+        image = ImageModel.objects.get(id=body['id'])
+        self.assertEqual((image.image.name, image.size, image.client_id), (data['key'], len(payload), 'C1'))
+        self.assertEqual(image.content_hash, hashlib.sha256(payload).hexdigest())
+
+        # Completing again returns the same image
+        again = self.complete(data)
+        self.assertEqual((again.status_code, again.json()['id']), (200, image.id))
+
+    @requires_pillow
+    def test_complete_ingests_outside_the_claim_transaction(self):
+        from django.db import connection
+        from . import views
+        from .models import DirectUpload
+
+        data = self.init_upload().json()
+        self.s3.put_object(Bucket='tcb-test', Key=data['key'], Body=make_jpeg().read(), ContentType='image/jpeg')
+        depth = len(connection.atomic_blocks)
+        seen = {}
+
+        def ingest(*args, **kwargs):
+            seen['depth'] = len(connection.atomic_blocks)
+            seen['status'] = DirectUpload.objects.get(key=data['key']).status
+            seen['concurrent'] = self.complete(data).status_code
+            return ingest_upload(*args, **kwargs)
+
+        ingest_upload = views.ingest_upload
+        with override_settings(IMAGE_DERIVATIVE_SIZES=''), mock.patch.object(views, 'ingest_upload', side_effect=ingest):
+            response = self.complete(data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(seen, {'depth': depth, 'status': DirectUpload.STATUS_COMPLETING, 'concurrent': 409})
+        self.assertEqual(DirectUpload.objects.get(key=data['key']).status, DirectUpload.STATUS_COMPLETE)
+
+    def test_complete_rejects_non_image_content(self):
+        data = self.init_upload().json()
+        self.s3.put_object(Bucket='tcb-test', Key=data['key'], Body=b'x' * 2048, ContentType='image/jpeg')
+
+        response = self.complete(data)
+
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(ImageModel.objects.exists())
+        self.assertTrue(PendingFileDeletion.objects.filter(file_path=data['key']).exists())
+
+    def test_cleanup_command_releases_uncompleted_uploads(self):
+        from .models import DirectUpload
+
+        data = self.init_upload().json()
+        self.assertTrue(DirectUpload.objects.filter(key=data['key']).exists())
+
+        call_command('cleanup_direct_uploads', max_age_hours=-1, stdout=io.StringIO())
+
+        self.assertFalse(DirectUpload.objects.exists())
+        self.assertTrue(PendingFileDeletion.objects.filter(file_path=data['key']).exists())
+        self.assertEqual(self.complete(data).status_code, 400)
+
+    def test_complete_requires_uploaded_object(self):
+        data = self.init_upload().json()
+        response = self.client.post('/api/upload/complete/', data={'upload_token': data['upload_token']},
+                                    content_type='application/json', **API_HEADERS)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ImageModel.objects.exists())
+
+    def test_tampered_token_is_rejected(self):
+        data = self.init_upload().json()
+        response = self.client.post('/api/upload/complete/', data={'upload_token': data['upload_token'] + 'x'},
+                                    content_type='application/json', **API_HEADERS)
+        self.assertEqual(response.status_code, 400)
+
+
+class S3StreamingUploadTests(S3StandInTestCase):
+    @requires_pillow
+    def test_large_upload_is_sent_as_multipart(self):
+        # Noise doesn't compress, so this stays above the 5 MiB multipart part size
+        img = Image.effect_noise((3000, 3000), 100).convert('RGB')
+        buf = io.BytesIO()
+        img.save(buf, format='PNG')
+        upload = SimpleUploadedFile('noise.png', buf.getvalue(), content_type='image/png')
+
+        with override_settings(IMAGE_STREAM_UPLOADS_TO_STORAGE=True, IMAGE_MAX_UPLOAD_MB=100):
+            response = self.client.post('/api/upload/', {'image': upload, 'client_id': 'C1'}, **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        image = ImageModel.objects.get(id=response.json()['id'])
+        head = self.s3.head_object(Bucket='tcb-test', Key=image.image.name)
+        self.assertEqual(head['ContentLength'], len(buf.getvalue()))
+        self.assertIn('-', head['ETag'])  # multipart ETags carry a part count suffix
+
+    @requires_pillow
+    def test_streamed_upload_is_processed_from_local_copy(self):
+        copies = []
+        named_temporary_file = tempfile.NamedTemporaryFile
+
+        def local_copy(*args, **kwargs):
+            copies.append(named_temporary_file(*args, **kwargs))
+            return copies[-1]
+
+        with override_settings(IMAGE_STREAM_UPLOADS_TO_STORAGE=True, IMAGE_DERIVATIVE_SIZES='100'), \
+                mock.patch('assets.utils.upload_handlers.tempfile.NamedTemporaryFile', local_copy), \
+                mock.patch('storages.backends.s3boto3.S3Boto3Storage._open',
+                           side_effect=AssertionError('downloaded the upload back')):
+            response = self.client.post('/api/upload/', {'image': make_jpeg(size=(300, 200)), 'client_id': 'C1'},
+                                        **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['width'], 300)
+        self.assertIn('100', response.json()['derivatives'])
+        # The local copy is gone once the request is done
+        self.assertEqual(len(copies), 1)
+        self.assertFalse(os.path.exists(copies[0].name))
+
+    @requires_pillow
+    def test_open_circuit_stops_streamed_upload(self):
+        from .utils import resilient_storage
+
+        resilient_storage.reset_storage_state()
+        self.addCleanup(resilient_storage.reset_storage_state)
+        breaker = resilient_storage.get_breaker()
+        for _ in range(breaker.threshold):
+            breaker.record_failure()
+
+        with override_settings(IMAGE_STREAM_UPLOADS_TO_STORAGE=True):
+            response = self.client.post('/api/upload/', {'image': make_jpeg(), 'client_id': 'C1'}, **API_HEADERS)
+
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('circuit is open', response.json()['error'])
+        self.assertNotIn('Contents', self.s3.list_objects_v2(Bucket='tcb-test'))
+        self.assertEqual(resilient_storage.storage_metrics()['operations']['stream_put']['errors'], 1)
+        self.assertFalse(ImageModel.objects.exists())
+
+
+class S3ResumableUploadTests(S3StandInTestCase):
+    def test_chunks_are_forwarded_as_multipart_parts(self):
+        payload = os.urandom(6 * 1024 * 1024)
+        chunk = 1024 * 1024
+        with override_settings(IMAGE_UPLOAD_SESSION_DIR=tempfile.mkdtemp(), IMAGE_STREAM_PART_SIZE_MB=5,
+                               IMAGE_MAX_UPLOAD_MB=100, IMAGE_DERIVATIVE_SIZES=''):
+            session = self.client.post('/api/upload/sessions/', data={'client_id': 'C1', 'filename': 'big.png',
+                                                                      'size': len(payload)},
+                                       content_type='application/json', **API_HEADERS).json()
+            for offset in range(0, len(payload), chunk):
+                put_chunk(self.client, session['upload_url'], payload[offset:offset + chunk], offset)
+
+            response = self.client.post(session['upload_url'] + 'complete/', **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        image = ImageModel.objects.get(id=response.json()['id'])
+        head = self.s3.head_object(Bucket='tcb-test', Key=image.image.name)
+        self.assertEqual(head['ContentLength'], len(payload))
+        self.assertTrue(head['ETag'].endswith('-2"'))  # one full 5 MiB part plus the tail
+
+    def test_sent_part_is_recorded_before_spool_is_truncated(self):
+        from .models import UploadSession
+
+        payload = os.urandom(6 * 1024 * 1024)
+        spool_root = tempfile.mkdtemp()
+        with override_settings(IMAGE_UPLOAD_SESSION_DIR=spool_root, IMAGE_STREAM_PART_SIZE_MB=5,
+                               IMAGE_MAX_UPLOAD_MB=100, IMAGE_DERIVATIVE_SIZES=''):
+            session = self.client.post('/api/upload/sessions/', data={'client_id': 'C1', 'filename': 'big.png',
+                                                                      'size': len(payload)},
+                                       content_type='application/json', **API_HEADERS).json()
+            url = session['upload_url']
+            put_chunk(self.client, url, payload[:5 * 1024 * 1024 + 10], 0)
+
+            row = UploadSession.objects.get(id=session['session_id'])
+            self.assertEqual([part['Size'] for part in row.s3_parts], [5 * 1024 * 1024 + 10])
+            # Spool lost after the part went out: nothing to resend
+            os.remove(os.path.join(spool_root, f"{row.id}.part"))
+            response = put_chunk(self.client, url, payload[5 * 1024 * 1024 + 10:], 5 * 1024 * 1024 + 10)
+            self.assertEqual(response.json()['offset'], len(payload))
+
+            response = self.client.post(url + 'complete/', **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        image = ImageModel.objects.get(id=response.json()['id'])
+        body = self.s3.get_object(Bucket='tcb-test', Key=image.image.name)['Body'].read()
+        self.assertEqual(body, payload)
+
+
+class DeferredCompressionTests(MediaRootTestCase):
+    settings_overrides = {'IMAGE_MAX_UPLOAD_MB': 0.05, 'IMAGE_DEFERRED_COMPRESSION': True}
+
+    def upload_noisy_jpeg(self, **extra):
+        img = Image.effect_noise((400, 400), 60).convert('RGB')
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=100)
+        upload = SimpleUploadedFile('noisy.jpg', buf.getvalue(), content_type='image/jpeg')
+        data = {'image': upload, 'client_id': 'C1', **extra}
+        return self.client.post('/api/upload/', data, **API_HEADERS), len(buf.getvalue())
+
+    def test_upload_returns_202_and_worker_swaps_stored_file(self):
+        from .utils.compression_jobs import process_compression_queue
+
+        response, original_size = self.upload_noisy_jpeg()
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual((data['compression_status'], data['size']), ('pending', original_size))
+
+        status = self.client.get(data['status_url'], **API_HEADERS).json()
+        self.assertFalse(status['optimized_ready'])
+
+        stats = process_compression_queue()
+        self.assertEqual((stats['processed'], stats['compressed']), (1, 1))
+
+        status = self.client.get(data['status_url'], **API_HEADERS).json()
+        image = ImageModel.objects.get(id=data['id'])
+        self.assertTrue(status['optimized_ready'])
+        self.assertEqual(status['url'], data['url'])
+        self.assertLess(image.size, original_size)
+        self.assertEqual(os.path.getsize(os.path.join(self.media_root, image.image.name)), image.size)
+        self.assertTrue(image.derivatives)
+
+    def test_worker_claims_image_before_processing_and_takes_over_stale_claims(self):
+        from django.utils import timezone
+        from .utils import compression_jobs
+
+        response, _ = self.upload_noisy_jpeg()
+        image_id = response.json()['id']
+        seen = []
+
+        def compress(image_obj):
+            seen.append(ImageModel.objects.get(id=image_id).compression_status)
+            ImageModel.objects.filter(id=image_id).update(compression_status='done')
+            return False
+
+        # Another worker is on it
+        ImageModel.objects.filter(id=image_id).update(
+            compression_status='processing', compression_claimed_at=timezone.now()
+        )
+        with mock.patch.object(compression_jobs, 'compress_stored_image', side_effect=compress):
+            self.assertEqual(compression_jobs.process_compression_queue()['processed'], 0)
+
+            # ... until its claim goes stale
+            with override_settings(IMAGE_COMPRESSION_CLAIM_TIMEOUT_SECONDS=-1):
+                self.assertEqual(compression_jobs.process_compression_queue()['processed'], 1)
+
+        self.assertEqual(seen, ['processing'])
+
+    def test_inline_compression_can_still_be_requested(self):
+        response, _ = self.upload_noisy_jpeg(defer_compression='false')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['compression_status'], 'none')
+        self.assertTrue(response.json()['compressed'])
+
+
+@requires_pillow
+class CompressionPoolTests(SimpleTestCase):
+    def test_pool_compresses_and_renders_in_worker_process(self):
+        from .utils.compression_pool import CompressionGate, process_image
+
+        gate = CompressionGate(concurrency=1, pixel_budget=10_000_000, use_processes=True)
+        img = Image.effect_noise((400, 400), 60).convert('RGB')
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=100)
+        upload = SimpleUploadedFile('noisy.jpg', buf.getvalue(), content_type='image/jpeg')
+
+        with mock.patch('assets.utils.compression_pool._gate', gate):
+            work = process_image(
+                upload,
+                compression={'max_size_mb': 0.05, 'initial_quality': 80, 'min_quality': 30},
+                derivative_options={'sizes': [100], 'fmt': 'WEBP', 'quality': 75},
+            )
+
+        self.assertLess(work.compressed.size, len(buf.getvalue()))
+        self.assertEqual(work.compressed.compression_info, work.compression_info)
+        # The worker's output comes back as a temp file, removed once it is closed
+        hand_off = work.compressed.temporary_file_path()
+        self.assertTrue(os.path.exists(hand_off))
+        work.compressed.close()
+        self.assertFalse(os.path.exists(hand_off))
+        with Image.open(io.BytesIO(work.derivatives['100'])) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('WEBP', (100, 100)))
+
+    def test_gate_turns_away_work_over_capacity_or_budget(self):
+        from .utils.compression_pool import CompressionGate, CompressionOverloaded
+
+        gate = CompressionGate(concurrency=1, pixel_budget=1000, use_processes=False)
+        with self.assertRaises(CompressionOverloaded):
+            gate.acquire(2000, timeout=0)
+
+        gate.acquire(600, timeout=0)
+        with self.assertRaises(CompressionOverloaded):
+            gate.acquire(100, timeout=0.01)
+        gate.release(600)
+        gate.acquire(1000, timeout=0)
+
+    def test_dead_pool_process_is_an_overload_and_pool_is_rebuilt(self):
+        from concurrent.futures import Future
+        from concurrent.futures.process import BrokenProcessPool
+        from .utils.compression_pool import CompressionGate, CompressionOverloaded
+
+        broken = mock.Mock()
+        future = Future()
+        future.set_exception(BrokenProcessPool('child killed'))
+        broken.submit.return_value = future
+        gate = CompressionGate(concurrency=1, pixel_budget=0, use_processes=True)
+        gate._executor = broken
+
+        with self.assertRaises(CompressionOverloaded):
+            gate.run(make_jpeg(), 0, None, None, True, None, timeout=0)
+        # The job got a path to a spooled copy, removed afterwards
+        spooled = broken.submit.call_args[0][1]
+        self.assertIsInstance(spooled, str)
+        self.assertFalse(os.path.exists(spooled))
+        self.assertIsNone(gate._executor)
+        broken.shutdown.assert_called_once()
+        gate.acquire(0, timeout=0)
+
+
+class CompressionOverloadTests(MediaRootTestCase):
+    settings_overrides = {'IMAGE_MAX_UPLOAD_MB': 0.01, 'IMAGE_COMPRESSION_WAIT_SECONDS': 0.01}
+
+    def setUp(self):
+        from .utils.compression_pool import CompressionGate
+
+        super().setUp()
+        # One slot, held for the whole test - every upload finds the pool busy
+        self.gate = CompressionGate(concurrency=1, pixel_budget=0, use_processes=False)
+        self.gate.acquire(0, timeout=0)
+        gate_patch = mock.patch('assets.utils.compression_pool._gate', self.gate)
+        gate_patch.start()
+        self.addCleanup(gate_patch.stop)
+
+    def test_busy_pool_stores_original_uncompressed(self):
+        upload = make_jpeg(size=(800, 600))
+        response = self.client.post('/api/upload/', {'image': upload, 'client_id': 'C1'}, **API_HEADERS)
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertFalse(data['compressed'])
+        self.assertEqual((data['compression_status'], data['size']), ('none', upload.size))
+        self.assertEqual(data['derivatives'], {})
+
+    @override_settings(IMAGE_COMPRESSION_OVERLOAD_ACTION='defer')
+    def test_busy_pool_can_defer_to_compression_queue(self):
+        response = self.client.post('/api/upload/', {'image': make_jpeg(size=(800, 600)), 'client_id': 'C1'},
+                                    **API_HEADERS)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['compression_status'], 'pending')
+
+
+@override_settings(IMAGE_CLIENT_IDS_TTL_SECONDS=300, IMAGE_CLIENT_IDS_MAX_STALE_SECONDS=3600,
+                   IMAGE_CLIENT_IDS_RETRY_SECONDS=30)
+class ClientIdCacheTests(TestCase):
+    def setUp(self):
+        client_validator.reset_client_id_cache()
+        self.fetch = mock.patch.object(client_validator, 'fetch_valid_client_ids',
+                                       return_value=[' client_a ', 'Client_B']).start()
+        self.addCleanup(mock.patch.stopall)
+        self.addCleanup(client_validator.reset_client_id_cache)
+
+    def at(self, seconds_from_now):
+        return mock.patch.object(client_validator.time, 'time', return_value=time.time() + seconds_from_now)
+
+    def test_normalized_set_is_fetched_once_within_ttl(self):
+        self.assertEqual(client_validator.validate_client_id('CLIENT_A'), (True, None))
+        self.assertFalse(client_validator.validate_client_id('client_c')[0])
+        self.assertEqual(client_validator.get_valid_client_ids(), frozenset({'CLIENT_A', 'CLIENT_B'}))
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_stale_list_is_served_while_refreshing_in_background(self):
+        client_validator.get_valid_client_ids()
+        self.fetch.return_value = ['CLIENT_C']
+        with self.at(400):
+            self.assertIn('CLIENT_A', client_validator.get_valid_client_ids())
+            client_validator._refresh_thread.join(5)
+            self.assertEqual(client_validator.get_valid_client_ids(), frozenset({'CLIENT_C'}))
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_list_fetched_by_another_worker_is_shared_through_cache(self):
+        client_validator.get_valid_client_ids()
+        # A fresh process only has the Django cache
+        client_validator._snapshot = None
+        self.assertIn('CLIENT_B', client_validator.get_valid_client_ids())
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_failed_fetch_is_not_cached(self):
+        self.fetch.return_value = None
+        self.assertEqual(client_validator.validate_client_id('anything'), (True, None))
+        client_validator.validate_client_id('anything')
+        self.assertEqual(self.fetch.call_count, 1)
+
+        self.fetch.return_value = ['CLIENT_A']
+        with self.at(60):
+            self.assertFalse(client_validator.validate_client_id('anything')[0])
+        self.assertEqual(self.fetch.call_count, 2)
+
+
+class _FakeClientIdApi(BaseHTTPRequestHandler):
+    """Local stand-in for the activation API's client ID list."""
+    client_ids = []
+
+    def do_GET(self):
+        body = json.dumps({'client_ids': self.client_ids}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ClientRegistryTests(TestCase):
+    def setUp(self):
+        server = HTTPServer(('127.0.0.1', 0), _FakeClientIdApi)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = f'http://127.0.0.1:{server.server_port}/client-id-list/get-client-ids/'
+        client_validator.reset_client_id_cache()
+        self.addCleanup(client_validator.reset_client_id_cache)
+
+    def sync(self, client_ids, **options):
+        _FakeClientIdApi.client_ids = client_ids
+        out = io.StringIO()
+        call_command('sync_clients', url=self.url, stdout=out, **options)
+        return out.getvalue()
+
+    def test_sync_applies_only_the_difference(self):
+        output = self.sync([' client_a', 'Client_B', 'CLIENT_B'])
+        self.assertIn('2 added, 0 removed', output)
+        first_synced = ClientRegistry.objects.get(client_id='CLIENT_A').synced_at
+
+        output = self.sync(['CLIENT_A', 'client_c'])
+        self.assertIn('1 added, 1 removed', output)
+        self.assertEqual(list(ClientRegistry.objects.values_list('client_id', flat=True)), ['CLIENT_A', 'CLIENT_C'])
+        self.assertEqual(ClientRegistry.objects.get(client_id='CLIENT_A').synced_at, first_synced)
+
+    def test_empty_remote_list_needs_allow_empty(self):
+        self.sync(['CLIENT_A'])
+        with self.assertRaises(CommandError):
+            self.sync([])
+        self.assertTrue(ClientRegistry.objects.exists())
+        self.sync([], allow_empty=True)
+        self.assertFalse(ClientRegistry.objects.exists())
+
+    def test_validation_uses_registry_without_remote_calls(self):
+        self.sync(['CLIENT_A'])
+        with mock.patch.object(client_validator, 'fetch_valid_client_ids') as fetch:
+            self.assertEqual(client_validator.validate_client_id(' client_a '), (True, None))
+            self.assertFalse(client_validator.validate_client_id('client_b')[0])
+        fetch.assert_not_called()
+
+    def test_unsynced_registry_falls_back_to_remote_list(self):
+        _FakeClientIdApi.client_ids = ['CLIENT_A']
+        with override_settings(IMAGE_CLIENT_ID_API_URL=self.url):
+            self.assertEqual(client_validator.validate_client_id('client_a'), (True, None))
+            self.assertFalse(client_validator.validate_client_id('client_b')[0])
+
+
+class _FlakyStorage(Storage):
+    """Storage stand-in whose calls fail or stall as scripted."""
+
+    def __init__(self, failures=0, first_save_delay=0):
+        self.failures = failures
+        self.first_save_delay = first_save_delay
+        self.calls = 0
+        self.saved = []
+
+    def _save(self, name, content):
+        self.calls += 1
+        self.saved.append(content.read())
+        if self.calls == 1 and self.first_save_delay:
+            time.sleep(self.first_save_delay)
+            return name + '.slow'
+        if self.calls <= self.failures:
+            raise ConnectionError('connection reset')
+        return name
+
+    def delete(self, name):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError('connection reset')
+
+    def exists(self, name):
+        return False
+
+
+@override_settings(IMAGE_STORAGE_RETRIES=2, IMAGE_STORAGE_BACKOFF_MS=1, IMAGE_STORAGE_BREAKER_THRESHOLD=3,
+                   IMAGE_STORAGE_BREAKER_RESET_SECONDS=60, IMAGE_STORAGE_HEDGE_AFTER_MS=0)
+class ResilientStorageTests(SimpleTestCase):
+    def setUp(self):
+        from .utils import resilient_storage
+        self.resilient_storage = resilient_storage
+        resilient_storage.reset_storage_state()
+        self.addCleanup(resilient_storage.reset_storage_state)
+
+    def storage(self, **kwargs):
+        class Storage(self.resilient_storage.ResilientStorageMixin, _FlakyStorage):
+            hedge_saves = True
+        return Storage(**kwargs)
+
+    def test_transient_errors_are_retried_and_recorded(self):
+        storage = self.storage(failures=2)
+        self.assertEqual(storage.save('images/a.jpg', ContentFile(b'x')), 'images/a.jpg')
+        self.assertEqual(storage.calls, 3)
+
+        save = self.resilient_storage.storage_metrics()['operations']['save']
+        self.assertEqual((save['count'], save['errors']), (3, 2))
+        self.assertEqual(sum(save['buckets'].values()), 3)
+
+    def test_breaker_fails_fast_while_open(self):
+        storage = self.storage(failures=10)
+        with self.assertRaises(ConnectionError):
+            storage.delete('images/a.jpg')
+        self.assertEqual(storage.calls, 3)
+
+        with self.assertRaises(self.resilient_storage.StorageUnavailable):
+            storage.delete('images/a.jpg')
+        self.assertEqual(storage.calls, 3)
+        self.assertEqual(self.resilient_storage.storage_metrics()['circuit']['state'], 'open')
+
+    @override_settings(IMAGE_STORAGE_HEDGE_AFTER_MS=50)
+    def test_slow_save_is_hedged(self):
+        storage = self.storage(first_save_delay=1.0)
+        started = time.monotonic()
+        self.assertEqual(storage.save('images/a.jpg', ContentFile(b'xyz')), 'images/a.jpg')
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertIn('save_hedged', self.resilient_storage.storage_metrics()['operations'])
+        # Each attempt read the whole content from its own stream
+        self.assertEqual(storage.saved, [b'xyz', b'xyz'])
+
+    def test_only_network_errors_are_transient(self):
+        import errno
+
+        is_transient = self.resilient_storage.is_transient
+        self.assertTrue(is_transient(ConnectionResetError()))
+        self.assertTrue(is_transient(TimeoutError()))
+        if MOTO_AVAILABLE:
+            from botocore.exceptions import EndpointConnectionError
+            self.assertTrue(is_transient(EndpointConnectionError(endpoint_url='https://r2.example')))
+        self.assertFalse(is_transient(OSError(errno.ENOSPC, 'No space left on device')))
+        self.assertFalse(is_transient(OSError(errno.EROFS, 'Read-only file system')))
+        self.assertFalse(is_transient(PermissionError()))
+
+
+@requires_pillow
+class BoundedDecodeTests(SimpleTestCase):
+    def jpeg(self, size, **save):
+        buf = io.BytesIO()
+        Image.new('RGB', size, color='green').save(buf, format='JPEG', **save)
+        return SimpleUploadedFile('big.jpg', buf.getvalue(), content_type='image/jpeg')
+
+    def test_jpeg_is_decoded_at_reduced_scale_for_small_outputs(self):
+        from .utils.compress_image import decoded_pixels, open_image
+
+        img = open_image(self.jpeg((4000, 3000)), max_size=400)
+
+        self.assertEqual(img.size, (500, 375))
+        self.assertEqual(img.format, 'JPEG')
+        self.assertEqual(decoded_pixels('JPEG', (4000, 3000), max_size=400), 500 * 375)
+        self.assertEqual(decoded_pixels('PNG', (4000, 3000), max_size=400), 4000 * 3000)
+
+    def test_orientation_is_applied_after_reduction(self):
+        from .utils.compress_image import open_image
+
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        img = open_image(self.jpeg((1600, 800), exif=exif.tobytes()), max_size=200)
+
+        self.assertEqual(img.size, (100, 200))
+
+    def test_pixel_ceiling_refuses_full_decode(self):
+        from .utils.compress_image import compress_image_file, open_image
+
+        upload = self.jpeg((2000, 2000), quality=100)
+        self.assertIsNone(open_image(upload, max_pixels=1_000_000))
+        self.assertIs(compress_image_file(upload, max_size_mb=0.001, max_pixels=1_000_000), upload)
+        # A reduced decode that fits under the ceiling is still allowed
+        self.assertEqual(open_image(upload, max_size=200, max_pixels=1_000_000).size, (250, 250))
@@ -1,10 +1,22 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# Async versions of the hot endpoints for ASGI deployments (uvicorn)
+hot_views = async_views if getattr(settings, 'IMAGE_ASYNC_VIEWS', False) else views
 
 urlpatterns = [
-    path('upload/', views.upload_image, name='upload_image'),
-    path('list/', views.list_images, name='list_images'),
-    path('stats/', views.get_stats, name='get_stats'),
+    path('upload/', hot_views.upload_image, name='upload_image'),
+    path('upload/batch/', views.upload_image_batch, name='upload_image_batch'),
+    path('upload/sessions/', views.create_upload_session, name='create_upload_session'),
+    path('upload/sessions/<uuid:session_id>/', views.upload_session, name='upload_session'),
+    path('upload/sessions/<uuid:session_id>/complete/', views.complete_upload_session, name='complete_upload_session'),
+    path('upload/init/', views.init_direct_upload, name='init_direct_upload'),
+    path('upload/complete/', views.complete_direct_upload, name='complete_direct_upload'),
+    path('compression-status/<int:image_id>/', views.get_compression_status, name='get_compression_status'),
+    path('list/', hot_views.list_images, name='list_images'),
+    path('stats/', hot_views.get_stats, name='get_stats'),
+    path('config/', views.get_upload_config, name='get_upload_config'),
     path('update/<int:image_id>/', views.update_image, name='update_image'),
     path('delete/<int:image_id>/', views.delete_image, name='delete_image'),
     path('validate-client/', views.validate_client, name='validate_client'),
@@ -17,4 +29,5 @@ urlpatterns = [
     # Background cleanup endpoints
     path('cleanup/run/', views.cleanup_pending_deletions, name='cleanup_pending_deletions'),
     path('cleanup/stats/', views.get_deletion_queue_stats, name='get_deletion_queue_stats'),
+    path('storage/stats/', views.get_storage_stats, name='get_storage_stats'),
 ]
@@ -0,0 +1,247 @@
+"""
+Batch ingestion for /api/upload/batch/.
+
+One request carries many files, so the API-key check and client validation
+are paid once. The view turns each file into a BatchItem; this module then
+
+1. compresses and hashes every item in a thread pool (no database access;
+   the CPU-heavy part is admitted through the compression pool),
+2. resolves deduplication for the whole batch with a single query,
+3. writes all new files (and their derivatives) to storage concurrently,
+4. inserts every row with one bulk_create.
+
+A failure in one item is reported in its result and doesn't affect the rest.
+"""
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from ..models import Image, PendingFileDeletion
+from .compression_jobs import compression_options, kick_compression_worker, needs_compression
+from .compression_pool import OVERLOAD_DEFER, CompressionOverloaded, overload_action, process_image
+from .content_hash import compute_sha256
+from .derivatives import derivative_options, derivative_urls, store_derivatives
+from .image_metadata import (
+    METADATA_FIELDS, metadata_of, output_metadata, read_metadata,
+)
+
+
+class BatchItem:
+    """One file of a batch upload and everything learned about it on the way in."""
+
+    def __init__(self, index, upload, name=None, description=None):
+        self.index = index
+        self.upload = upload
+        self.original_filename = upload.name
+        self.name = name
+        self.description = description
+        self.error = None
+        self.error_status = None  # HTTP-style status of a per-item error (415 for a non-image)
+
+        self.rendered = None  # derivative bytes from the compression job
+        self.metadata = dict.fromkeys(METADATA_FIELDS)
+        self.turned_away = False  # the compression pool had no room for this item
+        self.compressed = False
+        self.compression_info = None
+        self.compression_status = Image.COMPRESSION_NONE
+        self.content_hash = None
+        self.duplicate_of = None  # existing Image or earlier BatchItem with identical bytes
+        self.unique_filename = None
+        self.stored_name = None
+        self.derivatives = {}
+        self.image = None
+
+    def result(self):
+        if self.error or self.image is None:
+            return {
+                'index': self.index,
+                'success': False,
+                'original_filename': self.original_filename,
+                'status': self.error_status or 500,
+                'error': self.error or 'Not stored',
+            }
+        image = self.image
+        return {
+            'index': self.index,
+            'success': True,
+            'id': image.id,
+            'url': image.image.url if image.image else None,
+            'filename': image.filename,
+            'original_filename': image.original_filename,
+            'name': image.name,
+            'description': image.description,
+            'size': image.size,
+            'width': image.width,
+            'height': image.height,
+            'original_width': image.original_width,
+            'original_height': image.original_height,
+            'format': image.format,
+            'content_hash': image.content_hash,
+            'placeholder': image.placeholder,
+            'derivatives': derivative_urls(image.derivatives),
+            'compressed': self.compressed,
+            'compression_info': self.compression_info,
+            'compression_status': image.compression_status,
+            'deduplicated': self.duplicate_of is not None,
+            'uploaded_at': image.uploaded_at.isoformat(),
+        }
+
+
+def _process(item, compression, derivatives):
+    """Run one item through the compression pool; False when it was turned away."""
+    try:
+        work = process_image(
+            item.upload, compression=compression, derivative_options=derivatives, placeholder=True
+        )
+    except CompressionOverloaded:
+        item.turned_away = True
+        if overload_action() == OVERLOAD_DEFER:
+            item.compression_status = Image.COMPRESSION_PENDING
+        return False
+    item.rendered = work.derivatives
+    item.metadata['placeholder'] = work.placeholder
+    if work.compressed is not None:
+        item.upload = work.compressed
+        item.compressed = True
+        item.compression_info = work.compression_info
+        item.metadata.update(output_metadata(work.compression_info))
+    return True
+
+
+def _prepare(item, compression, derivatives, defer_compression, client_encoded):
+    """Compress (unless deferred), read the metadata of and hash one item."""
+    try:
+        upload = item.upload
+        item.metadata.update(read_metadata(upload))
+        compress = needs_compression(
+            upload.size, item.metadata, compression,
+            defer_compression=defer_compression, client_encoded=client_encoded,
+        )
+        if compress and defer_compression:
+            item.compression_status = Image.COMPRESSION_PENDING
+        elif compress:
+            _process(item, compression, derivatives)
+        item.content_hash = compute_sha256(item.upload)
+    except Exception as e:
+        item.error = f'Processing failed: {e}'
+
+
+def _store(item, derivatives):
+    """Write one new item (and its derivatives) to storage."""
+    try:
+        file_ext = os.path.splitext(item.upload.name)[1].lower()
+        item.unique_filename = f"{uuid.uuid4()}{file_ext}"
+        if (
+            item.rendered is None and not item.turned_away
+            and item.compression_status != Image.COMPRESSION_PENDING
+        ):
+            _process(item, None, derivatives)
+        item.stored_name = default_storage.save(f"images/{item.unique_filename}", item.upload)
+        if item.rendered:
+            item.derivatives = store_derivatives(item.rendered, item.stored_name)
+    except Exception as e:
+        item.error = f'Storage write failed: {e}'
+    finally:
+        item.rendered = None
+
+
+def _release(items, client_id):
+    """Queue files written for `items` that never got a database row."""
+    released = [item for item in items if item.stored_name and item.duplicate_of is None]
+    PendingFileDeletion.objects.bulk_create([
+        PendingFileDeletion(file_path=item.stored_name, client_id=client_id) for item in released
+    ] + [
+        PendingFileDeletion(file_path=path, original_path=item.stored_name, client_id=client_id)
+        for item in released for path in item.derivatives.values()
+    ])
+
+
+def ingest_batch(items, client_id, defer_compression=False, max_workers=None, client_encoded=False):
+    """
+    Store every valid item of a batch and create their Image rows.
+
+    Items that already carry an error (e.g. rejected by the view) are skipped.
+    `client_encoded` is passed on to needs_compression() for every item.
+    Returns the per-file result dicts in input order.
+    """
+    max_workers = max_workers or int(getattr(settings, 'IMAGE_BATCH_UPLOAD_WORKERS', 8))
+    compression = compression_options(client_id)
+    derivatives = derivative_options()
+    derivatives = derivatives if derivatives['sizes'] else None
+    pending = [item for item in items if not item.error]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        list(pool.map(
+            lambda item: _prepare(item, compression, derivatives, defer_compression, client_encoded), pending
+        ))
+        pending = [item for item in pending if not item.error]
+
+        # Deduplicate against stored images and within the batch itself
+        existing = {}
+        hashes = {item.content_hash for item in pending}
+        for image in Image.objects.filter(content_hash__in=hashes).only(
+            'image', 'content_hash', 'compression_status', 'derivatives', *METADATA_FIELDS
+        ):
+            existing.setdefault(image.content_hash, image)
+        first_seen = {}
+        new_items = []
+        for item in pending:
+            item.duplicate_of = existing.get(item.content_hash) or first_seen.get(item.content_hash)
+            if item.duplicate_of is None:
+                first_seen[item.content_hash] = item
+                new_items.append(item)
+
+        list(pool.map(lambda item: _store(item, derivatives), new_items))
+
+    rows = []
+    for item in pending:
+        source = item.duplicate_of
+        if isinstance(source, BatchItem):
+            if source.error:
+                item.error = source.error
+                continue
+            item.compression_status = source.compression_status
+            stored_name, derivatives = source.stored_name, source.derivatives
+            item.metadata = dict(source.metadata)
+        elif source is not None:
+            item.compression_status = source.compression_status
+            stored_name, derivatives = source.image.name, source.derivatives
+            item.metadata.update({k: v for k, v in metadata_of(source).items() if v is not None})
+        elif item.error:
+            continue
+        else:
+            stored_name, derivatives = item.stored_name, item.derivatives
+
+        file_ext = os.path.splitext(item.upload.name)[1].lower()
+        item.image = Image(
+            filename=item.unique_filename or f"{uuid.uuid4()}{file_ext}",
+            image=stored_name,
+            original_filename=item.original_filename,
+            client_id=client_id,
+            name=item.name,
+            description=item.description,
+            size=item.upload.size,
+            content_hash=item.content_hash,
+            compression_status=item.compression_status,
+            derivatives=derivatives,
+            **item.metadata
+        )
+        rows.append(item.image)
+
+    try:
+        with transaction.atomic():
+            Image.objects.bulk_create(rows, batch_size=500)
+    except Exception:
+        _release(new_items, client_id)
+        raise
+
+    if any(row.compression_status == Image.COMPRESSION_PENDING for row in rows):
+        transaction.on_commit(kick_compression_worker)
+
+    for item in items:
+        item.upload.close()
+    return [item.result() for item in items]
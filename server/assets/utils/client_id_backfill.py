@@ -0,0 +1,42 @@
+"""
+Backfill of normalized (stripped, upper-case) Image.client_id values.
+
+Rows written before client IDs were normalized on save still hold the case
+the client sent, and client filters are now exact matches. This rewrites them
+in id ranges of `batch_size` rows, one short UPDATE per range, so a large
+table is never locked as a whole. Run outside a transaction, every batch
+commits on its own and an interrupted run can simply be restarted.
+"""
+from django.db.models import F
+from django.db.models.functions import Trim, Upper
+
+
+def normalize_client_ids(image_model, batch_size=1000, progress=None):
+    """
+    Normalize client_id of every `image_model` row.
+
+    Args:
+        image_model: the Image model (or its historical version in a migration)
+        batch_size: rows per UPDATE
+        progress: optional callable(last_id, updated_so_far) called after each batch
+
+    Returns:
+        int: number of rows changed
+    """
+    normalized = Upper(Trim(F('client_id')))
+    updated = 0
+    last_id = 0
+    while True:
+        ids = list(
+            image_model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return updated
+        last_id = ids[-1]
+        updated += (
+            image_model.objects.filter(id__gte=ids[0], id__lte=last_id)
+            .exclude(client_id=normalized)
+            .update(client_id=normalized)
+        )
+        if progress is not None:
+            progress(last_id, updated)
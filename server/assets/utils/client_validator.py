@@ -1,28 +1,62 @@
 """
 Client ID validation utility.
-Fetches valid client IDs from remote API and validates against them.
+Validates client IDs against the ClientRegistry table, which
+`python manage.py sync_clients` keeps in step with the remote API.
+
+Until the first sync the remote list is used directly. It is kept as a
+frozenset of normalized IDs with a TTL (IMAGE_CLIENT_IDS_TTL_SECONDS), in
+process memory and in Django's cache so all workers share one fetch (configure
+a shared CACHES backend for that). Once it expires the stale set keeps being
+served for up to IMAGE_CLIENT_IDS_MAX_STALE_SECONDS while one background thread
+per process - and one process per cache - refreshes it, so the remote API stays
+off the upload path. Only a cold start with nothing cached anywhere waits for a
+fetch, and concurrent requests then share that single fetch. A failed fetch is
+not cached; it's retried after IMAGE_CLIENT_IDS_RETRY_SECONDS.
 """
 import requests
-from functools import lru_cache
 import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from ..models import ClientRegistry, normalize_client_id
 
 logger = logging.getLogger(__name__)
 
 CLIENT_ID_API_URL = "https://activate.imcbs.com/client-id-list/get-client-ids/"
 CACHE_TIMEOUT = 300  # 5 minutes in seconds
+FETCH_TIMEOUT = 10
+CACHE_KEY = 'assets:client_ids'
+REFRESH_LOCK_KEY = 'assets:client_ids:refreshing'
+SYNC_BATCH_SIZE = 1000
+
+_lock = threading.Lock()
+# Held while a fetch is in flight in this process (single-flight)
+_refresh_lock = threading.Lock()
+_snapshot = None  # (frozenset of normalized IDs, fetched_at)
+_failed_at = 0.0
+_refresh_thread = None
 
 
-@lru_cache(maxsize=1)
-def fetch_valid_client_ids():
+def client_id_api_url():
+    return getattr(settings, 'IMAGE_CLIENT_ID_API_URL', '') or CLIENT_ID_API_URL
+
+
+def fetch_valid_client_ids(url=None):
     """
     Fetch valid client IDs from remote API.
-    Results are cached to reduce API calls.
-    
+
+    Args:
+        url: API URL (default: IMAGE_CLIENT_ID_API_URL)
+
     Returns:
-        list: List of valid client ID strings, or empty list on error
+        list: List of valid client ID strings, or None on error
     """
     try:
-        response = requests.get(CLIENT_ID_API_URL, timeout=10)
+        response = requests.get(url or client_id_api_url(), timeout=FETCH_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         client_ids = data.get('client_ids', [])
@@ -30,29 +64,180 @@ def fetch_valid_client_ids():
         return client_ids
     except requests.RequestException as e:
         logger.error(f"Failed to fetch client IDs from remote API: {e}")
-        return []
-    except (ValueError, KeyError) as e:
+        return None
+    except (ValueError, KeyError, AttributeError) as e:
         logger.error(f"Invalid response format from client ID API: {e}")
-        return []
+        return None
+
+
+def _ttl():
+    return float(getattr(settings, 'IMAGE_CLIENT_IDS_TTL_SECONDS', CACHE_TIMEOUT))
+
+
+def _max_stale():
+    return float(getattr(settings, 'IMAGE_CLIENT_IDS_MAX_STALE_SECONDS', 86400))
+
+
+def _retry_after():
+    return float(getattr(settings, 'IMAGE_CLIENT_IDS_RETRY_SECONDS', 30))
+
+
+def _shared_snapshot():
+    """The snapshot another worker stored in Django's cache, or None."""
+    try:
+        entry = cache.get(CACHE_KEY)
+    except Exception as e:
+        logger.warning(f"Could not read client IDs from cache: {e}")
+        return None
+    if not entry:
+        return None
+    return frozenset(entry['ids']), entry['fetched_at']
+
+
+def _refresh():
+    """Fetch the list and publish it locally and in Django's cache. Returns the snapshot or None."""
+    global _snapshot, _failed_at
+    client_ids = fetch_valid_client_ids()
+    if client_ids is None:
+        with _lock:
+            _failed_at = time.time()
+        return None
+
+    snapshot = (frozenset(normalize_client_id(cid) for cid in client_ids), time.time())
+    try:
+        cache.set(CACHE_KEY, {'ids': sorted(snapshot[0]), 'fetched_at': snapshot[1]},
+                  timeout=_ttl() + _max_stale())
+    except Exception as e:
+        logger.warning(f"Could not store client IDs in cache: {e}")
+    with _lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+def _recently_failed(now):
+    return now - _failed_at < _retry_after()
+
+
+def _refresh_in_background(now):
+    """Start a refresh thread unless a refresh is already running here or in another worker."""
+    global _refresh_thread
+    if _recently_failed(now) or not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        claimed = cache.add(REFRESH_LOCK_KEY, True, timeout=FETCH_TIMEOUT + 5)
+    except Exception:
+        claimed = True
+    if not claimed:
+        # Another worker is refreshing; its result reaches us through the cache
+        _refresh_lock.release()
+        return
+
+    def run():
+        try:
+            _refresh()
+        finally:
+            try:
+                cache.delete(REFRESH_LOCK_KEY)
+            except Exception:
+                pass
+            _refresh_lock.release()
+
+    _refresh_thread = threading.Thread(target=run, name='client-id-refresh', daemon=True)
+    _refresh_thread.start()
+
+
+def _refresh_now():
+    """Cold start: fetch, or wait for the fetch already in flight in this process."""
+    with _refresh_lock:
+        now = time.time()
+        snapshot = _snapshot
+        if snapshot is not None and now - snapshot[1] < _ttl():
+            # Fetched by the request we waited for
+            return snapshot[0]
+        if _recently_failed(now):
+            return None
+        snapshot = _refresh()
+        return snapshot[0] if snapshot else None
+
+
+def get_valid_client_ids():
+    """
+    Normalized valid client IDs.
+
+    Returns:
+        frozenset, or None if the list couldn't be fetched yet
+    """
+    global _snapshot
+    now = time.time()
+    snapshot = _snapshot
+    if snapshot is None or now - snapshot[1] >= _ttl():
+        shared = _shared_snapshot()
+        if shared is not None and (snapshot is None or shared[1] > snapshot[1]):
+            with _lock:
+                _snapshot = snapshot = shared
+
+    if snapshot is not None:
+        age = now - snapshot[1]
+        if age < _ttl():
+            return snapshot[0]
+        if age < _ttl() + _max_stale():
+            _refresh_in_background(now)
+            return snapshot[0]
+
+    return _refresh_now()
+
+
+def reset_client_id_cache():
+    """Forget the cached list in this process and in Django's cache."""
+    global _snapshot, _failed_at
+    with _lock:
+        _snapshot = None
+        _failed_at = 0.0
+    cache.delete_many([CACHE_KEY, REFRESH_LOCK_KEY])
+
+
+def sync_client_registry(client_ids):
+    """
+    Make ClientRegistry hold exactly `client_ids` (normalized).
+
+    Only the difference is written: new IDs are bulk-inserted, vanished ones deleted.
+
+    Returns:
+        tuple: (added, removed) counts
+    """
+    max_length = ClientRegistry._meta.get_field('client_id').max_length
+    wanted = {normalize_client_id(cid) for cid in client_ids}
+    wanted = {cid for cid in wanted if cid and len(cid) <= max_length}
+    with transaction.atomic():
+        existing = set(ClientRegistry.objects.values_list('client_id', flat=True))
+        added = sorted(wanted - existing)
+        removed = sorted(existing - wanted)
+        ClientRegistry.objects.bulk_create(
+            [ClientRegistry(client_id=cid) for cid in added], batch_size=SYNC_BATCH_SIZE, ignore_conflicts=True
+        )
+        for start in range(0, len(removed), SYNC_BATCH_SIZE):
+            ClientRegistry.objects.filter(client_id__in=removed[start:start + SYNC_BATCH_SIZE]).delete()
+    return len(added), len(removed)
 
 
 def validate_client_id(client_id):
     if not client_id:
         return False, "Client ID is required"
 
-    valid_ids = fetch_valid_client_ids()
+    normalized = normalize_client_id(client_id)
+    if ClientRegistry.objects.filter(client_id=normalized).exists():
+        return True, None
+    if ClientRegistry.objects.exists():
+        return False, f"Invalid client ID. Client ID '{client_id}' is not registered."
+
+    # Registry not synced yet - fall back to the remote list
+    valid_ids = get_valid_client_ids()
 
     if not valid_ids:
         logger.warning("Could not fetch valid client IDs, allowing upload")
         return True, None
 
-    def normalize(cid):
-        return str(cid).strip().upper()
-
-    valid_ids_set = {normalize(vid) for vid in valid_ids}
-
-    if normalize(client_id) in valid_ids_set:
+    if normalized in valid_ids:
         return True, None
 
     return False, f"Invalid client ID. Client ID '{client_id}' is not registered."
-
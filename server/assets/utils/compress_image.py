@@ -1,37 +1,375 @@
 import io
+import math
 import os
-from django.core.files.base import ContentFile
+import tempfile
+from django.core.files import File
 
 try:
-    from PIL import Image, ImageOps
+    from PIL import Image, ImageMath, ImageOps, features
     PIL_AVAILABLE = True
 except Exception:
     PIL_AVAILABLE = False
 
 
+# Downscaled trial encodes used to seed the quality search are capped at this many pixels
+TRIAL_MAX_PIXELS = 256 * 256
+# Full-resolution encodes the quality search may spend before settling
+MAX_FULL_ENCODES = 3
+# A fitting encode within this fraction of the target size is considered close enough
+TARGET_TOLERANCE = 0.10
+# Perceptual mode compares encodes of a copy downscaled to at most this many pixels
+SSIM_MAX_PIXELS = 256 * 256
+# SSIM is computed per SSIM_BLOCK x SSIM_BLOCK block and averaged
+SSIM_BLOCK = 8
+_SSIM_C1 = (0.01 * 255) ** 2
+_SSIM_C2 = (0.03 * 255) ** 2
+# EXIF orientation tag, and the orientations that swap width and height (90/270 degrees)
+ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = frozenset({5, 6, 7, 8})
+# Encoded output stays in memory up to this size, then spills to a temp file on disk
+SPOOL_MAX_BYTES = 4 * 1024 * 1024
+# File extension written for each output format
+FORMAT_EXTENSIONS = {'WEBP': '.webp', 'JPEG': '.jpg', 'PNG': '.png', 'AVIF': '.avif'}
+# Formats encoded with a quality search (everything else is encoded losslessly)
+LOSSY_FORMATS = ('JPEG', 'WEBP', 'AVIF')
+# Still-image sources that may be transcoded to an output format profile
+TRANSCODABLE_FORMATS = ('JPEG', 'PNG', 'WEBP', 'BMP', 'TIFF', 'GIF')
+
+
+class EncodeBuffer(tempfile.SpooledTemporaryFile):
+    """
+    Encoder output buffer that is handed to storage as-is.
+
+    Pillow asks its output for fileno() to write through the OS, which would
+    make a plain SpooledTemporaryFile roll over to disk on every encode; the
+    in-memory phase reports no fileno so small encodes never touch disk.
+    """
+
+    def __init__(self, max_size=SPOOL_MAX_BYTES):
+        super().__init__(max_size=max_size)
+
+    def fileno(self):
+        if not self._rolled:
+            raise io.UnsupportedOperation('fileno')
+        return super().fileno()
+
+
+def supported_output_format(fmt):
+    """
+    `fmt` (WEBP or AVIF) if this Pillow build can encode it, else the nearest
+    format it can (AVIF falls back to WEBP), else None.
+    """
+    fmt = (fmt or '').upper()
+    if not PIL_AVAILABLE or fmt not in ('WEBP', 'AVIF'):
+        return None
+    if fmt == 'AVIF' and not features.check('avif'):
+        fmt = 'WEBP'
+    return fmt if features.check('webp') else None
+
+
 def _has_alpha(img):
     return img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
 
 
-def compress_image_file(uploaded_file, max_size_mb=1.0, initial_quality=80, min_quality=45):
-    """Compress a Django uploaded file if it's larger than `max_size_mb`.
+class _SizeModel:
+    """
+    Log-linear model of encoded size vs. quality: ln(size) = intercept + slope * quality.
+
+    Seeded from two encodes of a downscaled trial image (scaled up by the pixel
+    ratio), then re-anchored on every full-resolution encode.
+    """
+
+    def __init__(self, q_lo, size_lo, q_hi, size_hi):
+        size_lo, size_hi = max(size_lo, 1), max(size_hi, 1)
+        if q_hi > q_lo and size_hi > size_lo:
+            self.slope = (math.log(size_hi) - math.log(size_lo)) / (q_hi - q_lo)
+        else:
+            self.slope = 0.02  # ~2% per quality step, a typical JPEG/WEBP curve
+        self.intercept = math.log(size_hi) - self.slope * q_hi
+
+    def anchor(self, quality, size):
+        """Shift the curve so it passes through an observed full encode."""
+        self.intercept = math.log(max(size, 1)) - self.slope * quality
+
+    def quality_for(self, target_bytes):
+        return (math.log(max(target_bytes, 1)) - self.intercept) / self.slope
+
+
+def _encode(img, buffer, save_kwargs, quality):
+    buffer.seek(0)
+    buffer.truncate(0)
+    img.save(buffer, **dict(save_kwargs, quality=quality))
+    return buffer.tell()
+
+
+def _search_quality(img, save_kwargs, max_bytes, initial_quality, min_quality, spool_max_bytes=SPOOL_MAX_BYTES):
+    """
+    Find the highest quality in [min_quality, initial_quality] whose encode fits `max_bytes`.
+
+    A downscaled trial encode at both ends of the range seeds a size model that
+    picks the first full encode; later picks interpolate on the re-anchored model
+    and fall back to bisection of the remaining bracket. This typically settles
+    in 2-3 full encodes instead of stepping down 10 quality points at a time.
+
+    Returns: (buffer, quality, stats) where the buffer holds the chosen encode.
+    If nothing fits, the min_quality encode is returned; it is made within the
+    MAX_FULL_ENCODES budget (as the last encode if nothing fit before).
+    """
+    stats = {'trial_encodes': 0, 'full_encodes': 0}
+
+    # Seed: encode a small copy at both ends of the quality range
+    full_pixels = img.width * img.height
+    scale = min(1.0, math.sqrt(TRIAL_MAX_PIXELS / float(full_pixels)))
+    if scale < 1.0:
+        trial = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.BILINEAR)
+    else:
+        trial = img
+    pixel_ratio = full_pixels / float(trial.width * trial.height)
+    trial_buffer = io.BytesIO()
+    size_lo = _encode(trial, trial_buffer, save_kwargs, min_quality) * pixel_ratio
+    size_hi = _encode(trial, trial_buffer, save_kwargs, initial_quality) * pixel_ratio
+    stats['trial_encodes'] = 2
+    model = _SizeModel(min_quality, size_lo, initial_quality, size_hi)
+
+    best = None           # (quality, buffer) of the highest quality known to fit
+    fits_below = None     # highest quality known to fit
+    too_big_from = initial_quality + 1  # lowest quality known to be too big
+    work = EncodeBuffer(spool_max_bytes)
+    quality = int(round(model.quality_for(max_bytes)))
+
+    while stats['full_encodes'] < MAX_FULL_ENCODES:
+        low = fits_below + 1 if fits_below is not None else min_quality
+        high = too_big_from - 1
+        if low > high:
+            break
+        # Re-anchoring on the last encode always moves the estimate towards the
+        # unexplored side, so clamping into the open bracket keeps making progress
+        quality = min(max(quality, low), high)
+        if best is None and stats['full_encodes'] == MAX_FULL_ENCODES - 1:
+            # Last encode of the budget and nothing fits yet - make the smallest one
+            quality = min_quality
+
+        size = _encode(img, work, save_kwargs, quality)
+        stats['full_encodes'] += 1
+        model.anchor(quality, size)
+
+        if size <= max_bytes:
+            fits_below = quality
+            best, work = (quality, work), (best[1] if best else EncodeBuffer(spool_max_bytes))
+            if size >= max_bytes * (1 - TARGET_TOLERANCE):
+                break
+        else:
+            too_big_from = quality
+            if quality == min_quality:
+                # Nothing in range fits - keep the smallest encode we can make
+                best, work = (quality, work), None
+                break
+
+        quality = int(round(model.quality_for(max_bytes * (1 - TARGET_TOLERANCE / 2))))
+
+    quality, buffer = best
+    if work is not None:
+        work.close()
+    buffer.seek(0, io.SEEK_END)
+    stats['quality'] = quality
+    return buffer, quality, stats
+
+
+def _luma(img):
+    """32-bit float luma of `img`, the input of ssim()."""
+    return img.convert('L').convert('F')
+
+
+def ssim(reference, candidate):
+    """
+    Mean SSIM of two same-size luma images (see _luma) over SSIM_BLOCK px blocks.
+
+    Block means come from reduce(), so everything runs inside Pillow.
+    """
+    mx, my = reference.reduce(SSIM_BLOCK), candidate.reduce(SSIM_BLOCK)
+    sxx = ImageMath.lambda_eval(lambda a: a['x'] * a['x'], x=reference).reduce(SSIM_BLOCK)
+    syy = ImageMath.lambda_eval(lambda a: a['y'] * a['y'], y=candidate).reduce(SSIM_BLOCK)
+    sxy = ImageMath.lambda_eval(lambda a: a['x'] * a['y'], x=reference, y=candidate).reduce(SSIM_BLOCK)
+    scores = ImageMath.lambda_eval(
+        lambda a: ((a['mx'] * a['my'] * 2 + _SSIM_C1) * ((a['sxy'] - a['mx'] * a['my']) * 2 + _SSIM_C2))
+        / ((a['mx'] * a['mx'] + a['my'] * a['my'] + _SSIM_C1)
+           * (a['sxx'] - a['mx'] * a['mx'] + a['syy'] - a['my'] * a['my'] + _SSIM_C2)),
+        mx=mx, my=my, sxx=sxx, syy=syy, sxy=sxy,
+    )
+    # ImageStat doesn't handle float images; a 1x1 box resize is the mean
+    return scores.resize((1, 1), Image.BOX).getpixel((0, 0))
+
+
+class _SsimProbe:
+    """Scores encodes of a downscaled copy of `img` against that copy, memoized per quality."""
+
+    def __init__(self, img, save_kwargs):
+        scale = min(1.0, math.sqrt(SSIM_MAX_PIXELS / float(img.width * img.height)))
+        size = (max(SSIM_BLOCK, int(img.width * scale)), max(SSIM_BLOCK, int(img.height * scale)))
+        self.sample = img.resize(size, Image.BILINEAR) if size != img.size else img
+        self.reference = _luma(self.sample)
+        self.save_kwargs = save_kwargs
+        self.scores = {}
+
+    def score(self, quality):
+        if quality not in self.scores:
+            buffer = io.BytesIO()
+            _encode(self.sample, buffer, self.save_kwargs, quality)
+            buffer.seek(0)
+            with Image.open(buffer) as encoded:
+                self.scores[quality] = ssim(self.reference, _luma(encoded))
+        return self.scores[quality]
+
+    def lowest_quality(self, min_quality, max_quality, target):
+        """Lowest quality in [min_quality, max_quality] scoring at least `target` (bisection)."""
+        low, high = min_quality, max_quality
+        while low < high:
+            mid = (low + high) // 2
+            if self.score(mid) >= target:
+                high = mid
+            else:
+                low = mid + 1
+        return high
+
+
+def probe_image(file_obj):
+    """(format, (width, height)) of `file_obj` read from its header (nothing is decoded), or None."""
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        file_obj.seek(0)
+        with Image.open(file_obj) as img:
+            header = img.format, img.size
+        file_obj.seek(0)
+        return header
+    except Exception:
+        return None
+
+
+def _fit_size(size, max_size):
+    """`size` scaled down (never up) to fit inside a max_size x max_size box."""
+    width, height = size
+    scale = min(1.0, max_size / float(max(width, height)))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def decoded_pixels(fmt, size, max_size=None):
+    """
+    Peak pixels open_image() holds for an image of `fmt` and `size` decoded for `max_size`.
+
+    Only JPEGs can be decoded at a reduced scale, and only by whole factors, so
+    the result may be up to twice the requested box on each side.
+    """
+    width, height = size
+    if max_size and fmt == 'JPEG':
+        fit_w, fit_h = _fit_size(size, max_size)
+        factor = max(1, min(width // fit_w, height // fit_h, 8))
+        width, height = math.ceil(width / factor), math.ceil(height / factor)
+    return width * height
+
+
+def open_image(file_obj, max_size=None, max_pixels=None):
+    """Decode `file_obj` with its EXIF orientation applied.
+
+    The result can be shared by compress_image_file() and derivative generation
+    so an upload is only decoded once. Animated images are returned as opened.
+
+    Options:
+      - max_size: longest edge (px) the caller needs. JPEGs are then decoded at
+        1/2, 1/4 or 1/8 scale by libjpeg (draft mode) and other formats are
+        shrunk with reduce() right after decoding, so only the pixels the
+        output needs are kept. The result may still be larger than max_size.
+      - max_pixels: refuse to decode anything that would hold more pixels.
+
+    The returned image carries `.source_size`: the full-resolution (width,
+    height) with EXIF orientation applied, even when it was decoded reduced.
+    Returns None if Pillow is missing, the file isn't a readable image or it
+    exceeds `max_pixels`.
+    """
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        file_obj.seek(0)
+        img = Image.open(file_obj)
+        if getattr(img, "is_animated", False):
+            return img
+        source_format = img.format
+        source_size = img.size
+        if img.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+            source_size = source_size[::-1]
+
+        if max_size and img.format == 'JPEG':
+            # Let libjpeg skip DCT coefficients instead of decoding every pixel
+            img.draft(img.mode, _fit_size(img.size, max_size))
+        # Non-JPEG formats decode at full size before reduce() can shrink them
+        if max_pixels and img.width * img.height > max_pixels:
+            # Not img.close(): that would close the caller's file as well
+            return None
+
+        img.load()
+        if max_size:
+            fit_w, fit_h = _fit_size(img.size, max_size)
+            factor = min(img.width // fit_w, img.height // fit_h)
+            if factor >= 2:
+                img = img.reduce(factor)
+        try:
+            # Many phones store orientation in EXIF instead of rotating pixel data.
+            # In place, so an upright image isn't copied and a rotated one is only
+            # held twice for the duration of the transpose.
+            ImageOps.exif_transpose(img, in_place=True)
+        except Exception:
+            pass
+        # reduce() drops .format; keep it for format-preserving encodes
+        img.format = source_format
+        img.source_size = source_size
+        return img
+    except Exception:
+        return None
+
+
+def compress_image_file(uploaded_file, max_size_mb=1.0, initial_quality=80, min_quality=45, image=None,
+                        max_pixels=None, spool_max_bytes=SPOOL_MAX_BYTES, max_dimension=None,
+                        ssim_target=None, output_format=None):
+    """Compress a Django uploaded file if it's larger than `max_size_mb` (or than `max_dimension`).
 
     Options:
       - initial_quality: 0..1 or 1..100 initial quality for lossy formats (JPEG/WEBP)
       - min_quality: 0..1 or 1..100 minimum quality to try before giving up
       - max_size_mb: try to compress to be under this size (in MB)
-
-    Note: This function preserves the original image dimensions (no resizing), and only
-    changes encoding quality to reduce file size. It preserves the original image
-    format/extension (JPEG, PNG, WEBP) when possible and will NOT convert formats.
-
-    Returns: the original uploaded file (unchanged) or a Django `ContentFile` with
-    `.name` and `.size` containing compressed data.
+      - image: already decoded PIL image of `uploaded_file` (from open_image) to
+        avoid decoding it again
+      - max_pixels: leave images with more pixels than this uncompressed instead
+        of decoding them
+      - spool_max_bytes: encoded output above this size is spooled to a temp file
+        instead of memory
+      - max_dimension: downscale images whose longest edge exceeds this many px
+        (LANCZOS) before encoding, whatever their file size. When `image` is
+        given it may already be reduced (open_image(max_size=max_dimension)).
+      - ssim_target: perceptual mode for JPEG/WEBP - encode at the lowest quality
+        (down to min_quality) whose SSIM against the source, measured on a
+        downscaled copy, stays at or above this (e.g. 0.98), whatever the file
+        size. The byte-size search then only runs below that quality.
+      - output_format: transcode still images (JPEG/PNG/WEBP/BMP/TIFF/GIF) to
+        WEBP or AVIF (see supported_output_format), whatever their file size.
+        The returned File gets the extension of the new format.
+
+    Note: Without `max_dimension` this function preserves the original image dimensions
+    (no resizing), and only changes encoding quality to reduce file size. Without
+    `output_format` it preserves the original image format/extension (JPEG, PNG, WEBP)
+    and will NOT convert formats.
+
+    Returns: the original uploaded file (unchanged) or a Django `File` with
+    `.name` and `.size` wrapping the encoder's output buffer (an EncodeBuffer,
+    not a copy of it). The File also carries `.compression_info` (format,
+    chosen quality, number of trial/full encodes, output width/height,
+    `resized_from` - the original [width, height] when it was downscaled - and
+    in perceptual mode `ssim` of the chosen quality and `ssim_target`).
 
     Behavior:
       - Skips compression when Pillow is not available.
-      - Skips animated GIFs and unsupported formats.
-      - If compression doesn't produce a smaller file, the original file is returned.
+      - Skips animated GIFs, unsupported formats and images over `max_pixels`.
+      - If compression doesn't produce a smaller file, the original file is returned
+        (a downscaled image is always returned).
     """
     if not PIL_AVAILABLE:
         return uploaded_file
@@ -54,20 +392,19 @@ def compress_image_file(uploaded_file, max_size_mb=1.0, initial_quality=80, min_
     try:
         # If already under threshold, return original
         max_bytes = int(max_size_mb * 1024 * 1024)
-        if uploaded_file.size <= max_bytes:
+        if uploaded_file.size <= max_bytes and not max_dimension and not ssim_target and not output_format:
             return uploaded_file
 
-        # Open image
-        uploaded_file.seek(0)
-        img = Image.open(uploaded_file)
+        # Open image (EXIF orientation applied) unless the caller already decoded it
+        if image is None:
+            image = open_image(uploaded_file, max_size=max_dimension, max_pixels=max_pixels)
+        img = image
+        if img is None:
+            return uploaded_file
 
-        # Apply EXIF-based transpose so images appear with the correct orientation
-        # (many phones store orientation in EXIF instead of rotating pixel data)
-        try:
-            img = ImageOps.exif_transpose(img)
-        except Exception:
-            # If EXIF data is missing or transformation fails, continue with original image
-            pass
+        # Dimensions of the original (a reduced decode still knows them)
+        source_size = getattr(img, 'source_size', img.size)
+        resize = bool(max_dimension) and max(source_size) > max_dimension
 
         # Skip animated GIFs (Pillow may raise for n_frames)
         if getattr(img, "is_animated", False) and img.format == "GIF":
@@ -81,46 +418,69 @@ def compress_image_file(uploaded_file, max_size_mb=1.0, initial_quality=80, min_
             ext_map = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP', 'bmp': 'BMP', 'tif': 'TIFF', 'tiff': 'TIFF'}
             original_format = ext_map.get(ext, '')
 
+        target_format = supported_output_format(output_format)
+        transcode = bool(target_format) and target_format != original_format and original_format in TRANSCODABLE_FORMATS
+
         # Only attempt compression for formats we support without converting
-        if original_format not in ('JPEG', 'PNG', 'WEBP'):
+        if original_format not in ('JPEG', 'PNG', 'WEBP') and not transcode:
             # If format isn't handled for safe compression, leave original file unchanged
             return uploaded_file
 
-        out_format = original_format
-        out_ext = os.path.splitext(uploaded_file.name)[1].lower() or ('.' + out_format.lower())
+        if transcode:
+            out_format = target_format
+            out_ext = FORMAT_EXTENSIONS[out_format]
+        else:
+            out_format = original_format
+            out_ext = os.path.splitext(uploaded_file.name)[1].lower() or ('.' + out_format.lower())
 
         # Special-case: BMP/TIFF are not useful to compress lossily here — skip
         if out_format in ('BMP', 'TIFF'):
             return uploaded_file
 
-        buffer = io.BytesIO()
+        perceptual = bool(ssim_target) and out_format in LOSSY_FORMATS
+        if uploaded_file.size <= max_bytes and not resize and not perceptual and not transcode:
+            return uploaded_file
+
+        compression_info = {'format': out_format, 'target_bytes': max_bytes}
+        if resize:
+            # High-quality downscale before encoding - saves far more bytes (and encode
+            # time) than lowering the quality of a needlessly large image
+            img = img.resize(_fit_size(img.size, max_dimension), Image.LANCZOS, reducing_gap=3.0)
+            compression_info['resized_from'] = list(source_size)
+        compression_info['width'], compression_info['height'] = img.size
 
-        if out_format in ('JPEG', 'WEBP'):
+        if out_format in LOSSY_FORMATS:
             # Ensure correct mode for JPEG
             if out_format == 'JPEG' and img.mode in ("RGBA", "LA", "P"):
                 img = img.convert("RGB")
+            elif out_format != 'JPEG' and img.mode not in ("RGB", "RGBA"):
+                # WEBP/AVIF encode RGB(A) only (a transcoded PNG/GIF may be P, L or LA)
+                img = img.convert("RGBA" if _has_alpha(img) else "RGB")
 
-            quality = initial_quality
-            min_q = min_quality
-            step = 10
-
-            save_kwargs = {"format": out_format, "quality": quality}
+            save_kwargs = {"format": out_format}
             if out_format == 'WEBP':
                 save_kwargs["method"] = 6
 
-            img.save(buffer, **save_kwargs)
-
-            # Reduce quality until under target size or hit min_quality
-            while buffer.tell() > max_bytes and quality > min_q:
-                quality = max(min_q, quality - step)
-                buffer.seek(0)
-                buffer.truncate(0)
-                save_kwargs["quality"] = quality
-                img.save(buffer, **save_kwargs)
+            max_quality = initial_quality
+            if perceptual:
+                # No higher quality than the eye needs, then the size target below that
+                probe = _SsimProbe(img, save_kwargs)
+                max_quality = probe.lowest_quality(min(min_quality, initial_quality), initial_quality, ssim_target)
+                compression_info['ssim_target'] = ssim_target
+                compression_info['ssim_trial_encodes'] = len(probe.scores)
+
+            # Search for the highest quality that fits instead of stepping down 10 at a time
+            buffer, quality, search_stats = _search_quality(
+                img, save_kwargs, max_bytes, max_quality, min(min_quality, max_quality), spool_max_bytes
+            )
+            compression_info.update(search_stats)
+            if perceptual:
+                compression_info['ssim'] = round(probe.score(quality), 4)
 
         elif out_format == 'PNG':
             # Try PNG with optimization and high compression level
             # If image has alpha, avoid quantize as it may remove alpha information
+            buffer = EncodeBuffer(spool_max_bytes)
             try_levels = [9]  # compress_level values (Pillow uses 'compress_level' 0-9)
             saved_ok = False
             for level in try_levels:
@@ -157,17 +517,18 @@ def compress_image_file(uploaded_file, max_size_mb=1.0, initial_quality=80, min_
             # No additional loops here
 
         # If compression didn't help, keep original
-        if buffer.tell() == 0 or buffer.tell() >= uploaded_file.size:
+        size = buffer.tell()
+        if size == 0 or (size >= uploaded_file.size and not resize):
+            buffer.close()
             return uploaded_file
 
-        # Build a ContentFile (Django) to emulate uploaded file and preserve the original extension
+        # Hand the encoder's buffer on as a Django File (no copy); the extension follows the output format
         buffer.seek(0)
-        new_content = buffer.read()
         base_name = os.path.splitext(uploaded_file.name)[0]
-        new_name = base_name + out_ext
-        content_file = ContentFile(new_content)
-        content_file.name = new_name
-        content_file.size = len(new_content)
+        content_file = File(buffer, name=base_name + out_ext)
+        content_file.size = size
+        compression_info['size'] = size
+        content_file.compression_info = compression_info
 
         return content_file
 
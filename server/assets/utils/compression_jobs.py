@@ -0,0 +1,249 @@
+"""
+Deferred server-side compression.
+
+With deferred compression an upload stores the original bytes immediately and
+marks the Image row `compression_status='pending'`. The queue is processed off
+the request path - by the `process_compression_queue` management command
+(cron / long-running loop) or, with IMAGE_DEFERRED_COMPRESSION_WORKER='thread',
+by a single background thread in the web process.
+
+A processed file is recompressed and written back under the same storage key,
+so URLs handed out at upload time stay valid.
+
+A worker claims an image by marking it 'processing' in a short transaction
+and does the download, encode and upload outside of it, so no row lock or
+transaction is held across storage I/O. A claim left behind by a crashed
+worker is taken over after IMAGE_COMPRESSION_CLAIM_TIMEOUT_SECONDS.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import Image, PendingFileDeletion
+from .compress_image import compress_image_file, open_image, supported_output_format
+from .compression_pool import max_decode_pixels
+from .content_hash import compute_sha256
+from .derivatives import derivative_sizes, generate_derivatives
+from .image_metadata import (
+    PLACEHOLDER_SIZE, exceeds_max_dimension, needs_transcode, output_metadata, read_metadata, render_placeholder,
+)
+from .storage_writers import replace_stored_file
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def client_setting(client_id, per_client_name, default_name, default=None):
+    """
+    Setting `default_name`, unless the {client_id: value} setting
+    `per_client_name` (case-insensitive keys) has an entry for `client_id`.
+    """
+    per_client = {
+        str(key).upper(): value
+        for key, value in (getattr(settings, per_client_name, None) or {}).items()
+    }
+    return per_client.get((client_id or '').upper(), getattr(settings, default_name, default))
+
+
+def max_dimension_for(client_id=None):
+    """
+    Longest edge (px) uploads of `client_id` are downscaled to, or None.
+
+    IMAGE_CLIENT_MAX_DIMENSIONS ({client_id: px}, case-insensitive) overrides
+    IMAGE_MAX_DIMENSION; 0 turns downscaling off for that client.
+    """
+    value = client_setting(client_id, 'IMAGE_CLIENT_MAX_DIMENSIONS', 'IMAGE_MAX_DIMENSION', 0)
+    try:
+        return int(value) or None
+    except (TypeError, ValueError):
+        return None
+
+
+def output_format_for(client_id=None):
+    """
+    Format (WEBP or AVIF) uploads of `client_id` are transcoded to, or None to
+    keep their own format.
+
+    IMAGE_CLIENT_OUTPUT_FORMATS ({client_id: format}, case-insensitive)
+    overrides IMAGE_OUTPUT_FORMAT; an empty value keeps the source format for
+    that client. AVIF falls back to WEBP when Pillow can't encode it.
+    """
+    return supported_output_format(client_setting(client_id, 'IMAGE_CLIENT_OUTPUT_FORMATS', 'IMAGE_OUTPUT_FORMAT'))
+
+
+def compression_options(client_id=None):
+    """compress_image_file() keyword arguments built from settings (for uploads of `client_id`)."""
+    try:
+        max_mb = float(getattr(settings, 'IMAGE_MAX_UPLOAD_MB', 1))
+    except Exception:
+        max_mb = 1.0
+    return {
+        'max_size_mb': max_mb,
+        'initial_quality': getattr(settings, 'IMAGE_COMPRESSION_QUALITY', 80),
+        'min_quality': getattr(settings, 'IMAGE_COMPRESSION_MIN_QUALITY', 45),
+        'spool_max_bytes': int(float(getattr(settings, 'IMAGE_COMPRESSION_SPOOL_MB', 4)) * 1024 * 1024),
+        'max_dimension': max_dimension_for(client_id),
+        # Perceptual mode (0 = off): lowest quality whose SSIM stays at or above this
+        'ssim_target': float(getattr(settings, 'IMAGE_COMPRESSION_SSIM_TARGET', 0)) or None,
+        'output_format': output_format_for(client_id),
+    }
+
+
+def needs_compression(size, metadata, compression, defer_compression=False, client_encoded=False):
+    """
+    True unless an upload of `size` bytes described by `metadata` already
+    complies with the `compression` options (compression_options()).
+
+    Compliant means within the size limit and IMAGE_MAX_DIMENSION and, for
+    inline compression, already in the client's output format. Perceptual
+    mode re-encodes compliant uploads too, unless the client says it encoded
+    them against the published /api/config/ (`client_encoded`).
+    """
+    return (
+        size > compression['max_size_mb'] * 1024 * 1024
+        or exceeds_max_dimension(metadata, compression['max_dimension'])
+        or (bool(compression['ssim_target']) and not client_encoded)
+        # Deferred work keeps the stored key, extension included
+        or (needs_transcode(metadata, compression['output_format']) and not defer_compression)
+    )
+
+
+def compress_stored_image(image_obj):
+    """
+    Recompress the stored file of `image_obj` in place.
+
+    Every row sharing the stored file (deduplicated uploads) is updated.
+    Missing derivatives, metadata and placeholder come from the same decode.
+    The format is kept (no output format profile), since the storage key and
+    URL handed out at upload time carry its extension.
+    Returns True if the stored bytes were replaced.
+    """
+    name = image_obj.image.name
+    max_pixels = max_decode_pixels()
+    options = dict(compression_options(image_obj.client_id), output_format=None)
+    with default_storage.open(name, 'rb') as stored:
+        decoded = open_image(stored, max_size=options['max_dimension'], max_pixels=max_pixels)
+        if decoded is not None:
+            compressed = compress_image_file(stored, image=decoded, **options)
+        else:
+            compressed = stored
+        replaced = compressed is not stored
+
+        updates = {'compression_status': Image.COMPRESSION_DONE, 'compression_error': None}
+        if replaced:
+            replace_stored_file(name, compressed)
+            updates['size'] = compressed.size
+            updates['content_hash'] = compute_sha256(compressed)
+            compressed.close()
+        sizes = derivative_sizes()
+        if decoded is None and ((not image_obj.derivatives and sizes) or not image_obj.placeholder):
+            # Too big to decode at full size - derivatives and placeholder only need a reduced decode
+            decoded = open_image(stored, max_size=sizes[0] if sizes else PLACEHOLDER_SIZE, max_pixels=max_pixels)
+        if not image_obj.derivatives and sizes:
+            updates['derivatives'] = generate_derivatives(decoded, name)
+        if not image_obj.placeholder:
+            updates['placeholder'] = render_placeholder(decoded)
+        if image_obj.width is None:
+            updates.update(read_metadata(stored))
+        if replaced:
+            updates.update(output_metadata(compressed.compression_info))
+
+    if not Image.objects.filter(image=name).update(**updates) and updates.get('derivatives'):
+        # The image was deleted while we worked - release the new derivatives too
+        PendingFileDeletion.objects.bulk_create([
+            PendingFileDeletion(file_path=path, original_path=name, client_id=image_obj.client_id)
+            for path in updates['derivatives'].values()
+        ])
+    return replaced
+
+
+def _claim_timeout():
+    return timedelta(seconds=float(getattr(settings, 'IMAGE_COMPRESSION_CLAIM_TIMEOUT_SECONDS', 900)))
+
+
+def claim_next_image():
+    """
+    Mark the oldest pending image 'processing' and return it, or None when the queue is empty.
+
+    Rows sharing a stored file with an image another worker is processing are
+    skipped; so are rows locked by a concurrent claim (SKIP LOCKED).
+    """
+    now = timezone.now()
+    in_progress = Image.objects.filter(
+        compression_status=Image.COMPRESSION_PROCESSING, compression_claimed_at__gte=now - _claim_timeout()
+    ).values('image')
+    with transaction.atomic():
+        image_obj = (
+            Image.objects.select_for_update(skip_locked=True)
+            .filter(compression_status__in=(Image.COMPRESSION_PENDING, Image.COMPRESSION_PROCESSING))
+            .exclude(image__in=in_progress)
+            .order_by('uploaded_at')
+            .first()
+        )
+        if image_obj is not None:
+            image_obj.compression_status = Image.COMPRESSION_PROCESSING
+            image_obj.compression_claimed_at = now
+            image_obj.save(update_fields=['compression_status', 'compression_claimed_at'])
+    return image_obj
+
+
+def process_compression_queue(batch_size=10):
+    """
+    Compress up to `batch_size` pending images.
+
+    Each image is claimed (claim_next_image) before it is processed, so
+    several workers can drain the queue concurrently.
+
+    Returns: dict with processed / compressed / unchanged / failed counts
+    """
+    stats = {'processed': 0, 'compressed': 0, 'unchanged': 0, 'failed': 0}
+
+    for _ in range(batch_size):
+        image_obj = claim_next_image()
+        if image_obj is None:
+            break
+
+        stats['processed'] += 1
+        try:
+            replaced = compress_stored_image(image_obj)
+            stats['compressed' if replaced else 'unchanged'] += 1
+        except Exception as e:
+            Image.objects.filter(image=image_obj.image.name).update(
+                compression_status=Image.COMPRESSION_FAILED,
+                compression_error=str(e)[:500],
+            )
+            stats['failed'] += 1
+
+    return stats
+
+
+def _drain_queue():
+    try:
+        batch_size = int(getattr(settings, 'IMAGE_DEFERRED_COMPRESSION_BATCH_SIZE', 10))
+        while process_compression_queue(batch_size)['processed']:
+            pass
+    except Exception as e:
+        print(f"Warning: Deferred compression worker failed: {e}")
+    finally:
+        connection.close()
+
+
+def kick_compression_worker():
+    """
+    Wake the in-process worker thread (IMAGE_DEFERRED_COMPRESSION_WORKER='thread').
+
+    With the default 'command' worker this is a no-op and the queue is drained
+    by `python manage.py process_compression_queue`.
+    """
+    global _worker
+    if getattr(settings, 'IMAGE_DEFERRED_COMPRESSION_WORKER', 'command') != 'thread':
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compression')
+    _worker.submit(_drain_queue)
@@ -0,0 +1,299 @@
+"""
+Admission control for CPU-heavy image work.
+
+Decoding, re-encoding and rendering derivatives of a large photo can keep a
+core busy for a second or more. Running that on request threads lets a burst
+of uploads starve cheap endpoints (list, stats), so image work goes through
+one gate per web process:
+
+- at most IMAGE_COMPRESSION_CONCURRENCY jobs run at once, in a process pool
+  (IMAGE_COMPRESSION_USE_PROCESSES) so they don't hold the GIL of the web
+  worker, and
+- the decoded pixels of all running jobs stay within
+  IMAGE_COMPRESSION_PIXEL_BUDGET_MP megapixels, bounding decode memory.
+
+A job that can't be admitted within IMAGE_COMPRESSION_WAIT_SECONDS raises
+CompressionOverloaded; callers then skip compression or defer it to the
+background queue (IMAGE_COMPRESSION_OVERLOAD_ACTION). So does a job whose pool
+process died (e.g. killed for memory); the pool is rebuilt for the next job.
+
+Pool processes get the upload as a file path, never as bytes: the file's own
+temp file when it has one, otherwise a copy spooled to disk in chunks.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files import File
+
+from .compress_image import compress_image_file, decoded_pixels, open_image, probe_image
+from .derivatives import render_derivatives
+from .image_metadata import PLACEHOLDER_SIZE, render_placeholder
+
+OVERLOAD_SKIP = 'skip'
+OVERLOAD_DEFER = 'defer'
+
+
+class CompressionOverloaded(Exception):
+    """Raised when image work can't be admitted within the wait timeout."""
+
+
+class ImageWork:
+    """Result of process_image(): an optional compressed file, rendered derivatives and placeholder."""
+
+    def __init__(self, compressed=None, compression_info=None, derivatives=None, placeholder=None):
+        self.compressed = compressed
+        self.compression_info = compression_info
+        self.derivatives = derivatives or {}
+        self.placeholder = placeholder
+
+
+class HandoffFile(File):
+    """
+    Compressed output a pool process left in a temp file.
+
+    Exposes temporary_file_path() like Django's TemporaryUploadedFile, so
+    FileSystemStorage moves the file into place instead of copying it. The temp
+    file is removed on close if it is still there.
+    """
+
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def temporary_file_path(self):
+        return self.path
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def _hand_off(compressed):
+    """Spill a worker's compressed File to a temp file the parent process can open."""
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(compressed.name)[1])
+    with os.fdopen(fd, 'wb') as out:
+        compressed.seek(0)
+        shutil.copyfileobj(compressed, out)
+    compressed.close()
+    return path
+
+
+def _decode_box(compression, derivative_options, placeholder):
+    """Longest edge a job needs decoded, or None for the full resolution."""
+    if compression is not None:
+        # Compression keeps the full resolution unless it downscales
+        return compression.get('max_dimension')
+    sizes = (derivative_options or {}).get('sizes') or []
+    if sizes:
+        return max(sizes)
+    return PLACEHOLDER_SIZE if placeholder else None
+
+
+def _source_path(file_obj):
+    """
+    (path, is_temp) of a file holding `file_obj`'s bytes, for a pool process.
+
+    Uses the upload's own temp file when it has one; otherwise copies it to a
+    temp file in chunks (is_temp True: the caller removes it).
+    """
+    if hasattr(file_obj, 'temporary_file_path'):
+        return file_obj.temporary_file_path(), False
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(file_obj.name or '')[1])
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            file_obj.seek(0)
+            for chunk in file_obj.chunks():
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, True
+
+
+def _process_image_job(source, name, compression, derivative_options, placeholder, max_pixels):
+    """
+    Decode `source` once, compress it, render derivatives and the placeholder.
+
+    Runs in a pool process (source is a file path) or inline (source is a file).
+    Compression keeps the full resolution (or IMAGE_MAX_DIMENSION); without it
+    the image is decoded at (roughly) the largest size the derivatives or
+    placeholder need instead.
+
+    Returns: (compressed, compression_info, {size: bytes}, placeholder). Inline,
+    compressed is the File compress_image_file() returned; in a pool process it
+    is the (temp path, name) of the hand-off file. None when nothing was compressed.
+    """
+    in_pool = isinstance(source, str)
+    upload = File(open(source, 'rb'), name=name) if in_pool else source
+    try:
+        return _run_image_job(upload, in_pool, compression, derivative_options, placeholder, max_pixels)
+    finally:
+        if in_pool:
+            upload.close()
+
+
+def _run_image_job(upload, in_pool, compression, derivative_options, placeholder, max_pixels):
+    """The work of _process_image_job() on an open `upload`; same return value."""
+    compressed, compression_info = None, None
+    img = None
+    if compression is not None:
+        img = open_image(upload, max_size=compression.get('max_dimension'), max_pixels=max_pixels)
+        if img is not None:
+            result = compress_image_file(upload, image=img, **compression)
+            if result is not upload:
+                compression_info = getattr(result, 'compression_info', None)
+                compressed = (_hand_off(result), result.name) if in_pool else result
+
+    if img is None and (derivative_options or placeholder):
+        img = open_image(upload, max_size=_decode_box(None, derivative_options, placeholder), max_pixels=max_pixels)
+    rendered = render_derivatives(img, **derivative_options) if derivative_options else {}
+    preview = render_placeholder(img) if placeholder else None
+    return compressed, compression_info, rendered, preview
+
+
+class CompressionGate:
+    """Concurrency and pixel-budget admission in front of an optional process pool."""
+
+    def __init__(self, concurrency, pixel_budget, use_processes):
+        self.concurrency = max(1, int(concurrency))
+        self.pixel_budget = int(pixel_budget)
+        self.use_processes = use_processes
+        self._condition = threading.Condition()
+        self._running = 0
+        self._pixels = 0
+        self._executor = None
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn: forking a threaded web worker can deadlock the child
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.concurrency, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def acquire(self, pixels, timeout):
+        if self.pixel_budget and pixels > self.pixel_budget:
+            raise CompressionOverloaded(f'{pixels} pixels exceed the compression pixel budget')
+        with self._condition:
+            admitted = self._condition.wait_for(
+                lambda: self._running < self.concurrency
+                and (not self.pixel_budget or self._pixels + pixels <= self.pixel_budget),
+                timeout=timeout,
+            )
+            if not admitted:
+                raise CompressionOverloaded('Compression is at capacity')
+            self._running += 1
+            self._pixels += pixels
+
+    def release(self, pixels):
+        with self._condition:
+            self._running -= 1
+            self._pixels -= pixels
+            self._condition.notify_all()
+
+    def _reset_pool(self, executor):
+        """Drop `executor` (broken) so the next job starts a fresh pool."""
+        with self._condition:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, file_obj, pixels, compression, derivative_options, placeholder, max_pixels, timeout):
+        self.acquire(pixels, timeout)
+        try:
+            if self.use_processes:
+                return self._run_in_pool(file_obj, compression, derivative_options, placeholder, max_pixels)
+            return _process_image_job(
+                file_obj, file_obj.name, compression, derivative_options, placeholder, max_pixels
+            )
+        finally:
+            self.release(pixels)
+
+    def _run_in_pool(self, file_obj, compression, derivative_options, placeholder, max_pixels):
+        path, is_temp = _source_path(file_obj)
+        executor = self._pool()
+        try:
+            future = executor.submit(
+                _process_image_job, path, file_obj.name,
+                compression, derivative_options, placeholder, max_pixels,
+            )
+            return future.result()
+        except BrokenProcessPool as e:
+            # A pool process died (e.g. OOM-killed); every pending future of this pool fails too
+            self._reset_pool(executor)
+            raise CompressionOverloaded(f'Compression worker died: {e}') from e
+        finally:
+            if is_temp:
+                os.remove(path)
+
+
+_gate = None
+_gate_lock = threading.Lock()
+
+
+def get_gate():
+    """The process-wide CompressionGate, built from settings on first use."""
+    global _gate
+    with _gate_lock:
+        if _gate is None:
+            _gate = CompressionGate(
+                concurrency=getattr(settings, 'IMAGE_COMPRESSION_CONCURRENCY', 2),
+                pixel_budget=float(getattr(settings, 'IMAGE_COMPRESSION_PIXEL_BUDGET_MP', 100)) * 1_000_000,
+                use_processes=getattr(settings, 'IMAGE_COMPRESSION_USE_PROCESSES', True),
+            )
+        return _gate
+
+
+def max_decode_pixels():
+    """Largest image (in pixels) that is decoded at all (IMAGE_MAX_DECODE_MP), or None."""
+    limit = float(getattr(settings, 'IMAGE_MAX_DECODE_MP', 64) or 0)
+    return int(limit * 1_000_000) or None
+
+
+def overload_action():
+    """What to do with an image the gate turned away: 'skip' or 'defer'."""
+    return getattr(settings, 'IMAGE_COMPRESSION_OVERLOAD_ACTION', OVERLOAD_SKIP)
+
+
+def process_image(file_obj, compression=None, derivative_options=None, placeholder=False, timeout=None):
+    """
+    Compress `file_obj` (when `compression` options are given), render its
+    derivatives (when `derivative_options` are given) and its placeholder
+    (when `placeholder` is set) from a single decode, subject to the
+    admission gate. Images over IMAGE_MAX_DECODE_MP are left uncompressed;
+    JPEG derivatives still come from a reduced-scale decode.
+
+    Returns: ImageWork. Raises CompressionOverloaded if the job can't start
+    within `timeout` seconds (IMAGE_COMPRESSION_WAIT_SECONDS by default).
+    """
+    if timeout is None:
+        timeout = float(getattr(settings, 'IMAGE_COMPRESSION_WAIT_SECONDS', 10))
+    max_pixels = max_decode_pixels()
+
+    # Admit by the pixels the job will actually hold, not the source resolution
+    header = probe_image(file_obj)
+    pixels = 0
+    if header is not None:
+        # Compression decodes at full size; derivatives and placeholders need far less
+        pixels = decoded_pixels(*header, max_size=_decode_box(compression, derivative_options, placeholder))
+        if max_pixels:
+            pixels = min(pixels, max_pixels)
+
+    compressed, info, rendered, preview = get_gate().run(
+        file_obj, pixels, compression, derivative_options, placeholder, max_pixels, timeout
+    )
+
+    if isinstance(compressed, tuple):
+        compressed = HandoffFile(*compressed)
+        compressed.compression_info = info
+    return ImageWork(compressed, info, rendered, preview)
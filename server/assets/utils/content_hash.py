@@ -0,0 +1,22 @@
+"""
+Content hashing helpers used for deduplicating stored image bytes.
+"""
+import hashlib
+
+
+def compute_sha256(file_obj):
+    """
+    Return the hex SHA-256 digest of a Django File, reading it in chunks.
+
+    Files that were hashed while streaming (see StoredUploadedFile) already carry
+    the digest on `.sha256` and are not read again.
+    """
+    digest = getattr(file_obj, 'sha256', None)
+    if digest:
+        return digest
+
+    sha256 = hashlib.sha256()
+    for chunk in file_obj.chunks():
+        sha256.update(chunk)
+    file_obj.seek(0)
+    return sha256.hexdigest()
@@ -0,0 +1,98 @@
+"""
+Presigned direct-to-storage uploads.
+
+Clients PUT image bytes straight to the S3-compatible bucket (Cloudflare R2 in
+production, or any S3 stand-in such as MinIO locally) using a short-lived
+presigned URL, so Django's workers never receive the upload. On complete the
+stored object goes through the same pipeline as any other upload (sniffing,
+deduplication, compression, derivatives); each issued key is recorded as a
+DirectUpload so objects that are never completed can be removed
+(cleanup_direct_uploads). HEAD and GET requests go through storage_call(), so
+they share the storage's circuit breaker and retries.
+"""
+from botocore.exceptions import ClientError
+from django.core import signing
+from django.core.files.storage import default_storage
+
+from .resilient_storage import storage_call
+from .storage_writers import is_s3_storage
+
+UPLOAD_TOKEN_SALT = 'assets.direct_upload'
+
+
+def direct_uploads_supported(storage=None):
+    """Presigned uploads need an S3-compatible backend."""
+    return is_s3_storage(storage or default_storage)
+
+
+def _object_key(storage, name):
+    from storages.utils import clean_name
+    return storage._normalize_name(clean_name(name))
+
+
+def create_presigned_put(name, content_type, content_length=None, expires_in=900, storage=None):
+    """
+    Return (url, headers) for a presigned PUT of storage file `name`.
+
+    Content-Type (and Content-Length when given) are part of the signature, so
+    the client must send exactly the returned headers.
+    """
+    storage = storage or default_storage
+    client = storage.connection.meta.client
+    params = {
+        'Bucket': storage.bucket_name,
+        'Key': _object_key(storage, name),
+        'ContentType': content_type,
+    }
+    headers = {'Content-Type': content_type}
+    if content_length:
+        params['ContentLength'] = int(content_length)
+        headers['Content-Length'] = str(int(content_length))
+
+    url = client.generate_presigned_url(
+        'put_object', Params=params, ExpiresIn=int(expires_in), HttpMethod='PUT'
+    )
+    return url, headers
+
+
+def head_stored_object(name, storage=None):
+    """
+    HEAD storage file `name`.
+
+    Returns a dict with size, content_type and etag, or None if it doesn't exist.
+    """
+    storage = storage or default_storage
+    client = storage.connection.meta.client
+    try:
+        response = storage_call(storage, 'head', lambda: client.head_object(
+            Bucket=storage.bucket_name, Key=_object_key(storage, name)
+        ))
+    except ClientError as e:
+        if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 404:
+            return None
+        raise
+    return {
+        'size': response['ContentLength'],
+        'content_type': response.get('ContentType'),
+        'etag': response.get('ETag', '').strip('"'),
+    }
+
+
+def read_stored_head(name, length, storage=None):
+    """The first `length` bytes of storage file `name` (a ranged GET)."""
+    storage = storage or default_storage
+    client = storage.connection.meta.client
+    key = _object_key(storage, name)
+    return storage_call(storage, 'open', lambda: client.get_object(
+        Bucket=storage.bucket_name, Key=key, Range=f'bytes=0-{length - 1}'
+    )['Body'].read())
+
+
+def sign_upload_token(payload):
+    """Sign the init payload so /complete/ can trust the key and client_id."""
+    return signing.dumps(payload, salt=UPLOAD_TOKEN_SALT, compress=True)
+
+
+def read_upload_token(token, max_age):
+    """Return the payload of a token from sign_upload_token, or raise signing.BadSignature."""
+    return signing.loads(token, salt=UPLOAD_TOKEN_SALT, max_age=max_age)
@@ -0,0 +1,242 @@
+"""
+Idempotency-Key support for the upload endpoints.
+
+A client that may retry an upload (timeout, re-run of a sheet) sends a unique
+`Idempotency-Key` header. Keys are scoped by the normalized client_id the
+upload is made for, so two clients never share a key. The first request
+claims the key and, once it succeeded, its JSON response is stored together
+with a hash of the request (form fields plus each file's name and content).
+A retry with the same key and client within IMAGE_IDEMPOTENCY_TTL_HOURS gets
+that response replayed - with an `Idempotent-Replayed: true` header - and
+nothing is stored or written again. Reusing a key for a different request is
+refused with 422.
+
+The key is claimed by the view via claim_request() once it knows the
+client_id, i.e. after the body has been parsed. Before parsing, upload_image
+checks stored_response_exists() and doesn't stream the file to storage when
+the key already has a response, so a replay writes nothing.
+
+Only fully successful responses (201, or 202 for a deferred compression) are
+kept. After an error, or a batch where some files failed (207), the key is
+released and a retry runs the upload for real. A retry that arrives while the
+first request is still running gets 409. A claim not completed within
+IMAGE_IDEMPOTENCY_LOCK_SECONDS (crashed worker) is taken over.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from ..models import IdempotencyRecord, normalize_client_id
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+# Responses worth replaying: everything was created
+STORED_STATUSES = (201, 202)
+# Request attribute holding (key, claimed record) between the decorator and the view
+REQUEST_ATTR = '_idempotency'
+
+
+def _ttl():
+    return timedelta(hours=float(getattr(settings, 'IMAGE_IDEMPOTENCY_TTL_HOURS', 24)))
+
+
+def _lock_timeout():
+    return timedelta(seconds=float(getattr(settings, 'IMAGE_IDEMPOTENCY_LOCK_SECONDS', 300)))
+
+
+def _is_stale(record, now):
+    if record.status_code is None:
+        return record.created_at < now - _lock_timeout()
+    return record.created_at < now - _ttl()
+
+
+def claim(key, scope='', request_hash=''):
+    """
+    Claim `key` for a new request.
+
+    Returns: (record, None) when the caller should run the request, or
+    (None, response) with the replayed response, a 409 while it is in flight
+    or a 422 when the key was used for a different request
+    """
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyRecord.objects.create(key=key, scope=scope, request_hash=request_hash), None
+        except IntegrityError:
+            pass
+
+        existing = IdempotencyRecord.objects.filter(key=key, scope=scope).first()
+        if existing is None:
+            continue  # Released meanwhile - claim again
+        if _is_stale(existing, timezone.now()):
+            # Expired, or its request died - drop it (unless someone else just did) and claim again
+            IdempotencyRecord.objects.filter(pk=existing.pk, created_at=existing.created_at).delete()
+            continue
+        # Records stored before requests were hashed have no hash to compare
+        if existing.request_hash and existing.request_hash != request_hash:
+            return None, JsonResponse({
+                'success': False,
+                'error': f'This {IDEMPOTENCY_HEADER} was already used for a different request'
+            }, status=422)
+        if existing.status_code is None:
+            return None, JsonResponse({
+                'success': False,
+                'error': 'A request with this Idempotency-Key is still in progress'
+            }, status=409)
+        response = JsonResponse(existing.response, status=existing.status_code, safe=False)
+        response[REPLAYED_HEADER] = 'true'
+        return None, response
+
+    return None, JsonResponse({
+        'success': False,
+        'error': 'Could not claim the Idempotency-Key, please retry'
+    }, status=409)
+
+
+def complete(record, response):
+    """Store a fully successful JSON `response` under `record`; release the key otherwise."""
+    if response.status_code in STORED_STATUSES:
+        try:
+            body = json.loads(response.content)
+        except ValueError:
+            body = None
+        if body is not None:
+            record.status_code = response.status_code
+            record.response = body
+            record.save(update_fields=['status_code', 'response'])
+            return
+    record.delete()
+
+
+def request_hash(request):
+    """
+    SHA-256 of `request`'s form fields and uploaded files (field, name and content).
+
+    client_id is left out: it is the key's scope, sent in the form or as X-Client-Id.
+    """
+    digest = hashlib.sha256()
+    fields = sorted((field, values) for field, values in request.POST.lists() if field != 'client_id')
+    digest.update(json.dumps(fields).encode('utf-8'))
+    for field, files in sorted(request.FILES.lists()):
+        for upload in files:
+            digest.update(json.dumps([field, upload.name, upload.size]).encode('utf-8'))
+            for chunk in upload.chunks():
+                digest.update(chunk)
+            upload.seek(0)
+    return digest.hexdigest()
+
+
+def _scope(client_id):
+    return normalize_client_id(client_id)[:IdempotencyRecord._meta.get_field('scope').max_length]
+
+
+def stored_response_exists(request):
+    """
+    True if the Idempotency-Key of `request` already has a stored response.
+
+    Runs before the body is parsed, so the client is only known from an
+    X-Client-Id header; without one, a response stored for any client counts.
+    """
+    key, _record = getattr(request, REQUEST_ATTR, (None, None))
+    if key is None:
+        return False
+    records = IdempotencyRecord.objects.filter(
+        key=key, status_code__isnull=False, created_at__gte=timezone.now() - _ttl()
+    )
+    header_client_id = request.headers.get('X-Client-Id', '').strip()
+    if header_client_id:
+        records = records.filter(scope=_scope(header_client_id))
+    return records.exists()
+
+
+def claim_request(request, client_id):
+    """
+    Claim the Idempotency-Key of `request` for `client_id`, from inside an @idempotent view.
+
+    Call it once the request is known to be valid, before anything is stored.
+    Returns: None to go on, or the response to return instead (replay, 409, 422)
+    """
+    key, _record = getattr(request, REQUEST_ATTR, (None, None))
+    if key is None:
+        return None
+    record, replay = claim(key, _scope(client_id), request_hash(request))
+    setattr(request, REQUEST_ATTR, (key, record))
+    return replay
+
+
+def _request_key(request):
+    """(key, error response) of `request`; key is None without the header."""
+    key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+    if not key:
+        return None, None
+    if len(key) > MAX_KEY_LENGTH:
+        return None, JsonResponse({
+            'success': False,
+            'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'
+        }, status=400)
+    return key, None
+
+
+def idempotent(view):
+    """
+    Make a JSON view (sync or async) replay its stored response for a repeated Idempotency-Key.
+
+    The view claims the key with claim_request(); the response is stored (or
+    the key released) here once the view returns. Requests without the header
+    are passed through unchanged.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            key, error = _request_key(request)
+            if error is not None:
+                return error
+            setattr(request, REQUEST_ATTR, (key, None))
+            try:
+                response = await view(request, *args, **kwargs)
+            except BaseException:
+                _key, record = getattr(request, REQUEST_ATTR)
+                if record is not None:
+                    await record.adelete()
+                raise
+            _key, record = getattr(request, REQUEST_ATTR)
+            if record is not None:
+                await sync_to_async(complete)(record, response)
+            return response
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key, error = _request_key(request)
+        if error is not None:
+            return error
+        setattr(request, REQUEST_ATTR, (key, None))
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            _key, record = getattr(request, REQUEST_ATTR)
+            if record is not None:
+                record.delete()
+            raise
+        _key, record = getattr(request, REQUEST_ATTR)
+        if record is not None:
+            complete(record, response)
+        return response
+
+    return wrapper
+
+
+def prune_expired(now=None):
+    """Delete records past IMAGE_IDEMPOTENCY_TTL_HOURS. Returns the number deleted."""
+    now = now or timezone.now()
+    deleted, _ = IdempotencyRecord.objects.filter(created_at__lt=now - _ttl()).delete()
+    return deleted
@@ -0,0 +1,98 @@
+"""
+Image metadata stored on the Image row.
+
+Width, height and format come from the file header (no decode). The
+placeholder is a tiny WebP preview as a base64 data URI (LQIP), rendered from
+the decode the upload already does for compression or derivatives, so a
+client can lay out a grid and show something before fetching originals.
+"""
+import base64
+import io
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+from .compress_image import ORIENTATION_TAG, TRANSCODABLE_FORMATS, TRANSPOSED_ORIENTATIONS
+
+# Longest edge (px) of the placeholder preview
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 30
+
+METADATA_FIELDS = ('width', 'height', 'original_width', 'original_height', 'format', 'placeholder')
+
+
+def read_metadata(file_obj):
+    """
+    Width, height (EXIF orientation applied) and format from the header of `file_obj`.
+
+    Returns: dict with 'width', 'height' and 'format', or {} if the file isn't
+    a readable image
+    """
+    if not PIL_AVAILABLE:
+        return {}
+    try:
+        file_obj.seek(0)
+        with Image.open(file_obj) as img:
+            width, height = img.size
+            if img.getexif().get(ORIENTATION_TAG) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            metadata = {'width': width, 'height': height, 'format': img.format}
+        file_obj.seek(0)
+        return metadata
+    except Exception:
+        return {}
+
+
+def exceeds_max_dimension(metadata, max_dimension):
+    """True if the image described by `metadata` has an edge longer than `max_dimension`."""
+    if not max_dimension:
+        return False
+    return max(metadata.get('width') or 0, metadata.get('height') or 0) > max_dimension
+
+
+def needs_transcode(metadata, output_format):
+    """True if the image described by `metadata` would be transcoded to `output_format`."""
+    fmt = metadata.get('format')
+    return bool(output_format) and fmt in TRANSCODABLE_FORMATS and fmt != output_format
+
+
+def output_metadata(compression_info):
+    """Format and (if it was downscaled) dimension fields to record for a compressed file."""
+    if not compression_info:
+        return {}
+    metadata = {'format': compression_info['format']}
+    resized_from = compression_info.get('resized_from')
+    if resized_from:
+        metadata.update({
+            'width': compression_info['width'],
+            'height': compression_info['height'],
+            'original_width': resized_from[0],
+            'original_height': resized_from[1],
+        })
+    return metadata
+
+
+def render_placeholder(img, size=PLACEHOLDER_SIZE):
+    """Tiny WebP data URI of the decoded PIL image `img`, or None."""
+    if not PIL_AVAILABLE or img is None:
+        return None
+    try:
+        scale = min(1.0, size / float(max(img.size)))
+        target = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        preview = img.resize(target, Image.BILINEAR, reducing_gap=2.0)
+        if preview.mode not in ('RGB', 'RGBA'):
+            preview = preview.convert('RGBA' if 'transparency' in preview.info or 'A' in preview.mode else 'RGB')
+        buffer = io.BytesIO()
+        preview.save(buffer, format='WEBP', quality=PLACEHOLDER_QUALITY)
+        return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+    except Exception as e:
+        print(f"Warning: Failed to render placeholder: {e}")
+        return None
+
+
+def metadata_of(image_obj):
+    """The metadata fields of an Image row, e.g. to copy them onto a deduplicated upload."""
+    return {field: getattr(image_obj, field) for field in METADATA_FIELDS}
@@ -0,0 +1,88 @@
+"""
+Search for /api/list/.
+
+`search` matches a substring of name, description, filename or
+original_filename, case-insensitively. Four OR-ed icontains filters can only be
+answered by a sequential scan, so on PostgreSQL the fields are searched as one
+document:
+
+    UPPER(COALESCE(name, '') || ' ' || ... ) LIKE UPPER('%term%')
+
+which is served by a pg_trgm GIN index on exactly that expression
+(idx_image_search_trgm, migration 0019, which keeps its own copy of the
+expression) and can be combined with the client_id index. Terms shorter than 3 characters have no trigrams and still scan.
+sort_by=relevance orders matches by pg_trgm word_similarity.
+
+Migration 0019 skips the extension and index where the server has no pg_trgm
+(install postgresql-contrib, then migrate assets 0018 and migrate again).
+Without pg_trgm, and on other databases (SQLite test runs), relevance ranks
+exact name matches first; other databases also keep the icontains filters.
+"""
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, TextField, Value, When
+from django.db.models.expressions import Func
+
+SEARCH_FIELDS = ('name', 'description', 'filename', 'original_filename')
+
+_pg_trgm_installed = {}
+
+
+class _OrEmpty(Func):
+    # Parameter-free COALESCE, so the query's SQL is identical to the index expression
+    template = "COALESCE(%(expressions)s, '')"
+    output_field = TextField()
+
+
+class _SearchDocument(Func):
+    # || rather than CONCAT(): CONCAT() isn't IMMUTABLE, so it can't be indexed
+    arg_joiner = " || ' ' || "
+    template = '(%(expressions)s)'
+    output_field = TextField()
+
+
+def search_document():
+    """The searchable fields as one text expression."""
+    return _SearchDocument(*[_OrEmpty(F(field)) for field in SEARCH_FIELDS])
+
+
+def is_postgresql(using=None):
+    """True when `using` (default: the default connection) is PostgreSQL."""
+    return (using or connection).vendor == 'postgresql'
+
+
+def pg_trgm_installed(using=None):
+    """True when the pg_trgm extension is installed in `using`'s database (checked once per process)."""
+    conn = using or connection
+    if not is_postgresql(conn):
+        return False
+    if conn.alias not in _pg_trgm_installed:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _pg_trgm_installed[conn.alias] = cursor.fetchone() is not None
+    return _pg_trgm_installed[conn.alias]
+
+
+def filter_search(queryset, term):
+    """Images of `queryset` whose searchable fields contain `term` (case-insensitive)."""
+    if not is_postgresql():
+        query = Q()
+        for field in SEARCH_FIELDS:
+            query |= Q(**{f'{field}__icontains': term})
+        return queryset.filter(query)
+    return queryset.alias(search_document=search_document()).filter(search_document__icontains=term)
+
+
+def order_by_relevance(queryset, term):
+    """`queryset` ordered best match first, then newest."""
+    if not pg_trgm_installed():
+        rank = Case(
+            When(name__iexact=term, then=Value(2)),
+            When(name__icontains=term, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    else:
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        rank = TrigramWordSimilarity(term, search_document())
+    return queryset.alias(search_rank=rank).order_by('-search_rank', '-uploaded_at', '-id')
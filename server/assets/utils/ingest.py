@@ -0,0 +1,173 @@
+"""
+Turning one received image file into a stored Image row.
+
+Shared by the single-file upload endpoint and resumable upload sessions:
+server-side compression (inline or deferred), content-addressed
+deduplication, derivative and metadata generation and the database insert.
+"""
+import os
+import uuid
+
+from django.db import transaction
+
+from ..models import Image
+from .compression_jobs import compression_options, kick_compression_worker, needs_compression
+from .compression_pool import OVERLOAD_DEFER, CompressionOverloaded, overload_action, process_image
+from .content_hash import compute_sha256
+from .derivatives import derivative_options, derivative_sizes, store_derivatives
+from .image_metadata import (
+    METADATA_FIELDS, metadata_of, output_metadata, read_metadata,
+)
+from .upload_handlers import StoredUploadedFile
+
+
+def _run_image_work(image_file, compression, wants_derivatives):
+    """Run compression, derivative and placeholder rendering through the pool; None when turned away."""
+    try:
+        return process_image(
+            image_file,
+            compression=compression,
+            derivative_options=derivative_options() if wants_derivatives else None,
+            placeholder=True,
+        )
+    except CompressionOverloaded as e:
+        print(f"Warning: Skipping image processing for {image_file.name}: {e}")
+        return None
+
+
+def _overload_status():
+    """Compression status of an upload the pool turned away."""
+    if overload_action() == OVERLOAD_DEFER:
+        return Image.COMPRESSION_PENDING
+    return Image.COMPRESSION_NONE
+
+
+def ingest_upload(image_file, client_id, name=None, description=None, defer_compression=False,
+                  client_encoded=False):
+    """
+    Compress, deduplicate and store `image_file`, then create its Image row.
+
+    `image_file` is a Django UploadedFile; a StoredUploadedFile (bytes already
+    in storage) is referenced in place instead of being written again.
+    `client_encoded` marks a file the client already encoded against
+    /api/config/, so a compliant one isn't re-encoded (see needs_compression).
+
+    Returns: (image_obj, details) where details holds 'compressed',
+    'compression_info' and 'deduplicated'
+    """
+    # If the upload is bigger than server threshold (or than IMAGE_MAX_DIMENSION),
+    # try server-side compression
+    compression = compression_options(client_id)
+    file_ext = os.path.splitext(image_file.name)[1].lower()
+    wants_derivatives = bool(derivative_sizes())
+    # Dimensions and format come from the header (updated if compression changes them)
+    metadata = dict.fromkeys(METADATA_FIELDS)
+    metadata.update(read_metadata(image_file))
+    compress = needs_compression(
+        getattr(image_file, 'size', 0), metadata, compression,
+        defer_compression=defer_compression, client_encoded=client_encoded,
+    )
+
+    compressed_flag = False
+    compression_info = None
+    compression_status = Image.COMPRESSION_NONE
+    # Derivatives and the placeholder are rendered by the same pool job that
+    # compresses, from one decode
+    rendered = None
+    turned_away = False
+    if compress and defer_compression:
+        compression_status = Image.COMPRESSION_PENDING
+    elif compress:
+        work = _run_image_work(image_file, compression, wants_derivatives)
+        if work is None:
+            compression_status = _overload_status()
+            turned_away = True
+        else:
+            rendered = work.derivatives
+            metadata['placeholder'] = work.placeholder
+            # If compressed, replace the file and update extension used
+            if work.compressed is not None:
+                original_filename = image_file.name
+                image_file.close()
+                image_file = work.compressed
+                image_file.original_name = original_filename
+                file_ext = os.path.splitext(image_file.name)[1].lower()
+                compressed_flag = True
+                compression_info = work.compression_info
+                metadata.update(output_metadata(compression_info))
+
+    original_filename = getattr(image_file, 'original_name', None) or image_file.name  # Always capture before overwrite
+
+    # Content-addressed deduplication: identical bytes already in storage are
+    # referenced by the new row instead of being written again
+    content_hash = compute_sha256(image_file)
+    duplicate = Image.objects.filter(content_hash=content_hash).only(
+        'image', 'compression_status', 'derivatives', *METADATA_FIELDS
+    ).first()
+    deduplicated = duplicate is not None
+
+    # Derivatives and placeholders of pending uploads are made by the compression worker
+    derivatives = {}
+    if not deduplicated and not turned_away and compression_status == Image.COMPRESSION_NONE and rendered is None:
+        work = _run_image_work(image_file, None, wants_derivatives)
+        if work is None:
+            compression_status = _overload_status()
+        else:
+            rendered = work.derivatives
+            metadata['placeholder'] = work.placeholder
+    make_derivatives = not deduplicated and bool(rendered)
+
+    if isinstance(image_file, StoredUploadedFile):
+        # Generate unique filename from the key the bytes were streamed to
+        unique_filename = os.path.basename(image_file.storage_name)
+    else:
+        # Generate unique filename for storage
+        unique_filename = f"{uuid.uuid4()}{file_ext}"
+
+    if deduplicated:
+        stored_file = duplicate.image.name
+        # The shared file's compression state and derivatives apply to the new row too
+        compression_status = duplicate.compression_status
+        derivatives = duplicate.derivatives
+        metadata.update({k: v for k, v in metadata_of(duplicate).items() if v is not None})
+        image_file.close()
+    elif isinstance(image_file, StoredUploadedFile):
+        # Bytes are already in storage - point the ImageField at them instead of re-saving
+        stored_file = image_file.storage_name
+        image_file.close()
+    else:
+        image_file.name = unique_filename  # Force unique name for ImageField
+        stored_file = image_file
+
+    # Save metadata to database, store image file using ImageField
+    image_obj = Image(
+        filename=unique_filename,
+        image=stored_file,
+        original_filename=original_filename,
+        client_id=client_id,
+        name=name,
+        description=description,
+        size=image_file.size,
+        content_hash=content_hash,
+        compression_status=compression_status,
+        derivatives=derivatives,
+        **metadata
+    )
+    if make_derivatives:
+        if not isinstance(stored_file, str):
+            # Store the original first - derivative keys follow its final name
+            image_obj.image.save(unique_filename, stored_file, save=False)
+        image_obj.derivatives = store_derivatives(rendered, image_obj.image.name)
+    image_obj.save()
+    # Releases the encoder's spool / the pool's hand-off file of a compressed upload
+    image_file.close()
+
+    if compression_status == Image.COMPRESSION_PENDING:
+        # The optimized version is produced in the background
+        transaction.on_commit(kick_compression_worker)
+
+    return image_obj, {
+        'compressed': compressed_flag,
+        'compression_info': compression_info,
+        'deduplicated': deduplicated,
+    }
@@ -0,0 +1,80 @@
+"""
+Keyset (cursor) pagination for /api/list/.
+
+OFFSET pagination makes the database walk past every skipped row, so deep
+pages get slower as the table grows. A cursor instead remembers the sort value
+and id of the last row served, and the next page is "rows after that
+position": an index range scan on the (sort field, id) indexes whatever the
+depth. The id tie-break makes the order total, so rows sharing a sort value
+are neither skipped nor repeated.
+
+Cursors are signed (django.core.signing) and opaque to clients; each is only
+valid for the sort_by it was issued for.
+"""
+from datetime import datetime
+
+from django.core import signing
+from django.db.models import F, Q
+
+SORT_FIELDS = ('uploaded_at', 'name', 'size', 'client_id')
+DEFAULT_SORT = '-uploaded_at'
+# Sort fields that may be NULL: ascending puts NULLs last, descending first (PostgreSQL's default)
+NULLABLE_FIELDS = frozenset({'name'})
+DATETIME_FIELDS = frozenset({'uploaded_at'})
+CURSOR_SALT = 'assets.list_cursor'
+
+
+def sort_key(sort_by):
+    """`sort_by` if it's a supported sort, else the default."""
+    return sort_by if sort_by.lstrip('-') in SORT_FIELDS else DEFAULT_SORT
+
+
+def ordering(sort_by):
+    """order_by() arguments for `sort_by`, tie-broken on id in the same direction."""
+    field = sort_by.lstrip('-')
+    nullable = field in NULLABLE_FIELDS
+    if sort_by.startswith('-'):
+        return [F(field).desc(nulls_first=True) if nullable else F(field).desc(), F('id').desc()]
+    return [F(field).asc(nulls_last=True) if nullable else F(field).asc(), F('id').asc()]
+
+
+def encode_cursor(sort_by, row):
+    """Cursor pointing past `row`, an image_summary() dict."""
+    field = sort_by.lstrip('-')
+    return signing.dumps({'s': sort_by, 'v': row[field], 'id': row['id']}, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, sort_by):
+    """
+    (value, id) position stored in `token`.
+
+    Raises ValueError for a tampered cursor or one issued for another sort_by.
+    """
+    try:
+        data = signing.loads(token, salt=CURSOR_SALT)
+        if data['s'] != sort_by:
+            raise ValueError('cursor belongs to another sort_by')
+        value = data['v']
+        if value is not None and sort_by.lstrip('-') in DATETIME_FIELDS:
+            value = datetime.fromisoformat(value)
+        return value, int(data['id'])
+    except (signing.BadSignature, KeyError, TypeError) as e:
+        raise ValueError('invalid cursor') from e
+
+
+def rows_after(sort_by, value, pk):
+    """Filter for the rows that follow position (value, pk) in ordering(sort_by)."""
+    field = sort_by.lstrip('-')
+    descending = sort_by.startswith('-')
+    past, past_or_at = ('lt', 'lte') if descending else ('gt', 'gte')
+
+    if value is None:
+        # Only nullable fields: NULLs come last ascending, first descending
+        nulls_after = Q(**{f'{field}__isnull': True, f'id__{past}': pk})
+        return nulls_after | Q(**{f'{field}__isnull': False}) if descending else nulls_after
+
+    # The outer bound keeps this a range scan on the (field, id) index; the inner part breaks ties
+    after = Q(**{f'{field}__{past_or_at}': value}) & (Q(**{f'{field}__{past}': value}) | Q(**{f'id__{past}': pk}))
+    if field in NULLABLE_FIELDS and not descending:
+        after |= Q(**{f'{field}__isnull': True})
+    return after
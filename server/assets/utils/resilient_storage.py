@@ -0,0 +1,355 @@
+"""
+Storage backends that survive a slow or flaky object store.
+
+Every save, open, exists, size and delete on default_storage is a blocking
+round-trip to R2, so a latency spike or a burst of 5xx answers used to show
+up directly as request latency or failed uploads. The backends here wrap the
+stock FileSystemStorage / S3 storage with:
+
+- bounded retries of transient errors with full-jitter exponential backoff
+  (IMAGE_STORAGE_RETRIES, IMAGE_STORAGE_BACKOFF_MS, IMAGE_STORAGE_BACKOFF_MAX_MS),
+- hedged PUTs on S3: a save still running after IMAGE_STORAGE_HEDGE_AFTER_MS
+  gets a second, identical PUT and the first one to finish wins (the key is
+  the same, so the loser just rewrites identical bytes). Each PUT reads its
+  own reopened stream, so only temp files and in-memory files are hedged,
+- a circuit breaker: after IMAGE_STORAGE_BREAKER_THRESHOLD consecutive
+  transient failures calls fail fast with StorageUnavailable for
+  IMAGE_STORAGE_BREAKER_RESET_SECONDS, then one trial call is let through,
+- per-operation latency histograms (storage_metrics()).
+
+State is per web process. Code that talks to the S3 client directly
+(streaming writers, resumable sessions, direct uploads) goes through
+storage_call(), so its requests share the same breaker, retries and
+histograms.
+"""
+import bisect
+import io
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+
+try:
+    from storages.backends.s3boto3 import S3Boto3Storage
+except Exception:
+    S3Boto3Storage = None
+
+try:
+    # Connection failures and timeouts below the HTTP layer (EndpointConnectionError,
+    # ConnectTimeoutError, ReadTimeoutError, ConnectionClosedError, ...)
+    from botocore.exceptions import ConnectionError as BotocoreConnectionError, HTTPClientError
+    BOTOCORE_NETWORK_ERRORS = (BotocoreConnectionError, HTTPClientError)
+except Exception:
+    BOTOCORE_NETWORK_ERRORS = ()
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# S3 error codes worth retrying (besides any 5xx)
+RETRYABLE_S3_CODES = frozenset({
+    'RequestTimeout', 'RequestTimeTooSkewed', 'SlowDown', 'Throttling', 'ThrottlingException',
+    'InternalError', 'ServiceUnavailable',
+})
+
+
+class StorageUnavailable(OSError):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+
+def is_transient(exc):
+    """
+    True for errors a retry may fix: connection problems, timeouts, throttling, 5xx.
+
+    Other OSErrors (ENOSPC, EROFS, permissions, ...) fail the same way again
+    and are not retried.
+    """
+    if isinstance(exc, StorageUnavailable):
+        return False
+    response = getattr(exc, 'response', None)
+    if isinstance(response, dict) and 'Error' in response:
+        # botocore ClientError
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 0
+        return status >= 500 or response['Error'].get('Code') in RETRYABLE_S3_CODES
+    return isinstance(exc, (ConnectionError, TimeoutError) + BOTOCORE_NETWORK_ERRORS)
+
+
+class LatencyHistogram:
+    """Counts of call latencies per LATENCY_BUCKETS_MS bucket, plus totals and errors."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+
+    def record(self, elapsed_ms, ok=True):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if not ok:
+            self.errors += 1
+
+    def snapshot(self):
+        labels = [f'le_{bound}ms' for bound in LATENCY_BUCKETS_MS] + ['inf']
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.count, 1) if self.count else None,
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` consecutive failures -> half-open after `reset_seconds`."""
+
+    def __init__(self, threshold, reset_seconds):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_seconds else 'open'
+
+    def allow(self):
+        """True if a call may go to the backend (one trial at a time while half-open)."""
+        if not self.threshold:
+            return True
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.threshold and self.failures >= self.threshold):
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+_lock = threading.Lock()
+_histograms = {}
+_breaker = None
+_hedge_pool = None
+
+
+def _setting(name, default):
+    return float(getattr(settings, name, default) or 0)
+
+
+def get_breaker():
+    """The process-wide storage CircuitBreaker, built from settings on first use."""
+    global _breaker
+    with _lock:
+        if _breaker is None:
+            _breaker = CircuitBreaker(
+                threshold=int(_setting('IMAGE_STORAGE_BREAKER_THRESHOLD', 5)),
+                reset_seconds=_setting('IMAGE_STORAGE_BREAKER_RESET_SECONDS', 30),
+            )
+        return _breaker
+
+
+def _record(operation, elapsed, ok):
+    with _lock:
+        histogram = _histograms.setdefault(operation, LatencyHistogram())
+        histogram.record(elapsed * 1000.0, ok)
+
+
+def _hedge_executor():
+    global _hedge_pool
+    with _lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='storage-hedge')
+        return _hedge_pool
+
+
+def storage_metrics():
+    """Latency histograms per storage operation and the circuit breaker state."""
+    breaker = get_breaker()
+    with _lock:
+        operations = {operation: histogram.snapshot() for operation, histogram in sorted(_histograms.items())}
+    return {
+        'operations': operations,
+        'circuit': {'state': breaker.state, 'consecutive_failures': breaker.failures},
+    }
+
+
+def reset_storage_state():
+    """Forget histograms and the circuit breaker (e.g. after changing the settings)."""
+    global _breaker
+    with _lock:
+        _histograms.clear()
+        _breaker = None
+
+
+def storage_call(storage, operation, call, before_retry=None):
+    """
+    `call()` through the resilience of `storage`, recorded as `operation`.
+
+    For requests made outside the Storage API (e.g. on the S3 client); on a
+    backend without ResilientStorageMixin `call` simply runs once.
+    """
+    if isinstance(storage, ResilientStorageMixin):
+        return storage.call(operation, call, before_retry=before_retry)
+    return call()
+
+
+def _reopener(content):
+    """
+    Callable opening a new File over the bytes of `content`, or None when it can't be reopened.
+
+    Files on disk are opened again by path and in-memory files get another
+    stream over the same buffer, so hedged attempts never copy the content.
+    """
+    if hasattr(content, 'temporary_file_path'):
+        path = content.temporary_file_path()
+        return lambda: File(open(path, 'rb'), name=content.name)
+    raw = getattr(content, 'file', content)
+    if isinstance(raw, io.BytesIO):
+        return lambda: File(io.BytesIO(raw.getvalue()), name=content.name)
+    return None
+
+
+class ResilientStorageMixin:
+    """Retries, circuit breaking, latency recording and (if `hedge_saves`) hedged saves."""
+
+    # Only backends where two concurrent saves of one name write the same object may hedge
+    hedge_saves = False
+
+    def _attempt(self, operation, call):
+        """One timed call through the circuit breaker."""
+        breaker = get_breaker()
+        if not breaker.allow():
+            _record(operation, 0.0, ok=False)
+            raise StorageUnavailable(f'Storage circuit is open; {operation} not attempted')
+        started = time.monotonic()
+        try:
+            result = call()
+        except Exception as e:
+            _record(operation, time.monotonic() - started, ok=False)
+            if is_transient(e):
+                breaker.record_failure()
+            else:
+                # The backend answered - it's healthy, the request was wrong
+                breaker.record_success()
+            raise
+        _record(operation, time.monotonic() - started, ok=True)
+        breaker.record_success()
+        return result
+
+    def _resilient(self, operation, call, before_retry=None):
+        """
+        `call()` with up to IMAGE_STORAGE_RETRIES retries of transient errors.
+
+        Each try goes through _attempt() as `operation`; with operation None
+        `call` makes its own attempts (hedged saves).
+        """
+        retries = int(_setting('IMAGE_STORAGE_RETRIES', 2))
+        base = _setting('IMAGE_STORAGE_BACKOFF_MS', 100) / 1000.0
+        cap = _setting('IMAGE_STORAGE_BACKOFF_MAX_MS', 2000) / 1000.0
+        for attempt in range(retries + 1):
+            try:
+                return self._attempt(operation, call) if operation else call()
+            except Exception as e:
+                if attempt == retries or not is_transient(e):
+                    raise
+            # Full jitter: spreads the retries of many workers hitting the same outage
+            time.sleep(random.uniform(0, min(cap, base * 2 ** attempt)))
+            if before_retry is not None:
+                before_retry()
+
+    def call(self, operation, call, before_retry=None):
+        """Run `call()` with this backend's breaker, retries and latency recording."""
+        return self._resilient(operation, call, before_retry=before_retry)
+
+    def _hedge_delay(self, content):
+        """Seconds after which a save of `content` is hedged, or 0 for no hedging."""
+        hedge_after = _setting('IMAGE_STORAGE_HEDGE_AFTER_MS', 0) / 1000.0
+        max_bytes = _setting('IMAGE_STORAGE_HEDGE_MAX_MB', 8) * 1024 * 1024
+        size = getattr(content, 'size', None)
+        if not self.hedge_saves or size is None or size > max_bytes or _reopener(content) is None:
+            return 0
+        return hedge_after
+
+    def _hedged(self, name, content, hedge_after):
+        """Save `content` with a second PUT if the first is still running after `hedge_after` seconds."""
+        # Each attempt reads its own stream over the same source
+        reopen = _reopener(content)
+        pool = _hedge_executor()
+
+        def put():
+            source = reopen()
+            try:
+                return self._attempt('save', lambda: super(ResilientStorageMixin, self)._save(name, source))
+            finally:
+                source.close()
+
+        first = pool.submit(put)
+        done, _ = wait([first], timeout=hedge_after)
+        if done:
+            return first.result()
+        _record('save_hedged', 0.0, ok=True)
+        attempts = [first, pool.submit(put)]
+        error = None
+        while attempts:
+            done, _ = wait(attempts, return_when=FIRST_COMPLETED)
+            for future in done:
+                attempts.remove(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+        raise error
+
+    def _save(self, name, content):
+        def rewind():
+            if hasattr(content, 'seek'):
+                content.seek(0)
+        hedge_after = self._hedge_delay(content)
+        if hedge_after:
+            return self._resilient(None, lambda: self._hedged(name, content, hedge_after), before_retry=rewind)
+        return self._resilient(
+            'save', lambda: super(ResilientStorageMixin, self)._save(name, content), before_retry=rewind
+        )
+
+    def _open(self, name, mode='rb'):
+        return self._resilient('open', lambda: super(ResilientStorageMixin, self)._open(name, mode))
+
+    def delete(self, name):
+        return self._resilient('delete', lambda: super(ResilientStorageMixin, self).delete(name))
+
+    def exists(self, name):
+        return self._resilient('exists', lambda: super(ResilientStorageMixin, self).exists(name))
+
+    def size(self, name):
+        return self._resilient('size', lambda: super(ResilientStorageMixin, self).size(name))
+
+
+class ResilientFileSystemStorage(ResilientStorageMixin, FileSystemStorage):
+    """FileSystemStorage with retries, circuit breaking and latency histograms (no hedging)."""
+
+
+if S3Boto3Storage is not None:
+    class ResilientS3Storage(ResilientStorageMixin, S3Boto3Storage):
+        """S3 / Cloudflare R2 storage with retries, hedged PUTs, circuit breaking and latency histograms."""
+
+        hedge_saves = True
@@ -0,0 +1,226 @@
+"""
+Incremental storage writers.
+
+Each writer accepts bytes chunk by chunk and pushes them to the configured
+storage backend as they arrive, so the whole file never has to sit in worker
+memory:
+
+- FileSystemStorage: bytes are appended straight to the final file on disk.
+- S3-compatible storage (Cloudflare R2): bytes are sent as an S3 multipart
+  upload; the part being collected is spooled to a temp file on disk.
+- Any other backend: bytes are spooled to a temporary file on disk and handed
+  to ``storage.save()`` once complete.
+
+Requests to the backend go through storage_call(), so a resilient storage's
+circuit breaker stops a streamed upload and transient errors are retried.
+"""
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+
+from .resilient_storage import storage_call
+
+# S3 requires every multipart part except the last to be at least 5 MiB
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
+
+def is_s3_storage(storage):
+    """Return True if `storage` is a django-storages S3 backend (R2 included)."""
+    return hasattr(storage, 'bucket_name') and hasattr(storage, 'connection')
+
+
+class LocalFileWriter:
+    """
+    Write chunks directly to the final path of a FileSystemStorage file.
+
+    With overwrite=True the bytes go to a sibling temp file that atomically
+    replaces the existing file on close, so readers never see a partial file.
+    """
+
+    def __init__(self, storage, name, overwrite=False):
+        self.storage = storage
+        self.name = name
+        self.path = storage.path(name)
+        directory = os.path.dirname(self.path)
+        storage_call(storage, 'stream_open', lambda: self._open(directory, overwrite))
+
+    def _open(self, directory, overwrite):
+        os.makedirs(directory, exist_ok=True)
+        if overwrite:
+            fd, self._write_path = tempfile.mkstemp(dir=directory, suffix='.part')
+            self._fh = os.fdopen(fd, 'wb')
+        else:
+            # 'xb' refuses to clobber an existing object with the same key
+            self._write_path = self.path
+            self._fh = open(self.path, 'xb')
+
+    def write(self, data):
+        self._fh.write(data)
+
+    def close(self):
+        self._fh.close()
+        if self._write_path != self.path:
+            storage_call(self.storage, 'stream_complete', lambda: os.replace(self._write_path, self.path))
+        if self.storage.file_permissions_mode is not None:
+            os.chmod(self.path, self.storage.file_permissions_mode)
+        return self.name
+
+    def abort(self):
+        try:
+            self._fh.close()
+        finally:
+            if os.path.exists(self._write_path):
+                os.remove(self._write_path)
+
+
+class S3MultipartWriter:
+    """
+    Stream chunks into an S3 object using the multipart upload API.
+
+    Small files (below one part) are sent with a single PutObject on close,
+    so the multipart round-trips are only paid for large uploads. The pending
+    part is collected in a temp file and sent from there, so memory use doesn't
+    grow with the part size.
+    """
+
+    def __init__(self, storage, name, content_type=None, part_size=None):
+        from storages.utils import clean_name
+
+        self.storage = storage
+        self.name = clean_name(name)
+        self.key = storage._normalize_name(self.name)
+        self.client = storage.connection.meta.client
+        self.bucket = storage.bucket_name
+        self.part_size = max(S3_MIN_PART_SIZE, int(part_size or DEFAULT_PART_SIZE))
+
+        self.params = storage._get_write_parameters(self.key)
+        if content_type:
+            self.params['ContentType'] = content_type
+
+        self._pending = tempfile.TemporaryFile()
+        self._buffered = 0
+        self._parts = []
+        self._upload_id = None
+
+    def write(self, data):
+        self._pending.write(data)
+        self._buffered += len(data)
+        if self._buffered >= self.part_size:
+            self._flush_part()
+
+    def _call(self, operation, call):
+        # Retried bodies are re-read from the start of the pending part
+        return storage_call(self.storage, operation, call, before_retry=lambda: self._pending.seek(0))
+
+    def _flush_part(self):
+        if self._upload_id is None:
+            response = self._call('stream_open', lambda: self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **self.params
+            ))
+            self._upload_id = response['UploadId']
+
+        part_number = len(self._parts) + 1
+        self._pending.seek(0)
+        response = self._call('stream_part', lambda: self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=self._pending,
+        ))
+        self._parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self._pending.seek(0)
+        self._pending.truncate()
+        self._buffered = 0
+
+    def close(self):
+        try:
+            if self._upload_id is None:
+                # Everything fit in a single part - one plain PUT is cheaper
+                self._pending.seek(0)
+                self._call('stream_put', lambda: self.client.put_object(
+                    Bucket=self.bucket, Key=self.key, Body=self._pending, **self.params
+                ))
+                return self.name
+
+            if self._buffered:
+                self._flush_part()
+            self._call('stream_complete', lambda: self.client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={'Parts': self._parts},
+            ))
+            return self.name
+        finally:
+            self._pending.close()
+
+    def abort(self):
+        self._pending.close()
+        self._buffered = 0
+        if self._upload_id is not None:
+            storage_call(self.storage, 'stream_abort', lambda: self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            ))
+            self._upload_id = None
+
+
+class SpooledStorageWriter:
+    """Fallback for other backends: spool to a temp file on disk, then save()."""
+
+    def __init__(self, storage, name, overwrite=False):
+        self.storage = storage
+        self.name = name
+        self.overwrite = overwrite
+        self._tmp = tempfile.TemporaryFile()
+
+    def write(self, data):
+        self._tmp.write(data)
+
+    def close(self):
+        try:
+            self._tmp.seek(0)
+            if self.overwrite:
+                self.storage.delete(self.name)
+            self.name = self.storage.save(self.name, File(self._tmp))
+        finally:
+            self._tmp.close()
+        return self.name
+
+    def abort(self):
+        self._tmp.close()
+
+
+def open_storage_writer(name, storage=None, content_type=None, part_size=None, overwrite=False):
+    """
+    Open an incremental writer for `name` on `storage` (default_storage if omitted).
+
+    The returned object supports write(bytes), close() -> stored name and abort().
+    S3 PUTs always replace the object; other backends refuse to overwrite an
+    existing file unless overwrite=True.
+    """
+    storage = storage or default_storage
+    if isinstance(storage, FileSystemStorage):
+        return LocalFileWriter(storage, name, overwrite=overwrite)
+    if is_s3_storage(storage):
+        return S3MultipartWriter(storage, name, content_type=content_type, part_size=part_size)
+    return SpooledStorageWriter(storage, name, overwrite=overwrite)
+
+
+def replace_stored_file(name, content, storage=None):
+    """
+    Replace the bytes of existing storage file `name` with Django File `content`.
+
+    The key (and therefore the public URL) stays the same.
+    """
+    writer = open_storage_writer(name, storage=storage, overwrite=True)
+    try:
+        for chunk in content.chunks():
+            writer.write(chunk)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close()
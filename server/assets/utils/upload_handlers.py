@@ -0,0 +1,251 @@
+"""
+Streaming upload handlers.
+
+Django's default handlers collect every uploaded file in memory (up to
+FILE_UPLOAD_MAX_MEMORY_SIZE) before the view runs. The handler here forwards
+each multipart chunk of the image field straight into storage while the body
+is parsed, hashing and counting the bytes on the way, so per-upload memory
+stays flat regardless of file size. On remote storage (R2) the bytes are also
+copied to a local temp file, so reading the upload afterwards (metadata,
+compression, derivatives) doesn't download it again.
+
+A screening handler placed in front of it refuses files with a disallowed
+name or non-image content as soon as their first bytes arrive, so the rest
+of the body is never read.
+"""
+import hashlib
+import os
+import tempfile
+import uuid
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+
+from .storage_writers import open_storage_writer
+
+
+# Leading bytes of the image formats we accept, mapped to their format name
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+)
+SNIFF_BYTES = 12
+
+
+def sniff_image_format(head):
+    """Return the image format of a file starting with `head`, or None if it isn't one we accept."""
+    if len(head) >= 12 and head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+
+class UploadScreeningHandler(FileUploadHandler):
+    """
+    Reject the `field_name` file before the rest of the request body is read.
+
+    The file name is checked against `allowed_extensions` when the part starts
+    and the content is sniffed from its first bytes. A rejected upload stops
+    parsing without draining the body, and `.rejection` holds the
+    (status, message) pair for the view to answer with. Accepted data passes
+    through to the next handler unchanged.
+    """
+
+    def __init__(self, request=None, field_name='image', allowed_extensions=()):
+        super().__init__(request)
+        self.target_field = field_name
+        self.allowed_extensions = allowed_extensions
+        self.active = False
+        self.head = None
+        self.rejection = None
+
+    def reject(self, status, message):
+        self.rejection = (status, message)
+        raise StopUpload(connection_reset=True)
+
+    def new_file(self, field_name, file_name, content_type, content_length, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, content_length, *args, **kwargs)
+        self.active = field_name == self.target_field
+        self.head = b'' if self.active else None
+        if self.active and os.path.splitext(file_name)[1].lower() not in self.allowed_extensions:
+            self.reject(415, f'Invalid file type. Allowed: {", ".join(self.allowed_extensions)}')
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.head is not None:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+            if len(self.head) >= SNIFF_BYTES:
+                if sniff_image_format(self.head) is None:
+                    self.reject(415, 'File content is not a supported image format.')
+                self.head = None
+        return raw_data
+
+    def file_complete(self, file_size):
+        # Files shorter than the sniff window are judged on what arrived
+        if self.head is not None and sniff_image_format(self.head) is None:
+            self.rejection = (415, 'File content is not a supported image format.')
+        self.active = False
+        self.head = None
+        return None
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    An uploaded file whose bytes already live in storage under `storage_name`.
+
+    Reading from it (e.g. for compression) lazily opens the stored object, so
+    nothing is loaded unless a caller actually needs the content.
+    """
+
+    def __init__(self, storage_name, name, content_type, size, sha256,
+                 charset=None, content_type_extra=None, storage=None):
+        self.storage_name = storage_name
+        self.sha256 = sha256
+        self._storage = storage or default_storage
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+
+    def _open_content(self):
+        return self._storage.open(self.storage_name, 'rb')
+
+    @property
+    def file(self):
+        if self._file is None:
+            self._file = self._open_content()
+        return self._file
+
+    @file.setter
+    def file(self, value):
+        self._file = value
+
+    def open(self, mode=None):
+        self.seek(0)
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class LocalCopyUploadedFile(StoredUploadedFile):
+    """
+    A StoredUploadedFile read from a local temp copy of the stored bytes.
+
+    The copy is made while streaming, so post-processing never downloads the
+    object it just uploaded. temporary_file_path() lets the compression pool
+    read the copy directly. close() removes the copy; reads after that fall
+    back to the stored object.
+    """
+
+    def __init__(self, *args, local_path, **kwargs):
+        self.local_path = local_path
+        super().__init__(*args, **kwargs)
+
+    def _open_content(self):
+        if self.local_path is not None:
+            return open(self.local_path, 'rb')
+        return super()._open_content()
+
+    def temporary_file_path(self):
+        return self.local_path
+
+    def close(self):
+        super().close()
+        if self.local_path is not None:
+            if os.path.exists(self.local_path):
+                os.remove(self.local_path)
+            self.local_path = None
+
+
+class StorageStreamingUploadHandler(FileUploadHandler):
+    """
+    Upload handler that writes the `field_name` file directly to storage.
+
+    Files are stored as ``<upload_to><uuid4><ext>`` and surfaced to the view as
+    `StoredUploadedFile` objects carrying the SHA-256 digest and byte count
+    (`LocalCopyUploadedFile` on remote storage, see the module docstring).
+    Other file fields fall through to the next handler untouched.
+    """
+
+    def __init__(self, request=None, field_name='image', upload_to='images/', part_size=None):
+        super().__init__(request)
+        self.target_field = field_name
+        self.upload_to = upload_to
+        self.part_size = part_size
+        self.active = False
+        self.writer = None
+        self.local_copy = None
+        self.stored_names = []
+
+    def new_file(self, field_name, file_name, content_type, content_length, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, content_length, *args, **kwargs)
+        self.active = field_name == self.target_field
+        if not self.active:
+            return
+
+        file_ext = os.path.splitext(file_name)[1].lower()
+        self.storage_name = f"{self.upload_to}{uuid.uuid4()}{file_ext}"
+        self.sha256 = hashlib.sha256()
+        self.writer = open_storage_writer(
+            self.storage_name, content_type=content_type, part_size=self.part_size
+        )
+        if not isinstance(default_storage, FileSystemStorage):
+            # Remote storage: keep a local copy for post-processing
+            self.local_copy = tempfile.NamedTemporaryFile(suffix=file_ext, delete=False)
+        # We own this file - don't let the memory/temp-file handlers buffer it too
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        self.sha256.update(raw_data)
+        self.writer.write(raw_data)
+        if self.local_copy is not None:
+            self.local_copy.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+
+        self.active = False
+        stored_name = self.writer.close()
+        self.writer = None
+        self.stored_names.append(stored_name)
+
+        kwargs = dict(
+            storage_name=stored_name,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            sha256=self.sha256.hexdigest(),
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+        if self.local_copy is None:
+            return StoredUploadedFile(**kwargs)
+        self.local_copy.close()
+        local_path, self.local_copy = self.local_copy.name, None
+        return LocalCopyUploadedFile(local_path=local_path, **kwargs)
+
+    def upload_interrupted(self):
+        self.abort()
+
+    def abort(self):
+        """Abort any in-flight write (e.g. when parsing raised mid-file)."""
+        if self.writer is not None:
+            try:
+                self.writer.abort()
+            except Exception as e:
+                print(f"Warning: Failed to abort streamed upload {self.storage_name}: {e}")
+            self.writer = None
+        if self.local_copy is not None:
+            self.local_copy.close()
+            os.remove(self.local_copy.name)
+            self.local_copy = None
+        self.active = False
@@ -0,0 +1,252 @@
+"""
+Resumable chunked uploads.
+
+A client creates an UploadSession, PUTs chunks at increasing offsets and
+finally completes the session. Each chunk is first received into a temp file
+(receive_chunk(), no row lock held while a slow client sends it) and then
+appended to a per-session spool file on local disk. A connection that drops
+mid-chunk still keeps everything that arrived; the client asks for the
+current offset and resends only the missing tail.
+
+On S3-compatible storage (Cloudflare R2) the spool only holds the bytes not
+yet sent: whenever it reaches a full part it is pushed as one part of an S3
+multipart upload and truncated. Other backends receive the whole spool file
+with a single storage.save() on completion. Requests to the S3 client go
+through storage_call(), like the streaming writers.
+
+The spool and the session row can drift apart when a request dies between
+writing one and saving the other. Every request that touches a session first
+calls reconcile_spool(): the spool must hold exactly `offset` minus the bytes
+already sent as parts. Extra bytes (written, offset never saved) are cut off;
+missing bytes (spool lost or truncated before the row was saved) move the
+offset back so the client resends them.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import UnreadablePostError
+
+from .resilient_storage import storage_call
+from .storage_writers import DEFAULT_PART_SIZE, S3_MIN_PART_SIZE, is_s3_storage
+
+READ_SIZE = 64 * 1024
+
+
+def spool_dir():
+    """Directory holding session spool files (IMAGE_UPLOAD_SESSION_DIR)."""
+    path = getattr(settings, 'IMAGE_UPLOAD_SESSION_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'tcb_upload_sessions'
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def spool_path(session):
+    return os.path.join(spool_dir(), f"{session.id}.part")
+
+
+def _part_size():
+    part_mb = getattr(settings, 'IMAGE_STREAM_PART_SIZE_MB', 8)
+    return max(S3_MIN_PART_SIZE, int(part_mb * 1024 * 1024) if part_mb else DEFAULT_PART_SIZE)
+
+
+def _s3_target(storage):
+    return storage.connection.meta.client, storage.bucket_name
+
+
+def _s3_key(storage, session):
+    from storages.utils import clean_name
+    return storage._normalize_name(clean_name(session.storage_key))
+
+
+def _parts_size(session):
+    # Parts recorded before sizes were stored were all full parts
+    return sum(part.get('Size', _part_size()) for part in session.s3_parts)
+
+
+def reconcile_spool(session):
+    """
+    Bring the spool file of `session` in line with its saved offset.
+
+    Returns: True if `session.offset` moved back (the caller saves it)
+    """
+    path = spool_path(session)
+    expected = max(0, session.offset - _parts_size(session))
+    spooled = os.path.getsize(path) if os.path.exists(path) else 0
+    if spooled > expected:
+        with open(path, 'r+b') as fh:
+            fh.truncate(expected)
+    elif spooled < expected:
+        session.offset -= expected - spooled
+        return True
+    return False
+
+
+def _flush_part(session, storage, final=False):
+    """Send the spooled bytes as the next multipart part once a full part (or the tail) is ready."""
+    path = spool_path(session)
+    spooled = os.path.getsize(path) if os.path.exists(path) else 0
+    if not spooled or (spooled < _part_size() and not final):
+        return
+
+    client, bucket = _s3_target(storage)
+    key = _s3_key(storage, session)
+    if session.s3_upload_id is None:
+        params = storage._get_write_parameters(key)
+        params['ContentType'] = session.content_type
+        session.s3_upload_id = storage_call(
+            storage, 'stream_open', lambda: client.create_multipart_upload(Bucket=bucket, Key=key, **params)
+        )['UploadId']
+
+    part_number = len(session.s3_parts) + 1
+    with open(path, 'rb') as fh:
+        response = storage_call(storage, 'stream_part', lambda: client.upload_part(
+            Bucket=bucket, Key=key, UploadId=session.s3_upload_id, PartNumber=part_number, Body=fh
+        ), before_retry=lambda: fh.seek(0))
+    session.s3_parts = session.s3_parts + [{'PartNumber': part_number, 'ETag': response['ETag'], 'Size': spooled}]
+    # Record the part before dropping its bytes from the spool. Should the
+    # transaction still roll back, reconcile_spool() moves the offset back to
+    # the last recorded part on the next request.
+    session.save(update_fields=['offset', 's3_upload_id', 's3_parts', 'updated_at'])
+    open(path, 'wb').close()
+
+
+def receive_chunk(stream, length):
+    """
+    Read up to `length` bytes of `stream` into a temp file beside the spools.
+
+    Stops early if the client goes away; the bytes that arrived are kept.
+
+    Returns: (temp file positioned at its start, number of bytes read)
+    """
+    chunk = tempfile.TemporaryFile(dir=spool_dir())
+    received = 0
+    try:
+        while received < length:
+            data = stream.read(min(READ_SIZE, length - received))
+            if not data:
+                break
+            chunk.write(data)
+            received += len(data)
+    except UnreadablePostError:
+        # Client went away mid-chunk - the received prefix is still appended
+        pass
+    chunk.seek(0)
+    return chunk, received
+
+
+def append_chunk(session, stream, length, start, storage=None):
+    """
+    Append up to `length` bytes read from `stream`, which begin at file offset `start`.
+
+    `start` may be before `session.offset` (a resent chunk); bytes the session
+    already has are skipped. Bytes are stored as they are read, so if the
+    client disconnects mid-chunk the received prefix is kept. The caller
+    saves the session.
+
+    Returns: number of new bytes stored
+    """
+    storage = storage or default_storage
+    reconcile_spool(session)
+    if start > session.offset:
+        # The spool lost bytes; the client resumes from the moved-back offset
+        return 0
+    skip = session.offset - start
+    received = 0
+    with open(spool_path(session), 'ab') as fh:
+        remaining = length
+        try:
+            while remaining and session.offset < session.size:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                if skip >= len(data):
+                    skip -= len(data)
+                    continue
+                data = data[skip:session.size - session.offset + skip]
+                skip = 0
+                fh.write(data)
+                session.offset += len(data)
+                received += len(data)
+        except UnreadablePostError:
+            # Client went away mid-chunk - keep what arrived, it resumes from session.offset
+            pass
+
+    if is_s3_storage(storage):
+        try:
+            _flush_part(session, storage)
+        except Exception as e:
+            # The bytes stay in the spool and go out with the next flush
+            print(f"Warning: Failed to upload part for session {session.id}: {e}")
+    return received
+
+
+def finalize_session(session, storage=None):
+    """
+    Move the received bytes into storage under `session.storage_key`.
+
+    Returns: (stored name, sha256 hex digest or None when the bytes never
+    passed through the spool as a whole)
+    """
+    storage = storage or default_storage
+    path = spool_path(session)
+
+    if is_s3_storage(storage):
+        client, bucket = _s3_target(storage)
+        key = _s3_key(storage, session)
+        if session.s3_upload_id is None:
+            # Everything fit in the spool - one plain PUT, and we can hash it on the way
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as fh:
+                for chunk in iter(lambda: fh.read(READ_SIZE), b''):
+                    sha256.update(chunk)
+                fh.seek(0)
+                params = storage._get_write_parameters(key)
+                params['ContentType'] = session.content_type
+                storage_call(storage, 'stream_put', lambda: client.put_object(
+                    Bucket=bucket, Key=key, Body=fh, **params
+                ), before_retry=lambda: fh.seek(0))
+            discard_spool(session)
+            return session.storage_key, sha256.hexdigest()
+
+        _flush_part(session, storage, final=True)
+        storage_call(storage, 'stream_complete', lambda: client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=session.s3_upload_id,
+            MultipartUpload={'Parts': [
+                {'PartNumber': part['PartNumber'], 'ETag': part['ETag']} for part in session.s3_parts
+            ]},
+        ))
+        discard_spool(session)
+        return session.storage_key, None
+
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(READ_SIZE), b''):
+            sha256.update(chunk)
+        fh.seek(0)
+        name = storage.save(session.storage_key, File(fh))
+    discard_spool(session)
+    return name, sha256.hexdigest()
+
+
+def discard_spool(session):
+    path = spool_path(session)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def abort_session(session, storage=None):
+    """Drop the spool file and any unfinished S3 multipart upload of `session`."""
+    storage = storage or default_storage
+    discard_spool(session)
+    if session.s3_upload_id and is_s3_storage(storage):
+        client, bucket = _s3_target(storage)
+        storage_call(storage, 'stream_abort', lambda: client.abort_multipart_upload(
+            Bucket=bucket, Key=_s3_key(storage, session), UploadId=session.s3_upload_id
+        ))
+        session.s3_upload_id = None
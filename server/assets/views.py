@@ -4,12 +4,26 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-from .models import Image, PendingFileDeletion
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.urls import reverse
+from .models import DirectUpload, Image, PendingFileDeletion, UploadSession, normalize_client_id
 from .utils.client_validator import validate_client_id
+from .utils.derivatives import derivative_urls
+from .utils.idempotency import claim_request, idempotent, stored_response_exists
+from .utils.resilient_storage import StorageUnavailable
+from .utils.ingest import ingest_upload
+from .utils.upload_handlers import (
+    SNIFF_BYTES, StorageStreamingUploadHandler, UploadScreeningHandler, sniff_image_format,
+)
+from .utils import image_search, list_cursor
 import uuid
 import os
 
 
+ALLOWED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
+
+
 def queue_file_for_deletion(file_path, client_id=None):
     """
     Queue a file for deferred deletion.
@@ -25,8 +39,148 @@ def queue_file_for_deletion(file_path, client_id=None):
         print(f"Warning: Failed to queue file for deletion: {e}")
 
 
+def queue_unreferenced_files_for_deletion(entries):
+    """
+    Queue stored files for deferred deletion once no Image row references them.
+
+    Stored bytes are shared between rows with identical content (deduplication),
+    so a file is only released when its last reference is gone. Call this after
+    the referencing rows have been deleted.
+
+    `entries` is an iterable of (file_path, client_id) or
+    (file_path, client_id, derivatives) tuples; the derivatives of a released
+    file are queued together with it.
+    Returns the number of files queued.
+    """
+    candidates = {}
+    for file_path, client_id, *extra in entries:
+        if file_path:
+            candidates.setdefault(file_path, (client_id, extra[0] if extra else None))
+
+    pending_deletions = []
+    paths = list(candidates)
+    for start in range(0, len(paths), 1000):
+        batch = paths[start:start + 1000]
+        still_referenced = set(
+            Image.objects.filter(image__in=batch).values_list('image', flat=True)
+        )
+        for file_path in batch:
+            if file_path not in still_referenced:
+                client_id, derivatives = candidates[file_path]
+                pending_deletions.append(PendingFileDeletion(file_path=file_path, client_id=client_id))
+                for path in (derivatives or {}).values():
+                    pending_deletions.append(
+                        PendingFileDeletion(file_path=path, original_path=file_path, client_id=client_id)
+                    )
+
+    # Bulk insert all at once
+    if pending_deletions:
+        PendingFileDeletion.objects.bulk_create(pending_deletions, batch_size=1000)
+    return len(pending_deletions)
+
+
+def is_file_referenced(file_path, original_path=None):
+    """
+    Return True if any Image row still points at `file_path` in storage.
+
+    A derivative (queued with the `original_path` it was made from) is kept
+    while a row still references that original: deduplicated rows share the
+    original's derivatives in Image.derivatives.
+    """
+    paths = [file_path, original_path] if original_path else [file_path]
+    return Image.objects.filter(image__in=paths).exists()
+
+
+def upload_response(image_obj, details):
+    """
+    JSON response for a newly created image (shared by the upload endpoints).
+    
+    Deferred compression answers 202 Accepted with a 'status_url' to poll.
+    """
+    response_status = 201
+    response_extra = {}
+    if image_obj.compression_status in (Image.COMPRESSION_PENDING, Image.COMPRESSION_PROCESSING):
+        # Accepted: the optimized version is produced in the background
+        response_status = 202
+        response_extra['status_url'] = reverse('get_compression_status', args=[image_obj.id])
+
+    return JsonResponse({
+        'success': True,
+        'id': image_obj.id,
+        'url': image_obj.image.url if image_obj.image else None,
+        'filename': image_obj.filename,
+        'original_filename': image_obj.original_filename,
+        'client_id': image_obj.client_id,
+        'name': image_obj.name,
+        'description': image_obj.description,
+        'size': image_obj.size,
+        'width': image_obj.width,
+        'height': image_obj.height,
+        'original_width': image_obj.original_width,
+        'original_height': image_obj.original_height,
+        'format': image_obj.format,
+        'content_hash': image_obj.content_hash,
+        'placeholder': image_obj.placeholder,
+        'derivatives': derivative_urls(image_obj.derivatives),
+        'compressed': details['compressed'],
+        'compression_info': details['compression_info'],
+        'compression_status': image_obj.compression_status,
+        'deduplicated': details['deduplicated'],
+        'uploaded_at': image_obj.uploaded_at.isoformat(),
+        **response_extra
+    }, status=response_status)
+
+
+def reject_early(request, max_request_bytes):
+    """
+    Refuse a request from its headers alone, before any of the body is read.
+    
+    Checks the declared Content-Length against `max_request_bytes` (413) and,
+    when the client sends an X-Client-Id header, validates that client (403).
+    Returns the JsonResponse to send, or None to go on.
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > max_request_bytes:
+        return JsonResponse({
+            'success': False,
+            'error': f'Request too large. Maximum upload size is {max_request_bytes} bytes.'
+        }, status=413)
+
+    header_client_id = request.headers.get('X-Client-Id', '').strip()
+    if header_client_id:
+        is_valid, error_message = validate_client_id(header_client_id)
+        if not is_valid:
+            return JsonResponse({
+                'success': False,
+                'error': error_message
+            }, status=403)
+    return None
+
+
+def wants_deferred_compression(request):
+    """The 'defer_compression' form field, defaulting to IMAGE_DEFERRED_COMPRESSION."""
+    from django.conf import settings as django_settings
+
+    defer_compression = request.POST.get('defer_compression')
+    if defer_compression is None:
+        return getattr(django_settings, 'IMAGE_DEFERRED_COMPRESSION', False)
+    return defer_compression.strip().lower() in ('1', 'true', 'yes')
+
+
+def is_client_encoded(request):
+    """
+    The 'X-Client-Encoded' header: the client already encoded the file against
+    /api/config/, so a compliant upload is stored without another encode pass.
+    """
+    return request.headers.get('X-Client-Encoded', '').strip().lower() in ('1', 'true', 'yes')
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
+@idempotent
 def upload_image(request):
     """
     Upload an image to Cloudflare R2 bucket and return its URL.
@@ -34,8 +188,68 @@ def upload_image(request):
     Expected: POST request with 'image' file in multipart/form-data
     Optional: 'name' and 'description' fields
     Returns: JSON with image URL and metadata
+    
+    When IMAGE_STREAM_UPLOADS_TO_STORAGE is enabled the image bytes are written
+    to storage while the request body is parsed, so the file is never held in
+    worker memory. A stored file that ends up rejected is queued for deletion.
+    
+    Bad requests are refused before the body is read where possible: an
+    oversized Content-Length (413), an invalid 'X-Client-Id' header (403) and a
+    file whose name or first bytes aren't an allowed image (415).
+    
+    A retry sent with the same 'Idempotency-Key' header (for the same client)
+    gets the stored response replayed without the upload running again; the
+    key reused for a different request gets 422.
+    """
+    early_response = reject_early(request, upload_max_request_bytes())
+    if early_response is not None:
+        return early_response
+    return handle_upload(request)
+
+
+def upload_max_request_bytes():
+    """Largest request body accepted by upload_image (IMAGE_UPLOAD_MAX_REQUEST_MB)."""
+    from django.conf import settings as django_settings
+
+    return int(float(getattr(django_settings, 'IMAGE_UPLOAD_MAX_REQUEST_MB', 25)) * 1024 * 1024)
+
+
+def handle_upload(request):
+    """
+    Parse, validate and ingest the body of an upload that passed reject_early().
+    
+    Shared by the sync and async upload views. Blocking: reads the request
+    body, writes to storage and the database.
     """
+    from django.conf import settings as django_settings
+
+    header_client_id = request.headers.get('X-Client-Id', '').strip()
+
+    stream_handler = None
+    # A replayed Idempotency-Key must not write the file to storage again
+    if getattr(django_settings, 'IMAGE_STREAM_UPLOADS_TO_STORAGE', False) and not stored_response_exists(request):
+        # Must be installed before request.POST / request.FILES are touched
+        stream_handler = StorageStreamingUploadHandler(
+            request,
+            part_size=getattr(django_settings, 'IMAGE_STREAM_PART_SIZE_MB', 8) * 1024 * 1024,
+        )
+        request.upload_handlers.insert(0, stream_handler)
+    # Runs first so a rejected file is never streamed or buffered past its first chunk
+    screening_handler = UploadScreeningHandler(request, allowed_extensions=ALLOWED_IMAGE_EXTENSIONS)
+    request.upload_handlers.insert(0, screening_handler)
+
+    client_id = None
+    claimed_name = None
     try:
+        # Parsing stops at the first bytes of a file the screening handler refuses
+        request.FILES
+        if screening_handler.rejection:
+            status, message = screening_handler.rejection
+            return JsonResponse({
+                'success': False,
+                'error': message
+            }, status=status)
+
         # Check if image file is present
         if 'image' not in request.FILES:
             return JsonResponse({
@@ -48,7 +262,7 @@ def upload_image(request):
         # Get name, description, and client_id from POST data
         name = request.POST.get('name', None)
         description = request.POST.get('description', None)
-        client_id = request.POST.get('client_id', None)
+        client_id = request.POST.get('client_id', None) or header_client_id or None
 
         # client_id is required
         if not client_id:
@@ -56,81 +270,829 @@ def upload_image(request):
                 'success': False,
                 'error': 'client_id is required'
             }, status=400)
+
+        if header_client_id and client_id.strip() != header_client_id:
+            return JsonResponse({
+                'success': False,
+                'error': 'client_id does not match the X-Client-Id header'
+            }, status=400)
+        
+        # Validate client_id against remote API (already done for an X-Client-Id header)
+        if not header_client_id:
+            is_valid, error_message = validate_client_id(client_id)
+            if not is_valid:
+                return JsonResponse({
+                    'success': False,
+                    'error': error_message
+                }, status=403)
+
+        replay = claim_request(request, client_id)
+        if replay is not None:
+            return replay
+
+        # Deferred mode stores the original now and compresses in a background worker
+        image_obj, details = ingest_upload(
+            image_file, client_id, name=name, description=description,
+            defer_compression=wants_deferred_compression(request),
+            client_encoded=is_client_encoded(request),
+        )
+        claimed_name = image_obj.image.name
+
+        return upload_response(image_obj, details)
         
-        # Validate client_id against remote API
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Upload failed: {str(e)}'
+        }, status=500)
+
+    finally:
+        if stream_handler is not None:
+            stream_handler.abort()
+            # Streamed files not referenced by the new Image row (rejected or replaced
+            # by a compressed copy) are queued for background deletion
+            for stored_name in stream_handler.stored_names:
+                if stored_name != claimed_name:
+                    queue_file_for_deletion(stored_name, client_id)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@idempotent
+def upload_image_batch(request):
+    """
+    Upload many images in one multipart request.
+    
+    Expected: POST request with one or more 'images' files and 'client_id' in multipart/form-data
+    Optional: 'metadata' - JSON array of {"name": ..., "description": ...} objects in
+    the same order as the files, and 'defer_compression'
+    Returns: JSON with one result per file (in upload order) plus created/failed counts
+    
+    The client is validated once, files are written to storage in parallel and
+    all rows are inserted with a single bulk_create. A bad file only fails its
+    own entry (415 for a name or content that isn't an allowed image). Supports the 'Idempotency-Key' header like upload_image.
+    """
+    from django.conf import settings as django_settings
+
+    max_request_bytes = int(float(getattr(django_settings, 'IMAGE_BATCH_UPLOAD_MAX_REQUEST_MB', 200)) * 1024 * 1024)
+    early_response = reject_early(request, max_request_bytes)
+    if early_response is not None:
+        return early_response
+    header_client_id = request.headers.get('X-Client-Id', '').strip()
+
+    # Spool every file to disk: the default handlers would keep each file up to
+    # FILE_UPLOAD_MAX_MEMORY_SIZE in memory, i.e. most of a 200 MB batch per worker.
+    # Files are screened per item below, since a bad file only fails its own entry.
+    request.upload_handlers = [TemporaryFileUploadHandler(request)]
+
+    try:
+        import json
+        from .utils.batch_upload import BatchItem, ingest_batch
+
+        uploads = request.FILES.getlist('images')
+        client_id = request.POST.get('client_id', None) or header_client_id or None
+
+        if not uploads:
+            return JsonResponse({
+                'success': False,
+                'error': 'No image files provided. Please send files with key "images".'
+            }, status=400)
+
+        max_files = int(getattr(django_settings, 'IMAGE_BATCH_UPLOAD_MAX_FILES', 100))
+        if len(uploads) > max_files:
+            return JsonResponse({
+                'success': False,
+                'error': f'Too many files. Maximum is {max_files} per batch.'
+            }, status=400)
+
+        if not client_id:
+            return JsonResponse({
+                'success': False,
+                'error': 'client_id is required'
+            }, status=400)
+
+        try:
+            metadata = json.loads(request.POST.get('metadata') or '[]')
+        except json.JSONDecodeError:
+            metadata = None
+        if not isinstance(metadata, list):
+            return JsonResponse({
+                'success': False,
+                'error': 'metadata must be a JSON array with one object per file.'
+            }, status=400)
+
+        if header_client_id and client_id.strip() != header_client_id:
+            return JsonResponse({
+                'success': False,
+                'error': 'client_id does not match the X-Client-Id header'
+            }, status=400)
+
+        # Validate client_id against remote API - once for the whole batch
+        if not header_client_id:
+            is_valid, error_message = validate_client_id(client_id)
+            if not is_valid:
+                return JsonResponse({
+                    'success': False,
+                    'error': error_message
+                }, status=403)
+
+        replay = claim_request(request, client_id)
+        if replay is not None:
+            return replay
+
+        items = []
+        for index, upload in enumerate(uploads):
+            meta = metadata[index] if index < len(metadata) and isinstance(metadata[index], dict) else {}
+            item = BatchItem(index, upload, name=meta.get('name') or None, description=meta.get('description') or None)
+            file_ext = os.path.splitext(upload.name)[1].lower()
+            if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
+                item.error = f'Invalid file type. Allowed: {", ".join(ALLOWED_IMAGE_EXTENSIONS)}'
+                item.error_status = 415
+            else:
+                head = upload.read(SNIFF_BYTES)
+                upload.seek(0)
+                if sniff_image_format(head) is None:
+                    item.error = 'File content is not a supported image format.'
+                    item.error_status = 415
+            items.append(item)
+
+        results = ingest_batch(
+            items, client_id, defer_compression=wants_deferred_compression(request),
+            client_encoded=is_client_encoded(request),
+        )
+        created_count = sum(1 for result in results if result['success'])
+        failed_count = len(results) - created_count
+
+        if failed_count == 0:
+            status = 201
+        elif created_count:
+            status = 207  # Multi-Status: some files failed, see results
+        else:
+            status = 400
+
+        return JsonResponse({
+            'success': failed_count == 0,
+            'client_id': client_id,
+            'created_count': created_count,
+            'failed_count': failed_count,
+            'results': results
+        }, status=status)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Batch upload failed: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_compression_status(request, image_id):
+    """
+    Report the deferred compression state of an image.
+    
+    Expected: GET request with image_id in URL
+    Returns: JSON with 'compression_status' (none, pending, processing, done, failed) and
+    'optimized_ready', which is true once the stored file is final
+    """
+    try:
+        try:
+            image_obj = Image.objects.only(
+                'id', 'image', 'size', 'compression_status', 'compression_error'
+            ).get(id=image_id)
+        except Image.DoesNotExist:
+            return JsonResponse({
+                'success': False,
+                'error': f'Image with id {image_id} not found.'
+            }, status=404)
+
+        return JsonResponse({
+            'success': True,
+            'id': image_obj.id,
+            'compression_status': image_obj.compression_status,
+            'optimized_ready': image_obj.compression_status in (Image.COMPRESSION_NONE, Image.COMPRESSION_DONE),
+            'url': image_obj.image.url if image_obj.image else None,
+            'size': image_obj.size,
+            'error': image_obj.compression_error
+        }, status=200)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Failed to get compression status: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def init_direct_upload(request):
+    """
+    Step 1 of a direct-to-R2 upload: validate the client and hand out a presigned PUT URL.
+    
+    Expected: POST request with JSON body containing 'client_id' and 'filename'
+    Optional: 'content_type' and 'size' (bytes; signed into the URL when given)
+    Returns: JSON with 'upload_url', the headers to send with the PUT, the storage
+    'key' and an 'upload_token' to pass to /api/upload/complete/
+    """
+    try:
+        import json
+        import mimetypes
+        from django.conf import settings as django_settings
+        from .utils.direct_upload import create_presigned_put, direct_uploads_supported, sign_upload_token
+
+        if not direct_uploads_supported():
+            return JsonResponse({
+                'success': False,
+                'error': 'Direct uploads require S3-compatible storage (CLOUDFLARE_R2_ENABLED=true).'
+            }, status=501)
+
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid JSON in request body.'
+            }, status=400)
+
+        client_id = str(data.get('client_id') or '').strip()
+        original_filename = os.path.basename(str(data.get('filename') or '').strip())
+
+        if not client_id:
+            return JsonResponse({
+                'success': False,
+                'error': 'client_id is required'
+            }, status=400)
+
+        if not original_filename:
+            return JsonResponse({
+                'success': False,
+                'error': 'filename is required'
+            }, status=400)
+
         is_valid, error_message = validate_client_id(client_id)
         if not is_valid:
             return JsonResponse({
                 'success': False,
                 'error': error_message
             }, status=403)
-        
-        # Validate file type (basic check)
-        allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']
-        file_ext = os.path.splitext(image_file.name)[1].lower()
-        
-        if file_ext not in allowed_extensions:
+
+        file_ext = os.path.splitext(original_filename)[1].lower()
+        if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
             return JsonResponse({
                 'success': False,
-                'error': f'Invalid file type. Allowed: {", ".join(allowed_extensions)}'
+                'error': f'Invalid file type. Allowed: {", ".join(ALLOWED_IMAGE_EXTENSIONS)}'
             }, status=400)
 
-        # If the upload is bigger than server threshold, try server-side compression
+        max_bytes = int(float(getattr(django_settings, 'IMAGE_DIRECT_UPLOAD_MAX_MB', 10)) * 1024 * 1024)
+        size = data.get('size')
+        if size is not None:
+            try:
+                size = int(size)
+            except (TypeError, ValueError):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'size must be an integer number of bytes.'
+                }, status=400)
+            if size > max_bytes:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'File too large. Maximum size is {max_bytes} bytes.'
+                }, status=413)
+
+        content_type = data.get('content_type') or mimetypes.guess_type(original_filename)[0] or 'application/octet-stream'
+        unique_filename = f"{uuid.uuid4()}{file_ext}"
+        key = f"images/{unique_filename}"
+        expires_in = int(getattr(django_settings, 'IMAGE_DIRECT_UPLOAD_EXPIRY_SECONDS', 900))
+
+        upload_url, upload_headers = create_presigned_put(key, content_type, size, expires_in)
+        # Recorded so an object that is PUT but never completed can be cleaned up
+        DirectUpload.objects.create(key=key, client_id=client_id, original_filename=original_filename)
+        upload_token = sign_upload_token({
+            'key': key,
+            'client_id': client_id,
+            'original_filename': original_filename,
+            'size': size,
+        })
+
+        return JsonResponse({
+            'success': True,
+            'upload_url': upload_url,
+            'method': 'PUT',
+            'headers': upload_headers,
+            'key': key,
+            'upload_token': upload_token,
+            'expires_in': expires_in
+        }, status=200)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Upload init failed: {str(e)}'
+        }, status=500)
+
+
+def complete_in_progress(row):
+    """
+    True while a complete request holds the claim on `row` (DirectUpload or UploadSession).
+
+    Claims older than IMAGE_UPLOAD_COMPLETE_TIMEOUT_SECONDS (crashed worker) don't count.
+    """
+    from datetime import timedelta
+    from django.conf import settings as django_settings
+    from django.utils import timezone
+
+    timeout = timedelta(seconds=int(getattr(django_settings, 'IMAGE_UPLOAD_COMPLETE_TIMEOUT_SECONDS', 300)))
+    return (
+        row.status == row.STATUS_COMPLETING
+        and row.claimed_at is not None and row.claimed_at > timezone.now() - timeout
+    )
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def complete_direct_upload(request):
+    """
+    Step 2 of a direct-to-R2 upload: confirm the object exists and ingest it.
+    
+    Expected: POST request with JSON body containing the 'upload_token' from /api/upload/init/
+    Optional: 'name', 'description' and 'defer_compression'
+    Returns: JSON with image URL and metadata (same shape as /api/upload/)
+    
+    The stored object goes through the same pipeline as /api/upload/: content
+    sniffing (415), deduplication, compression, derivatives and metadata.
+    Completing an already completed upload returns the same image.
+    """
+    try:
+        import json
         from django.conf import settings as django_settings
+        from django.core import signing
+        from django.utils import timezone
+        from .utils.direct_upload import head_stored_object, read_stored_head, read_upload_token
+        from .utils.upload_handlers import StoredUploadedFile
+
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid JSON in request body.'
+            }, status=400)
+
+        # Tokens stay valid a little longer than the URL so a PUT that started just
+        # before expiry can still be completed
+        expires_in = int(getattr(django_settings, 'IMAGE_DIRECT_UPLOAD_EXPIRY_SECONDS', 900))
         try:
-            max_mb = float(getattr(django_settings, 'IMAGE_MAX_UPLOAD_MB', 1))
+            upload = read_upload_token(data.get('upload_token') or '', max_age=expires_in * 2)
+        except signing.BadSignature:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid or expired upload_token.'
+            }, status=400)
+
+        key = upload['key']
+        client_id = upload['client_id']
+
+        # Claim the upload in a short transaction; the object is ingested outside it
+        with transaction.atomic():
+            # The row lock serializes concurrent completes of the same upload
+            direct_upload = DirectUpload.objects.select_for_update().filter(key=key).first()
+            if direct_upload is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Upload not found or expired. Start a new upload.'
+                }, status=400)
+
+            if direct_upload.status == DirectUpload.STATUS_COMPLETE:
+                if direct_upload.image is None:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'Upload is complete but its image was deleted.'
+                    }, status=410)
+                response = upload_response(
+                    direct_upload.image, {'compressed': False, 'compression_info': None, 'deduplicated': False}
+                )
+                response.status_code = 200
+                return response
+
+            if complete_in_progress(direct_upload):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'This upload is already being completed. Retry shortly.'
+                }, status=409)
+
+            direct_upload.status = DirectUpload.STATUS_COMPLETING
+            direct_upload.claimed_at = timezone.now()
+            direct_upload.save(update_fields=['status', 'claimed_at'])
+
+        try:
+            stored = head_stored_object(key)
+            if stored is None:
+                rejection = (400, 'Uploaded object not found. PUT the file to upload_url before completing.')
+            else:
+                max_bytes = int(float(getattr(django_settings, 'IMAGE_DIRECT_UPLOAD_MAX_MB', 10)) * 1024 * 1024)
+                if stored['size'] > max_bytes:
+                    rejection = (413, f'File too large. Maximum size is {max_bytes} bytes.')
+                elif sniff_image_format(read_stored_head(key, SNIFF_BYTES)) is None:
+                    rejection = (415, 'File content is not a supported image format.')
+                else:
+                    rejection = None
         except Exception:
-            max_mb = 1.0
-
-        compressed_flag = False
-        if getattr(image_file, 'size', 0) > max_mb * 1024 * 1024:
-            from .utils.compress_image import compress_image_file
-            compressed = compress_image_file(
-                image_file,
-                max_size_mb=max_mb,
-                initial_quality=getattr(django_settings, 'IMAGE_COMPRESSION_QUALITY', 80),
-                min_quality=getattr(django_settings, 'IMAGE_COMPRESSION_MIN_QUALITY', 45),
+            # Storage trouble - release the claim so the client can retry
+            DirectUpload.objects.filter(pk=direct_upload.pk).update(status=DirectUpload.STATUS_OPEN, claimed_at=None)
+            raise
+
+        if rejection is not None:
+            status, message = rejection
+            if stored is None:
+                # Not PUT yet - the client may still upload and complete again
+                DirectUpload.objects.filter(pk=direct_upload.pk).update(
+                    status=DirectUpload.STATUS_OPEN, claimed_at=None
+                )
+            else:
+                queue_file_for_deletion(key, client_id)
+                direct_upload.delete()
+            return JsonResponse({
+                'success': False,
+                'error': message
+            }, status=status)
+
+        defer_compression = data.get('defer_compression')
+        if defer_compression is None:
+            defer_compression = getattr(django_settings, 'IMAGE_DEFERRED_COMPRESSION', False)
+        elif isinstance(defer_compression, str):
+            defer_compression = defer_compression.strip().lower() in ('1', 'true', 'yes')
+
+        try:
+            image_file = StoredUploadedFile(
+                storage_name=key,
+                name=upload['original_filename'],
+                content_type=stored['content_type'] or 'application/octet-stream',
+                size=stored['size'],
+                sha256=None,
+            )
+            image_obj, details = ingest_upload(
+                image_file, client_id, name=data.get('name'), description=data.get('description'),
+                defer_compression=bool(defer_compression),
+                client_encoded=is_client_encoded(request),
             )
-            # If compressed, replace the file and update extension used
-            if compressed is not None and compressed is not image_file:
-                image_file = compressed
-                file_ext = os.path.splitext(getattr(image_file, 'name', image_file.name))[1].lower()
-                compressed_flag = True
+        except Exception as e:
+            # Release the stored object; the client starts over
+            queue_file_for_deletion(key, client_id)
+            direct_upload.delete()
+            return JsonResponse({
+                'success': False,
+                'error': f'Upload complete failed: {str(e)}'
+            }, status=500)
 
-        # Generate unique filename for storage
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        original_filename = getattr(image_file, 'original_name', None) or image_file.name  # Always capture before overwrite
-        image_file.name = unique_filename  # Force unique name for ImageField
+        with transaction.atomic():
+            if image_obj.image.name != key:
+                # Compressed copy or deduplicated - the uploaded object isn't referenced
+                queue_file_for_deletion(key, client_id)
 
-        # Save metadata to database, store image file using ImageField
-        image_obj = Image.objects.create(
-            filename=unique_filename,
-            image=image_file,
-            original_filename=original_filename,
+            direct_upload.status = DirectUpload.STATUS_COMPLETE
+            direct_upload.image = image_obj
+            direct_upload.save(update_fields=['status', 'image'])
+
+        return upload_response(image_obj, details)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Upload complete failed: {str(e)}'
+        }, status=500)
+
+
+def upload_session_state(session):
+    """JSON body describing where a resumable upload session stands."""
+    return {
+        'success': True,
+        'session_id': str(session.id),
+        'status': session.status,
+        'offset': session.offset,
+        'size': session.size,
+        'upload_url': reverse('upload_session', args=[session.id]),
+    }
+
+
+def refuse_chunk(session, session_id, start):
+    """Response refusing a chunk at `start` for `session` (None if missing), or None to accept it."""
+    if session is None:
+        return JsonResponse({
+            'success': False,
+            'error': f'Upload session {session_id} not found.'
+        }, status=404)
+
+    if session.status != UploadSession.STATUS_OPEN:
+        return JsonResponse({
+            'success': False,
+            'error': 'Upload session is already complete or being completed.'
+        }, status=409)
+
+    if start < 0 or start > session.offset:
+        response = JsonResponse({
+            **upload_session_state(session),
+            'success': False,
+            'error': f'Chunk starts at {start} but the session has {session.offset} bytes. Resume from offset.'
+        }, status=409)
+        response['Upload-Offset'] = str(session.offset)
+        return response
+    return None
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def create_upload_session(request):
+    """
+    Start a resumable chunked upload.
+    
+    Expected: POST request with JSON body containing 'client_id', 'filename' and 'size' (bytes)
+    Optional: 'content_type', 'name' and 'description'
+    Returns: JSON with 'session_id', the 'upload_url' to PUT chunks to, the current
+    'offset' (0) and a suggested 'chunk_size'
+    
+    Protocol: PUT each chunk to upload_url with an 'Upload-Offset' header giving
+    its position in the file. After a failure GET upload_url for the current
+    offset and continue from there. POST upload_url + 'complete/' once
+    offset == size.
+    """
+    try:
+        import json
+        import mimetypes
+        from django.conf import settings as django_settings
+
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid JSON in request body.'
+            }, status=400)
+
+        client_id = str(data.get('client_id') or '').strip()
+        original_filename = os.path.basename(str(data.get('filename') or '').strip())
+
+        if not client_id:
+            return JsonResponse({
+                'success': False,
+                'error': 'client_id is required'
+            }, status=400)
+
+        if not original_filename:
+            return JsonResponse({
+                'success': False,
+                'error': 'filename is required'
+            }, status=400)
+
+        try:
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            size = 0
+        if size <= 0:
+            return JsonResponse({
+                'success': False,
+                'error': 'size must be a positive integer number of bytes.'
+            }, status=400)
+
+        is_valid, error_message = validate_client_id(client_id)
+        if not is_valid:
+            return JsonResponse({
+                'success': False,
+                'error': error_message
+            }, status=403)
+
+        file_ext = os.path.splitext(original_filename)[1].lower()
+        if file_ext not in ALLOWED_IMAGE_EXTENSIONS:
+            return JsonResponse({
+                'success': False,
+                'error': f'Invalid file type. Allowed: {", ".join(ALLOWED_IMAGE_EXTENSIONS)}'
+            }, status=400)
+
+        max_bytes = int(float(getattr(django_settings, 'IMAGE_UPLOAD_SESSION_MAX_MB', 50)) * 1024 * 1024)
+        if size > max_bytes:
+            return JsonResponse({
+                'success': False,
+                'error': f'File too large. Maximum size is {max_bytes} bytes.'
+            }, status=413)
+
+        session = UploadSession.objects.create(
             client_id=client_id,
-            name=name,
-            description=description,
-            size=image_file.size
+            original_filename=original_filename,
+            content_type=data.get('content_type') or mimetypes.guess_type(original_filename)[0] or 'application/octet-stream',
+            name=data.get('name'),
+            description=data.get('description'),
+            size=size,
+            storage_key=f"images/{uuid.uuid4()}{file_ext}"
         )
 
+        chunk_size = int(float(getattr(django_settings, 'IMAGE_UPLOAD_CHUNK_SIZE_MB', 1)) * 1024 * 1024)
         return JsonResponse({
-            'success': True,
-            'id': image_obj.id,
-            'url': image_obj.image.url if image_obj.image else None,
-            'filename': unique_filename,
-            'original_filename': original_filename,
-            'client_id': client_id,
-            'name': name,
-            'description': description,
-            'size': image_file.size,
-            'compressed': compressed_flag,
-            'uploaded_at': image_obj.uploaded_at.isoformat()
+            **upload_session_state(session),
+            'chunk_size': chunk_size
         }, status=201)
-        
+
     except Exception as e:
         return JsonResponse({
             'success': False,
-            'error': f'Upload failed: {str(e)}'
+            'error': f'Failed to create upload session: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD", "PUT", "DELETE"])
+def upload_session(request, session_id):
+    """
+    Query, append to or abort a resumable upload session.
+    
+    GET/HEAD: current state; the offset is also sent as an 'Upload-Offset' header
+    PUT: raw chunk bytes as the body, with an 'Upload-Offset' header giving the
+         file position of the first byte. A chunk may overlap bytes already
+         received (they are skipped) but must not start past the current offset
+         (409 with the current offset).
+    DELETE: abort the session and discard received bytes
+    """
+    try:
+        from django.conf import settings as django_settings
+        from .utils.upload_sessions import abort_session, append_chunk, receive_chunk, reconcile_spool
+
+        if request.method == 'DELETE':
+            with transaction.atomic():
+                session = UploadSession.objects.select_for_update().filter(id=session_id).first()
+                if session is None:
+                    return JsonResponse({
+                        'success': False,
+                        'error': f'Upload session {session_id} not found.'
+                    }, status=404)
+                if complete_in_progress(session):
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'Upload session is being completed.'
+                    }, status=409)
+                if session.status != UploadSession.STATUS_COMPLETE:
+                    abort_session(session)
+                session.delete()
+            return JsonResponse({
+                'success': True,
+                'message': f'Upload session {session_id} aborted.'
+            }, status=200)
+
+        if request.method in ('GET', 'HEAD'):
+            session = UploadSession.objects.filter(id=session_id).first()
+            if session is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Upload session {session_id} not found.'
+                }, status=404)
+            response = JsonResponse(upload_session_state(session), status=200)
+            response['Upload-Offset'] = str(session.offset)
+            return response
+
+        try:
+            start = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'error': 'Upload-Offset and Content-Length headers are required.'
+            }, status=400)
+
+        max_chunk = int(float(getattr(django_settings, 'IMAGE_UPLOAD_CHUNK_MAX_MB', 16)) * 1024 * 1024)
+        if length > max_chunk:
+            return JsonResponse({
+                'success': False,
+                'error': f'Chunk too large. Maximum chunk size is {max_chunk} bytes.'
+            }, status=413)
+
+        # Refuse what we can before reading the body; checked again under the lock
+        refusal = refuse_chunk(UploadSession.objects.filter(id=session_id).first(), session_id, start)
+        if refusal is not None:
+            return refusal
+
+        # Receive the chunk before taking the row lock, so a slow client holds no transaction
+        chunk, received = receive_chunk(request, length)
+        try:
+            with transaction.atomic():
+                # The row lock serializes concurrent PUTs to the same session
+                session = UploadSession.objects.select_for_update().filter(id=session_id).first()
+                if session is not None and reconcile_spool(session):
+                    session.save(update_fields=['offset', 'updated_at'])
+                refusal = refuse_chunk(session, session_id, start)
+                if refusal is not None:
+                    return refusal
+
+                append_chunk(session, chunk, received, start)
+                session.save()
+        finally:
+            chunk.close()
+
+        response = JsonResponse(upload_session_state(session), status=200)
+        response['Upload-Offset'] = str(session.offset)
+        return response
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Upload session request failed: {str(e)}'
+        }, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def complete_upload_session(request, session_id):
+    """
+    Finalize a resumable upload once every byte has arrived.
+    
+    Expected: POST request (no body needed) after offset == size
+    Returns: JSON with image URL and metadata (same shape as /api/upload/).
+    Completing an already completed session returns the same image.
+    """
+    try:
+        from django.utils import timezone
+        from .utils.upload_handlers import StoredUploadedFile
+        from .utils.upload_sessions import finalize_session, reconcile_spool
+
+        # Claim the session in a short transaction; it is finalized and ingested outside it
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().filter(id=session_id).first()
+            if session is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': f'Upload session {session_id} not found.'
+                }, status=404)
+
+            if session.status == UploadSession.STATUS_COMPLETE:
+                if session.image is None:
+                    return JsonResponse({
+                        'success': False,
+                        'error': 'Upload session is complete but its image was deleted.'
+                    }, status=410)
+                response = upload_response(
+                    session.image, {'compressed': False, 'compression_info': None, 'deduplicated': False}
+                )
+                response.status_code = 200
+                return response
+
+            if complete_in_progress(session):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'This upload session is already being completed. Retry shortly.'
+                }, status=409)
+
+            if reconcile_spool(session):
+                session.save(update_fields=['offset', 'updated_at'])
+
+            if session.offset < session.size:
+                return JsonResponse({
+                    **upload_session_state(session),
+                    'success': False,
+                    'error': f'Upload incomplete: {session.offset} of {session.size} bytes received.'
+                }, status=409)
+
+            session.status = UploadSession.STATUS_COMPLETING
+            session.claimed_at = timezone.now()
+            session.save(update_fields=['status', 'claimed_at', 'updated_at'])
+
+        try:
+            stored_name, sha256 = finalize_session(session)
+        except Exception:
+            # The spool is kept - release the claim so the client can retry
+            UploadSession.objects.filter(id=session.id).update(status=UploadSession.STATUS_OPEN, claimed_at=None)
+            raise
+
+        try:
+            image_file = StoredUploadedFile(
+                storage_name=stored_name,
+                name=session.original_filename,
+                content_type=session.content_type,
+                size=session.size,
+                sha256=sha256,
+            )
+            image_obj, details = ingest_upload(
+                image_file, session.client_id, name=session.name, description=session.description,
+                defer_compression=wants_deferred_compression(request),
+                client_encoded=is_client_encoded(request),
+            )
+        except Exception:
+            # The spool is gone - release the stored object; the client starts over
+            queue_file_for_deletion(stored_name, session.client_id)
+            session.delete()
+            raise
+
+        with transaction.atomic():
+            if image_obj.image.name != stored_name:
+                # Compressed copy or deduplicated - the assembled file isn't referenced
+                queue_file_for_deletion(stored_name, session.client_id)
+
+            session.status = UploadSession.STATUS_COMPLETE
+            session.image = image_obj
+            session.s3_parts = []
+            session.save(update_fields=['status', 'image', 's3_parts', 'updated_at'])
+
+        return upload_response(image_obj, details)
+
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Upload complete failed: {str(e)}'
         }, status=500)
 
 
@@ -143,91 +1105,22 @@ def list_images(request):
     Query parameters:
     - client_id: Filter by client ID
     - search: Search in name, description, filename
-    - sort_by: Field to sort by (uploaded_at, name, size) - default: -uploaded_at
+    - sort_by: Field to sort by (uploaded_at, name, size) - default: -uploaded_at;
+      'relevance' ranks search matches best first
     - page: Page number (default: 1)
     - page_size: Items per page (default: 20, max: 100)
+    - pagination: 'cursor' for keyset pagination (no page numbers; follow next_cursor)
+    - cursor: next_cursor of the previous page (implies pagination=cursor)
+    - include_count: 'true' to get total_count in cursor mode (always counted otherwise)
     
     Returns: JSON with paginated list of images and metadata
     """
     try:
-        # Get query parameters
-        client_id = request.GET.get('client_id', '').strip()
-        search = request.GET.get('search', '').strip()
-        sort_by = request.GET.get('sort_by', '-uploaded_at')
-        page = int(request.GET.get('page', 1))
-        page_size = min(int(request.GET.get('page_size', 20)), 100)
-        
-        # Start with all images
-        queryset = Image.objects.all()
-        
-        # Apply client_id filter
-        if client_id:
-            queryset = queryset.filter(client_id__iexact=client_id)
-        
-        # Apply search filter
-        if search:
-            from django.db.models import Q
-            queryset = queryset.filter(
-                Q(name__icontains=search) |
-                Q(description__icontains=search) |
-                Q(filename__icontains=search) |
-                Q(original_filename__icontains=search)
-            )
-        
-        # Apply sorting
-        valid_sort_fields = ['uploaded_at', '-uploaded_at', 'name', '-name', 'size', '-size', 'client_id', '-client_id']
-        if sort_by in valid_sort_fields:
-            queryset = queryset.order_by(sort_by)
-        else:
-            queryset = queryset.order_by('-uploaded_at')
-        
-        # Get total count before pagination
-        total_count = queryset.count()
-        
-        # Calculate pagination
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        total_pages = (total_count + page_size - 1) // page_size
-        
-        # N+1 Query Fix: Use only() to select only needed fields
-        # This prevents loading unnecessary data and avoids lazy loading issues
-        images = queryset.only(
-            'id', 'filename', 'image', 'original_filename', 
-            'client_id', 'name', 'description', 'size', 'uploaded_at'
-        )[start_idx:end_idx]
-        
-        image_list = []
-        for img in images:
-            image_list.append({
-                'id': img.id,
-                'filename': img.filename,
-                'url': img.image.url if img.image else None,
-                'original_filename': img.original_filename,
-                'client_id': img.client_id,
-                'name': img.name,
-                'description': img.description,
-                'size': img.size,
-                'uploaded_at': img.uploaded_at.isoformat()
-            })
-        
-        return JsonResponse({
-            'success': True,
-            'images': image_list,
-            'pagination': {
-                'page': page,
-                'page_size': page_size,
-                'total_count': total_count,
-                'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_previous': page > 1
-            },
-            'filters': {
-                'client_id': client_id,
-                'search': search,
-                'sort_by': sort_by
-            }
-        }, status=200)
-        
+        queryset, params = list_query(request)
+        total_count = queryset.count() if params['include_count'] else None
+        images = [image_summary(img) for img in list_page(queryset, params)]
+        return list_response(images, total_count, params)
+
     except ValueError as e:
         return JsonResponse({
             'success': False,
@@ -240,6 +1133,135 @@ def list_images(request):
         }, status=500)
 
 
+def list_query(request):
+    """
+    Filtered and sorted queryset for list_images plus its parsed parameters.
+    
+    Builds the query only (no database access). Raises ValueError for a bad
+    'page', 'page_size' or 'cursor'.
+    """
+    # Get query parameters
+    client_id = request.GET.get('client_id', '').strip()
+    search = request.GET.get('search', '').strip()
+    sort_by = request.GET.get('sort_by', '-uploaded_at')
+    page = int(request.GET.get('page', 1))
+    page_size = min(int(request.GET.get('page_size', 20)), 100)
+    cursor = request.GET.get('cursor', '').strip()
+    cursor_mode = bool(cursor) or request.GET.get('pagination', '') == 'cursor'
+    # Counting scans every matching row, so cursor pages skip it unless asked
+    include_count = not cursor_mode or request.GET.get('include_count', '').lower() == 'true'
+    
+    # Start with all images
+    queryset = Image.objects.all()
+    
+    # Apply client_id filter
+    if client_id:
+        queryset = queryset.filter(client_id=normalize_client_id(client_id))
+    
+    # Apply search filter (trigram-indexed on PostgreSQL)
+    if search:
+        queryset = image_search.filter_search(queryset, search)
+    
+    # Apply sorting (tie-broken on id, matching the (field, id) indexes)
+    if search and sort_by == 'relevance':
+        if cursor_mode:
+            raise ValueError('sort_by=relevance supports page numbers only, not cursors')
+        order = sort_by
+        queryset = image_search.order_by_relevance(queryset, search)
+    else:
+        order = list_cursor.sort_key(sort_by)
+        queryset = queryset.order_by(*list_cursor.ordering(order))
+    
+    params = {
+        'client_id': client_id, 'search': search, 'sort_by': sort_by, 'page': page, 'page_size': page_size,
+        'order': order, 'cursor_mode': cursor_mode, 'include_count': include_count,
+        'position': list_cursor.decode_cursor(cursor, order) if cursor else None,
+    }
+    return queryset, params
+
+
+def list_page(queryset, params):
+    """The requested page of `queryset`, loading only the fields image_summary() needs."""
+    # N+1 Query Fix: Use only() to select only needed fields
+    # This prevents loading unnecessary data and avoids lazy loading issues
+    queryset = queryset.only(
+        'id', 'filename', 'image', 'original_filename', 
+        'client_id', 'name', 'description', 'size', 'uploaded_at', 'derivatives',
+        'width', 'height', 'original_width', 'original_height', 'format', 'content_hash', 'placeholder'
+    )
+    if params['cursor_mode']:
+        if params['position'] is not None:
+            queryset = queryset.filter(list_cursor.rows_after(params['order'], *params['position']))
+        # One extra row tells whether there is a next page
+        return queryset[:params['page_size'] + 1]
+
+    start_idx = (params['page'] - 1) * params['page_size']
+    end_idx = start_idx + params['page_size']
+    return queryset[start_idx:end_idx]
+
+
+def image_summary(img):
+    """JSON representation of an Image in list responses."""
+    return {
+        'id': img.id,
+        'filename': img.filename,
+        'url': img.image.url if img.image else None,
+        'derivatives': derivative_urls(img.derivatives),
+        'original_filename': img.original_filename,
+        'client_id': img.client_id,
+        'name': img.name,
+        'description': img.description,
+        'size': img.size,
+        'width': img.width,
+        'height': img.height,
+        'original_width': img.original_width,
+        'original_height': img.original_height,
+        'format': img.format,
+        'content_hash': img.content_hash,
+        'placeholder': img.placeholder,
+        'uploaded_at': img.uploaded_at.isoformat()
+    }
+
+
+def list_response(images, total_count, params):
+    """
+    JSON response of list_images for one page of image_summary() dicts.
+    
+    total_count is None when it wasn't counted (cursor mode).
+    """
+    page, page_size = params['page'], params['page_size']
+    if params['cursor_mode']:
+        has_next = len(images) > page_size
+        images = images[:page_size]
+        pagination = {
+            'page_size': page_size,
+            'next_cursor': list_cursor.encode_cursor(params['order'], images[-1]) if has_next else None,
+            'has_next': has_next,
+        }
+        if total_count is not None:
+            pagination['total_count'] = total_count
+    else:
+        total_pages = (total_count + page_size - 1) // page_size
+        pagination = {
+            'page': page,
+            'page_size': page_size,
+            'total_count': total_count,
+            'total_pages': total_pages,
+            'has_next': page < total_pages,
+            'has_previous': page > 1
+        }
+    return JsonResponse({
+        'success': True,
+        'images': images,
+        'pagination': pagination,
+        'filters': {
+            'client_id': params['client_id'],
+            'search': params['search'],
+            'sort_by': params['sort_by']
+        }
+    }, status=200)
+
+
 @csrf_exempt
 @require_http_methods(["PUT"])
 def update_image(request, image_id):
@@ -310,28 +1332,9 @@ def get_stats(request):
     try:
         from django.db.models import Count, Sum
         
-        # Overall stats
-        total_images = Image.objects.count()
-        total_size = Image.objects.aggregate(Sum('size'))['size__sum'] or 0
-        
-        # Stats by client_id
-        client_stats = Image.objects.values('client_id').annotate(
-            count=Count('id'),
-            total_size=Sum('size')
-        ).order_by('-count')
-        
-        # Count unique client IDs from the aggregated groups (handles empty strings correctly)
-        unique_clients_count = client_stats.count()
-        
-        return JsonResponse({
-            'success': True,
-            'stats': {
-                'total_images': total_images,
-                'total_size': total_size,
-                'unique_clients': unique_clients_count,
-                'by_client': list(client_stats)
-            }
-        }, status=200)
+        # Overall stats in one query
+        totals = Image.objects.aggregate(total_images=Count('id'), total_size=Sum('size'))
+        return stats_response(totals, list(client_stats_query()))
         
     except Exception as e:
         return JsonResponse({
@@ -340,6 +1343,85 @@ def get_stats(request):
         }, status=500)
 
 
+def client_stats_query():
+    """Image count and total size per client_id, largest first."""
+    from django.db.models import Count, Sum
+
+    return Image.objects.values('client_id').annotate(
+        count=Count('id'),
+        total_size=Sum('size')
+    ).order_by('-count')
+
+
+def stats_response(totals, by_client):
+    """JSON response of get_stats from the overall aggregate and the per-client rows."""
+    return JsonResponse({
+        'success': True,
+        'stats': {
+            'total_images': totals['total_images'],
+            'total_size': totals['total_size'] or 0,
+            # One row per client (empty client IDs included)
+            'unique_clients': len(by_client),
+            'by_client': by_client
+        }
+    }, status=200)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_upload_config(request):
+    """
+    Upload limits and compression targets, so clients encode once to what the server keeps.
+    
+    Optional: 'client_id' query parameter or 'X-Client-Id' header for the
+    per-client max dimension and output format.
+    Returns: JSON with upload limits, compression targets, accepted formats
+    and the number of parallel requests clients should use
+    
+    A client that encodes to these targets sends 'X-Client-Encoded: true' with
+    its uploads; compliant files are then stored without another encode pass.
+    """
+    from django.conf import settings as django_settings
+    from .utils.compression_jobs import compression_options
+    from .utils.derivatives import derivative_sizes
+
+    def mb(name, default):
+        return float(getattr(django_settings, name, default))
+
+    client_id = request.GET.get('client_id') or request.headers.get('X-Client-Id', '').strip() or None
+    compression = compression_options(client_id)
+    return JsonResponse({
+        'success': True,
+        'config': {
+            'upload': {
+                'max_request_mb': mb('IMAGE_UPLOAD_MAX_REQUEST_MB', 25),
+                'batch_max_request_mb': mb('IMAGE_BATCH_UPLOAD_MAX_REQUEST_MB', 200),
+                'batch_max_files': int(getattr(django_settings, 'IMAGE_BATCH_UPLOAD_MAX_FILES', 100)),
+                'direct_max_mb': mb('IMAGE_DIRECT_UPLOAD_MAX_MB', 10),
+                'session_max_mb': mb('IMAGE_UPLOAD_SESSION_MAX_MB', 50),
+                'chunk_size_mb': mb('IMAGE_UPLOAD_CHUNK_SIZE_MB', 1),
+                'accepted_extensions': ALLOWED_IMAGE_EXTENSIONS,
+                'preferred_concurrency': int(getattr(django_settings, 'IMAGE_CLIENT_CONCURRENCY', 4)),
+                'idempotency_header': 'Idempotency-Key',
+            },
+            'compression': {
+                # Uploads within these limits (and in output_format, if set) aren't re-encoded
+                'max_size_mb': compression['max_size_mb'],
+                'max_dimension': compression['max_dimension'],
+                'output_format': compression['output_format'],
+                'quality': compression['initial_quality'],
+                'min_quality': compression['min_quality'],
+                'ssim_target': compression['ssim_target'],
+                'client_encoded_header': 'X-Client-Encoded',
+            },
+            'derivatives': {
+                'sizes': derivative_sizes(),
+                'format': getattr(django_settings, 'IMAGE_DERIVATIVE_FORMAT', 'WEBP').upper(),
+            },
+        }
+    }, status=200)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def validate_client(request):
@@ -410,12 +1492,13 @@ def delete_image(request, image_id):
                 'error': f'Image with id {image_id} not found.'
             }, status=404)
         
-        # Queue file for deletion (if exists)
-        if image_obj.image:
-            queue_file_for_deletion(image_obj.image.name, image_obj.client_id)
+        file_entry = (image_obj.image.name, image_obj.client_id, image_obj.derivatives)
         
-        # Delete from database immediately
-        image_obj.delete()
+        with transaction.atomic():
+            # Delete from database immediately
+            image_obj.delete()
+            # Queue file for deletion (if exists and no other image shares it)
+            queue_unreferenced_files_for_deletion([file_entry])
         
         return JsonResponse({
             'success': True,
@@ -467,27 +1550,17 @@ def bulk_delete_images(request):
             }, status=400)
         
         # Fetch images to delete - use only() and values() for efficiency
-        images_to_delete = Image.objects.filter(id__in=image_ids).only('id', 'image', 'client_id')
+        images_to_delete = Image.objects.filter(id__in=image_ids).only('id', 'image', 'client_id', 'derivatives')
         found_ids = set(images_to_delete.values_list('id', flat=True))
         not_found_ids = set(image_ids) - found_ids
         
-        # Bulk create queue entries (FAST - single SQL operation)
-        pending_deletions = []
-        for image_obj in images_to_delete.values('image', 'client_id'):
-            if image_obj['image']:
-                pending_deletions.append(
-                    PendingFileDeletion(
-                        file_path=image_obj['image'],
-                        client_id=image_obj['client_id']
-                    )
-                )
-        
-        # Bulk insert all at once
-        if pending_deletions:
-            PendingFileDeletion.objects.bulk_create(pending_deletions, batch_size=1000)
+        file_entries = list(images_to_delete.values_list('image', 'client_id', 'derivatives'))
         
-        # Bulk delete from database immediately
-        deleted_count, _ = images_to_delete.delete()
+        with transaction.atomic():
+            # Bulk delete from database immediately
+            deleted_count, _ = images_to_delete.delete()
+            # Queue files no longer referenced by any image (FAST - bulk_create)
+            queue_unreferenced_files_for_deletion(file_entries)
         
         response_data = {
             'success': True,
@@ -526,7 +1599,7 @@ def bulk_delete_by_client(request, client_id):
             }, status=400)
         
         # Find all images for this client - use only() for efficiency
-        images_to_delete = Image.objects.filter(client_id__iexact=client_id).only('id', 'image', 'client_id')
+        images_to_delete = Image.objects.filter(client_id=normalize_client_id(client_id)).only('id', 'image', 'client_id', 'derivatives')
         total_count = images_to_delete.count()
         
         if total_count == 0:
@@ -536,25 +1609,13 @@ def bulk_delete_by_client(request, client_id):
                 'message': f'No images found for client_id: {client_id}'
             }, status=200)
         
-        # Bulk create queue entries (FAST - single SQL query with bulk_create)
-        pending_deletions = []
-        for image_obj in images_to_delete.values('image', 'client_id'):
-            if image_obj['image']:
-                pending_deletions.append(
-                    PendingFileDeletion(
-                        file_path=image_obj['image'],
-                        client_id=image_obj['client_id']
-                    )
-                )
-        
-        # Bulk insert all at once (fast operation)
-        queued_count = 0
-        if pending_deletions:
-            PendingFileDeletion.objects.bulk_create(pending_deletions, batch_size=1000)
-            queued_count = len(pending_deletions)
+        file_entries = list(images_to_delete.values_list('image', 'client_id', 'derivatives'))
         
-        # Bulk delete from database immediately (fast operation)
-        deleted_count, _ = images_to_delete.delete()
+        with transaction.atomic():
+            # Bulk delete from database immediately (fast operation)
+            deleted_count, _ = images_to_delete.delete()
+            # Queue files no longer referenced by any image (fast bulk_create)
+            queued_count = queue_unreferenced_files_for_deletion(file_entries)
         
         response_data = {
             'success': True,
@@ -710,10 +1771,17 @@ def cleanup_pending_deletions(request):
         success_count = 0
         failed_count = 0
         skipped_count = 0
+        kept_count = 0
         
         for item in pending:
             total_processed += 1
             
+            # A deduplicated upload may have re-referenced the file since it was queued
+            if is_file_referenced(item.file_path, item.original_path):
+                item.delete()
+                kept_count += 1
+                continue
+            
             try:
                 # Try to delete the file
                 default_storage.delete(item.file_path)
@@ -721,6 +1789,9 @@ def cleanup_pending_deletions(request):
                 item.delete()
                 success_count += 1
                 
+            except StorageUnavailable:
+                # Storage is failing fast - leave the rest queued without burning their attempts
+                break
             except Exception as e:
                 # Failed - increment attempts and log error
                 item.attempts += 1
@@ -743,8 +1814,9 @@ def cleanup_pending_deletions(request):
             'deleted': success_count,
             'failed': failed_count,
             'skipped': skipped_count,
+            'kept': kept_count,
             'remaining_in_queue': remaining,
-            'message': f'Processed {total_processed} files: {success_count} deleted, {failed_count} failed, {skipped_count} skipped'
+            'message': f'Processed {total_processed} files: {success_count} deleted, {failed_count} failed, {skipped_count} skipped, {kept_count} still referenced'
         }, status=200)
         
     except Exception as e:
@@ -754,6 +1826,23 @@ def cleanup_pending_deletions(request):
         }, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_storage_stats(request):
+    """
+    Latency histograms of storage operations and the storage circuit breaker state.
+    
+    Returns: JSON with {operation: {count, errors, avg_ms, buckets}} and the
+    circuit state (closed / open / half-open). Figures are per web process.
+    """
+    from .utils.resilient_storage import storage_metrics
+
+    return JsonResponse({
+        'success': True,
+        'stats': storage_metrics()
+    }, status=200)
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_deletion_queue_stats(request):
@@ -3,6 +3,7 @@ API Key Authentication Middleware for TaskBucket Cloud
 Validates the X-API-Key header on all API requests
 """
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import JsonResponse
 from django.conf import settings
 
@@ -13,14 +14,36 @@ class APIKeyMiddleware:
     
     Checks for 'X-API-Key' header and compares against the configured API key.
     Returns 401 Unauthorized if the key is missing or invalid.
+    
+    Works in sync and async chains, so async views under ASGI aren't pushed
+    through a thread by this middleware.
     """
+    sync_capable = True
+    async_capable = True
     
     def __init__(self, get_response):
         self.get_response = get_response
         # Hardcoded API key for basic authentication
         self.valid_api_key = getattr(settings, 'API_KEY', 'imcbs-secret-key-2025')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
         
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rejection = self.reject(request)
+        if rejection is not None:
+            return rejection
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        rejection = self.reject(request)
+        if rejection is not None:
+            return rejection
+        return await self.get_response(request)
+
+    def reject(self, request):
+        """The 401 response for `request`, or None if it may proceed."""
         # Skip API key validation for admin and certain paths
         exempt_paths = [
             '/admin/',
@@ -30,7 +53,7 @@ class APIKeyMiddleware:
         
         # Check if path is exempt
         if any(request.path.startswith(path) for path in exempt_paths):
-            return self.get_response(request)
+            return None
         
         # Check if this is an API request (starts with /api/)
         if request.path.startswith('/api/'):
@@ -51,5 +74,4 @@ class APIKeyMiddleware:
                 }, status=401)
         
         # If validation passed or not an API request, proceed
-        response = self.get_response(request)
-        return response
+        return None
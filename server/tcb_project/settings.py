@@ -102,6 +102,16 @@ DATABASES = {
     }
 }
 
+# Cache shared by all workers (e.g. the valid client ID list). The default is per process; use
+# e.g. DJANGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache with
+# DJANGO_CACHE_LOCATION=redis://localhost:6379/0 to share it.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -159,11 +169,14 @@ if CLOUDFLARE_R2_ENABLED:
     AWS_S3_REGION_NAME = 'auto'  # Cloudflare R2 uses 'auto' region
     AWS_S3_SIGNATURE_VERSION = 's3v4'  # Required for R2
     AWS_S3_CUSTOM_DOMAIN = os.getenv('CLOUDFLARE_R2_PUBLIC_URL')
+    # 'path' lets local S3-compatible stand-ins (e.g. MinIO on localhost) work for presigned URLs
+    AWS_S3_ADDRESSING_STYLE = os.getenv('CLOUDFLARE_R2_ADDRESSING_STYLE') or None
 
-    # Configure Django to use R2 for media files (using built-in S3 storage)
+    # Configure Django to use R2 for media files (S3 storage with retries, hedged PUTs
+    # and a circuit breaker - see IMAGE_STORAGE_* below)
     STORAGES = {
         "default": {
-            "BACKEND": "storages.backends.s3boto3.S3Boto3Storage",
+            "BACKEND": "assets.utils.resilient_storage.ResilientS3Storage",
         },
         "staticfiles": {
             "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
@@ -177,7 +190,7 @@ else:
     # Fallback to local file storage
     STORAGES = {
         "default": {
-            "BACKEND": "django.core.files.storage.FileSystemStorage",
+            "BACKEND": "assets.utils.resilient_storage.ResilientFileSystemStorage",
         },
         "staticfiles": {
             "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
@@ -186,10 +199,137 @@ else:
     MEDIA_URL = '/media/'
     MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Storage resilience: transient errors are retried IMAGE_STORAGE_RETRIES times with
+# full-jitter backoff (IMAGE_STORAGE_BACKOFF_MS doubling up to IMAGE_STORAGE_BACKOFF_MAX_MS).
+# An R2 save still running after IMAGE_STORAGE_HEDGE_AFTER_MS (0 = off) gets a second PUT
+# (files up to IMAGE_STORAGE_HEDGE_MAX_MB). IMAGE_STORAGE_BREAKER_THRESHOLD consecutive
+# failures (0 = off) make storage calls fail fast for IMAGE_STORAGE_BREAKER_RESET_SECONDS.
+IMAGE_STORAGE_RETRIES = int(os.getenv('IMAGE_STORAGE_RETRIES', '2'))
+IMAGE_STORAGE_BACKOFF_MS = float(os.getenv('IMAGE_STORAGE_BACKOFF_MS', '100'))
+IMAGE_STORAGE_BACKOFF_MAX_MS = float(os.getenv('IMAGE_STORAGE_BACKOFF_MAX_MS', '2000'))
+IMAGE_STORAGE_HEDGE_AFTER_MS = float(os.getenv('IMAGE_STORAGE_HEDGE_AFTER_MS', '0'))
+IMAGE_STORAGE_HEDGE_MAX_MB = float(os.getenv('IMAGE_STORAGE_HEDGE_MAX_MB', '8'))
+IMAGE_STORAGE_BREAKER_THRESHOLD = int(os.getenv('IMAGE_STORAGE_BREAKER_THRESHOLD', '5'))
+IMAGE_STORAGE_BREAKER_RESET_SECONDS = float(os.getenv('IMAGE_STORAGE_BREAKER_RESET_SECONDS', '30'))
+
 # Image compression defaults (used by server-side compression when an upload exceeds IMAGE_MAX_UPLOAD_MB)
 IMAGE_MAX_UPLOAD_MB = float(os.getenv('IMAGE_MAX_UPLOAD_MB', '1'))  # default 1 MB
 IMAGE_COMPRESSION_QUALITY = int(os.getenv('IMAGE_COMPRESSION_QUALITY', '80'))
 IMAGE_COMPRESSION_MIN_QUALITY = int(os.getenv('IMAGE_COMPRESSION_MIN_QUALITY', '45'))
+# Compressed output is handed to storage straight from the encoder's buffer, which
+# stays in memory up to this size and spills to a temp file beyond it
+IMAGE_COMPRESSION_SPOOL_MB = float(os.getenv('IMAGE_COMPRESSION_SPOOL_MB', '4'))
+# Perceptual mode: re-encode JPEG/WebP uploads of any size at the lowest quality (down to
+# IMAGE_COMPRESSION_MIN_QUALITY) whose SSIM, measured on a downscaled copy, stays at or
+# above this target (e.g. 0.97). IMAGE_MAX_UPLOAD_MB still caps the size. 0 disables it.
+IMAGE_COMPRESSION_SSIM_TARGET = float(os.getenv('IMAGE_COMPRESSION_SSIM_TARGET', '0'))
+# Downscale uploads whose longest edge exceeds this many px (LANCZOS) before encoding;
+# 0 keeps the original dimensions. IMAGE_CLIENT_MAX_DIMENSIONS overrides it per client,
+# e.g. "CLIENT_A:2048,CLIENT_B:0".
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', '0'))
+
+
+def _client_overrides(name, cast=str):
+    """Parse a "CLIENT_A:value,CLIENT_B:value" env var into {client_id: value}."""
+    return {
+        client.strip(): cast(value.strip())
+        for client, _, value in (entry.partition(':') for entry in os.getenv(name, '').split(',') if ':' in entry)
+    }
+
+
+IMAGE_CLIENT_MAX_DIMENSIONS = _client_overrides('IMAGE_CLIENT_MAX_DIMENSIONS', int)
+# Output format profile: transcode compressed uploads to WEBP or AVIF (AVIF falls back to
+# WEBP when Pillow lacks it); empty keeps each upload's own format.
+# IMAGE_CLIENT_OUTPUT_FORMATS overrides it per client, e.g. "CLIENT_A:AVIF,CLIENT_B:".
+IMAGE_OUTPUT_FORMAT = os.getenv('IMAGE_OUTPUT_FORMAT', '')
+IMAGE_CLIENT_OUTPUT_FORMATS = _client_overrides('IMAGE_CLIENT_OUTPUT_FORMATS')
+
+# Derivatives (thumbnails) generated at upload time and returned by /api/list/.
+# Comma-separated longest-edge sizes in px; empty disables derivatives.
+IMAGE_DERIVATIVE_SIZES = os.getenv('IMAGE_DERIVATIVE_SIZES', '200,800')
+IMAGE_DERIVATIVE_FORMAT = os.getenv('IMAGE_DERIVATIVE_FORMAT', 'WEBP')
+IMAGE_DERIVATIVE_QUALITY = int(os.getenv('IMAGE_DERIVATIVE_QUALITY', '75'))
+
+# Deferred compression: store the original immediately (202 Accepted) and compress in the background.
+# Can also be requested per upload with the 'defer_compression' form field.
+# Worker: 'command' = run `python manage.py process_compression_queue` (cron or --loop),
+#         'thread'  = a background thread inside each web process
+IMAGE_DEFERRED_COMPRESSION = os.getenv('IMAGE_DEFERRED_COMPRESSION', 'false').lower() == 'true'
+IMAGE_DEFERRED_COMPRESSION_WORKER = os.getenv('IMAGE_DEFERRED_COMPRESSION_WORKER', 'command')
+IMAGE_DEFERRED_COMPRESSION_BATCH_SIZE = int(os.getenv('IMAGE_DEFERRED_COMPRESSION_BATCH_SIZE', '10'))
+# An image claimed by a worker that hasn't finished it after this long (crashed worker) is picked up again
+IMAGE_COMPRESSION_CLAIM_TIMEOUT_SECONDS = int(os.getenv('IMAGE_COMPRESSION_CLAIM_TIMEOUT_SECONDS', '900'))
+
+# Admission control for compression and derivative rendering (per web process).
+# Jobs run in a process pool of IMAGE_COMPRESSION_CONCURRENCY workers and the decoded
+# pixels in flight stay under IMAGE_COMPRESSION_PIXEL_BUDGET_MP megapixels. A job that
+# can't start within IMAGE_COMPRESSION_WAIT_SECONDS is skipped ('skip': the original is
+# stored as-is) or handed to the deferred compression queue ('defer').
+IMAGE_COMPRESSION_CONCURRENCY = int(os.getenv('IMAGE_COMPRESSION_CONCURRENCY', '2'))
+IMAGE_COMPRESSION_PIXEL_BUDGET_MP = float(os.getenv('IMAGE_COMPRESSION_PIXEL_BUDGET_MP', '100'))
+IMAGE_COMPRESSION_WAIT_SECONDS = float(os.getenv('IMAGE_COMPRESSION_WAIT_SECONDS', '10'))
+IMAGE_COMPRESSION_OVERLOAD_ACTION = os.getenv('IMAGE_COMPRESSION_OVERLOAD_ACTION', 'skip')
+IMAGE_COMPRESSION_USE_PROCESSES = os.getenv('IMAGE_COMPRESSION_USE_PROCESSES', 'true').lower() == 'true'
+
+# Images holding more than this many megapixels once decoded are never decoded at full
+# size: they are stored uncompressed, and JPEG derivatives come from a reduced-scale
+# decode. 0 disables the ceiling.
+IMAGE_MAX_DECODE_MP = float(os.getenv('IMAGE_MAX_DECODE_MP', '64'))
+
+# Stream uploaded images straight into storage while the multipart body is parsed
+# (S3 multipart upload on R2, direct file write on local storage) instead of
+# buffering each file in worker memory first
+IMAGE_STREAM_UPLOADS_TO_STORAGE = os.getenv('IMAGE_STREAM_UPLOADS_TO_STORAGE', 'true').lower() == 'true'
+IMAGE_STREAM_PART_SIZE_MB = int(os.getenv('IMAGE_STREAM_PART_SIZE_MB', '8'))  # S3 minimum is 5
+
+# Largest request body accepted by /api/upload/ and /api/upload/batch/; larger declared
+# Content-Lengths are refused with 413 before the body is read
+IMAGE_UPLOAD_MAX_REQUEST_MB = float(os.getenv('IMAGE_UPLOAD_MAX_REQUEST_MB', '25'))
+IMAGE_BATCH_UPLOAD_MAX_REQUEST_MB = float(os.getenv('IMAGE_BATCH_UPLOAD_MAX_REQUEST_MB', '200'))
+
+# Presigned direct-to-R2 uploads (/api/upload/init/ + /api/upload/complete/)
+IMAGE_DIRECT_UPLOAD_MAX_MB = float(os.getenv('IMAGE_DIRECT_UPLOAD_MAX_MB', '10'))
+IMAGE_DIRECT_UPLOAD_EXPIRY_SECONDS = int(os.getenv('IMAGE_DIRECT_UPLOAD_EXPIRY_SECONDS', '900'))
+# A complete still running after this long (crashed worker) can be retried by the client
+IMAGE_UPLOAD_COMPLETE_TIMEOUT_SECONDS = int(os.getenv('IMAGE_UPLOAD_COMPLETE_TIMEOUT_SECONDS', '300'))
+
+# Resumable chunked uploads (/api/upload/sessions/): chunks are spooled to
+# IMAGE_UPLOAD_SESSION_DIR (default: <tmp>/tcb_upload_sessions) and, on R2, forwarded as
+# multipart parts. Abandoned sessions are removed by `python manage.py cleanup_upload_sessions`.
+IMAGE_UPLOAD_SESSION_MAX_MB = float(os.getenv('IMAGE_UPLOAD_SESSION_MAX_MB', '50'))
+IMAGE_UPLOAD_CHUNK_SIZE_MB = float(os.getenv('IMAGE_UPLOAD_CHUNK_SIZE_MB', '1'))  # suggested to clients
+IMAGE_UPLOAD_CHUNK_MAX_MB = float(os.getenv('IMAGE_UPLOAD_CHUNK_MAX_MB', '16'))
+IMAGE_UPLOAD_SESSION_DIR = os.getenv('IMAGE_UPLOAD_SESSION_DIR') or None
+IMAGE_UPLOAD_SESSION_TTL_HOURS = int(os.getenv('IMAGE_UPLOAD_SESSION_TTL_HOURS', '24'))
+
+# Idempotency-Key on /api/upload/ and /api/upload/batch/: responses are replayed to retries for
+# IMAGE_IDEMPOTENCY_TTL_HOURS (expired ones removed by `python manage.py cleanup_idempotency_keys`);
+# a claim whose request hasn't finished after IMAGE_IDEMPOTENCY_LOCK_SECONDS can be taken over
+IMAGE_IDEMPOTENCY_TTL_HOURS = float(os.getenv('IMAGE_IDEMPOTENCY_TTL_HOURS', '24'))
+IMAGE_IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IMAGE_IDEMPOTENCY_LOCK_SECONDS', '300'))
+
+# Serve upload, list and stats with the async views (assets/async_views.py); enable when
+# running under an ASGI server, e.g. `uvicorn tcb_project.asgi:application`. Only list and
+# stats gain from it: uploads are read in full before the view runs and parsed on a thread.
+IMAGE_ASYNC_VIEWS = os.getenv('IMAGE_ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Client ID list API read by `python manage.py sync_clients` into the ClientRegistry table
+IMAGE_CLIENT_ID_API_URL = os.getenv('IMAGE_CLIENT_ID_API_URL', 'https://activate.imcbs.com/client-id-list/get-client-ids/')
+
+# Until the first sync, valid client IDs are fetched from that API and cached for IMAGE_CLIENT_IDS_TTL_SECONDS;
+# after that the stale list is served for up to IMAGE_CLIENT_IDS_MAX_STALE_SECONDS while it is
+# refreshed in the background. A failed fetch is retried after IMAGE_CLIENT_IDS_RETRY_SECONDS.
+IMAGE_CLIENT_IDS_TTL_SECONDS = int(os.getenv('IMAGE_CLIENT_IDS_TTL_SECONDS', '300'))
+IMAGE_CLIENT_IDS_MAX_STALE_SECONDS = int(os.getenv('IMAGE_CLIENT_IDS_MAX_STALE_SECONDS', '86400'))
+IMAGE_CLIENT_IDS_RETRY_SECONDS = int(os.getenv('IMAGE_CLIENT_IDS_RETRY_SECONDS', '30'))
+
+# Parallel upload requests clients are asked to use (published by /api/config/)
+IMAGE_CLIENT_CONCURRENCY = int(os.getenv('IMAGE_CLIENT_CONCURRENCY', '4'))
+
+# Batch uploads (/api/upload/batch/): files per request and parallel storage writers
+IMAGE_BATCH_UPLOAD_MAX_FILES = int(os.getenv('IMAGE_BATCH_UPLOAD_MAX_FILES', '100'))
+IMAGE_BATCH_UPLOAD_WORKERS = int(os.getenv('IMAGE_BATCH_UPLOAD_WORKERS', '8'))
+DATA_UPLOAD_MAX_NUMBER_FILES = IMAGE_BATCH_UPLOAD_MAX_FILES
 
 # Request timeout settings for long-running operations
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB